@@ -0,0 +1,208 @@
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from etl import universe
+
+RESULTS_FILE = "data/backtest_results.csv"
+# (parameter set, day) cells evaluated at once; each intermediate array holds this many float64s
+CHUNK_CELLS = int(os.getenv("BACKTEST_CHUNK_CELLS", 2_000_000))
+
+_DECISION = re.compile(r"\b(buy|hold|sell)\b", re.IGNORECASE)
+_NUMBER = re.compile(r"\d*\.?\d+")
+_DIRECTION = {"buy": 1.0, "hold": 0.0, "sell": -1.0}
+
+
+def parse_decision(value) -> float:
+    """
+    Map a stored recommendation ('Buy', '** Buy', 'Sell**', ...) to +1 / 0 / -1, NaN if unreadable
+    or ambiguous (an echo of the template's 'Buy / Hold / Sell').
+    """
+    decisions = {word.lower() for word in _DECISION.findall(str(value))}
+    return _DIRECTION[decisions.pop()] if len(decisions) == 1 else np.nan
+
+
+def parse_confidence(value) -> float:
+    """
+    Extract the confidence from values like '0.72', '** 0.67' or '0.8**', NaN if unreadable.
+    """
+    match = _NUMBER.search(str(value))
+    if not match:
+        return np.nan
+    confidence = float(match.group(0))
+    return confidence if 0.0 <= confidence <= 1.0 else np.nan
+
+
+def load_panel(coins=None, recommendations="data/llama_recommendations_{coin}.csv"):
+    """
+    Load prices and recommendations for all coins (default: the symbol universe) into arrays
+    aligned on one daily date index.
+
+    Returns:
+        tuple: (dates, coins, close, direction, confidence); the last three are (days, coins)
+               float arrays with NaN where a coin has no price or no recommendation
+    """
+    coins = coins if coins is not None else list(universe.coins().values())
+    closes, directions, confidences = {}, {}, {}
+    for coin in coins:
+        technical_path = f"data/{coin}_technical.csv"
+        if not os.path.exists(technical_path):
+            continue
+        tech = pd.read_csv(technical_path, usecols=["date", "close"])
+        tech["date"] = pd.to_datetime(tech["date"])
+        closes[coin] = tech.drop_duplicates("date").set_index("date")["close"]
+
+        rec_path = recommendations.format(coin=coin)
+        if os.path.exists(rec_path):
+            rec = pd.read_csv(rec_path, usecols=["date", "recommendation", "confidence"])
+            rec["date"] = pd.to_datetime(rec["date"])
+            rec = rec.drop_duplicates("date", keep="last").set_index("date")
+            directions[coin] = rec["recommendation"].map(parse_decision)
+            confidences[coin] = rec["confidence"].map(parse_confidence)
+
+    coins = list(closes)
+    close = pd.DataFrame(closes).sort_index()
+    dates = pd.date_range(close.index.min(), close.index.max(), freq="D")
+    close = close.reindex(dates)
+    direction = pd.DataFrame(directions).reindex(index=dates, columns=coins)
+    confidence = pd.DataFrame(confidences).reindex(index=dates, columns=coins)
+    return dates.values, coins, close.to_numpy(), direction.to_numpy(), confidence.to_numpy()
+
+
+def parameter_grid(horizons=(1, 3, 5, 10, 20), min_confidences=(0.0, 0.6, 0.7, 0.8),
+                   fees=(0.0, 0.001), long_only=(True, False), weighted=(True, False)) -> dict:
+    """
+    Cartesian product of strategy parameters as flat arrays of equal length.
+    """
+    mesh = np.meshgrid(horizons, min_confidences, fees, long_only, weighted, indexing="ij")
+    names = ["horizon", "min_confidence", "fee", "long_only", "weighted"]
+    return {name: values.ravel() for name, values in zip(names, mesh)}
+
+
+def evaluate(close: np.ndarray, direction: np.ndarray, confidence: np.ndarray, grid: dict,
+             chunk_cells: int = CHUNK_CELLS) -> dict:
+    """
+    Backtest every parameter set of `grid` on one coin at once.
+
+    A signal on day s opens a position at that day's close, sized direction * confidence (or
+    just direction when not `weighted`), and holds it for `horizon` days unless a newer
+    qualifying signal replaces it. Signals below `min_confidence` are ignored, shorts are
+    dropped when `long_only`, and every change of position pays `fee` per unit traded.
+
+    Parameter sets are evaluated in chunks of at most `chunk_cells` / days, so long histories
+    with a large grid do not need every (parameter set, day) array in memory at once.
+
+    Parameters:
+        close, direction, confidence (np.ndarray): Daily series for one coin
+        grid (dict): Parameter arrays from parameter_grid()
+        chunk_cells (int): (parameter set, day) cells per chunk
+
+    Returns:
+        dict: Metric arrays, one value per parameter set
+    """
+    # Nothing is held before the first recommendation, so only that period is simulated
+    signal_days = np.flatnonzero(~np.isnan(direction))
+    first = signal_days[0] if len(signal_days) else len(close)
+    close, direction, confidence = close[first:], direction[first:], confidence[first:]
+
+    n_params = len(grid["horizon"])
+    step = max(1, chunk_cells // max(1, len(close)))
+    chunks = [_evaluate_chunk(close, direction, confidence, {name: values[lo:lo + step] for name, values in grid.items()})
+              for lo in range(0, n_params, step)]
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def _evaluate_chunk(close: np.ndarray, direction: np.ndarray, confidence: np.ndarray, grid: dict) -> dict:
+    horizon = grid["horizon"][:, None]
+    min_confidence = grid["min_confidence"][:, None]
+    fee = grid["fee"][:, None]
+    long_only = grid["long_only"][:, None].astype(bool)
+    weighted = grid["weighted"][:, None].astype(bool)
+
+    if len(close) == 0:
+        zeros = np.zeros(len(horizon))
+        return {"total_return": zeros, "sharpe": zeros, "max_drawdown": zeros,
+                "trades": zeros.astype(int), "exposure": zeros}
+
+    n_days = len(close)
+    day = np.arange(n_days)
+    returns = np.zeros(n_days)
+    returns[1:] = np.nan_to_num(close[1:] / close[:-1] - 1.0)
+
+    # (params, days) weight of the signal issued on each day, NaN where no qualifying signal
+    conf = np.nan_to_num(confidence)
+    size = np.where(weighted, direction * conf, direction)
+    size = np.where(long_only & (direction < 0), 0.0, size)
+    qualifies = ~np.isnan(direction) & (conf >= min_confidence)
+
+    # Most recent qualifying signal at or before each day, and how old it is
+    last = np.maximum.accumulate(np.where(qualifies, day, -1), axis=1)
+    held = (last >= 0) & (day - last < horizon)
+    weight = np.where(held, np.take_along_axis(np.nan_to_num(size), np.maximum(last, 0), axis=1), 0.0)
+
+    # Position over (t-1, t] is the weight decided at the close of t-1
+    position = np.zeros_like(weight)
+    position[:, 1:] = weight[:, :-1]
+    turnover = np.abs(np.diff(position, axis=1, prepend=0.0))
+    pnl = position * returns - fee * turnover
+
+    equity = np.cumprod(1.0 + pnl, axis=1)
+    drawdown = 1.0 - equity / np.maximum.accumulate(equity, axis=1)
+    std = pnl.std(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(std > 0, pnl.mean(axis=1) / std * np.sqrt(365), 0.0)
+
+    return {
+        "total_return": equity[:, -1] - 1.0,
+        "sharpe": sharpe,
+        "max_drawdown": drawdown.max(axis=1),
+        "trades": (turnover > 0).sum(axis=1),
+        "exposure": (position != 0).mean(axis=1),
+    }
+
+
+def _evaluate_coin(args):
+    coin, close, direction, confidence, grid = args
+    return coin, evaluate(close, direction, confidence, grid)
+
+
+def run_sweep(grid: dict = None, coins=None, recommendations="data/llama_recommendations_{coin}.csv",
+              max_workers: int = None) -> pd.DataFrame:
+    """
+    Evaluate every parameter set on every coin, one process per coin.
+
+    Returns:
+        pd.DataFrame: One row per (coin, parameter set) with the parameters and metrics
+    """
+    grid = grid if grid is not None else parameter_grid()
+    _, coins, close, direction, confidence = load_panel(coins, recommendations)
+    jobs = [(coin, close[:, i], direction[:, i], confidence[:, i], grid) for i, coin in enumerate(coins)]
+
+    frames = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for coin, metrics in executor.map(_evaluate_coin, jobs):
+            frame = pd.DataFrame({**grid, **metrics})
+            frame.insert(0, "coin", coin)
+            frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def main(argv=None):
+    argparse.ArgumentParser(description="Sweep strategy parameters over the LLaMA recommendations.").parse_args(argv)
+    started = time.perf_counter()
+    results = run_sweep()
+    elapsed = time.perf_counter() - started
+    print(f"Evaluated {len(results)} strategy variants in {elapsed:.2f}s")
+
+    best = results.sort_values("sharpe", ascending=False).groupby("coin").head(1)
+    print(best.to_string(index=False))
+    results.to_csv(RESULTS_FILE, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis.backtest import parse_confidence, parse_decision
+from etl import universe
+from etl.storage import read_rows
+from etl.tracing import span
+
+EXPORT_DIR = os.getenv("DIPSIGNAL_EXPORT_DIR", "data/powerbi")
+STATE_FILE = "_state.json"
+NEWS_FILE = "data/news_scored.csv"
+TECHNICAL_COLUMNS = ["open", "high", "low", "close", "volume", "sma_20", "sma_50", "sma_200", "rsi", "macd", "pct_change"]
+MACRO_COLUMNS = ["dxy", "sp500", "cpi", "interest_rate", "market_closed"]
+# Sentiment labels of llama_news, scored -2 (extremely negative) to 2 (extremely positive)
+SENTIMENT_SCORES = {
+    "extremely negative": -2, "slightly negative": -1, "neutral": 0, "slightly positive": 1, "extremely positive": 2,
+}
+_DIRECTION_LABELS = {1.0: "Buy", 0.0: "Hold", -1.0: "Sell"}
+
+
+def date_key(dates: pd.Series) -> pd.Series:
+    """
+    yyyymmdd integer key of the date dimension.
+    """
+    return dates.dt.strftime("%Y%m%d").astype(np.int32)
+
+
+def _read(path: str) -> pd.DataFrame:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return pd.DataFrame(columns=["date"])
+    df = read_rows(path)
+    df["date"] = pd.to_datetime(df["date"]).dt.normalize()
+    return df
+
+
+class DashboardExport:
+    """
+    Star schema for the Power BI dashboard under data/powerbi/:
+
+    - dim_date.parquet, dim_coin.parquet
+    - fact_daily/month=YYYY-MM/: one row per coin and day, technicals with the day's FGI and macro values
+    - fact_recommendation/month=YYYY-MM/: cleaned LLaMA recommendations per coin and day
+    - agg_sentiment_daily/month=YYYY-MM/: news sentiment per day
+
+    A table is only rebuilt when one of its source files changed size or mtime since the last run,
+    and then only the months whose source rows hash differently are rewritten. Power BI's
+    incremental refresh (or a folder source filtered on the month) reloads just those partitions.
+    """
+
+    def __init__(self, path: str = EXPORT_DIR, symbol_matching: dict = None):
+        self.path = path
+        self.pairs = symbol_matching or universe.load_universe()
+        self.coins = universe.coins(self.pairs)
+        self.state_path = os.path.join(path, STATE_FILE)
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict:
+        if not os.path.exists(self.state_path):
+            return {"files": {}, "months": {}, "coin_keys": {}}
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def sources(self) -> dict:
+        """
+        Table name -> source files.
+        """
+        return {
+            "fact_daily": [f"data/{short}_technical.csv" for short in self.coins.values()]
+                          + ["data/fgi.csv", "data/macro.csv"],
+            "fact_recommendation": [f"data/llama_recommendations_{short}.csv" for short in self.coins.values()],
+            "agg_sentiment_daily": [NEWS_FILE],
+        }
+
+    def _stat(self, path: str):
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _changed(self, paths: list) -> bool:
+        return any(self.state["files"].get(path) != self._stat(path) for path in paths)
+
+    def coin_keys(self) -> dict:
+        """
+        Coin -> surrogate key; keys are never reused, so rows exported earlier keep theirs.
+        """
+        keys = self.state["coin_keys"]
+        for coin in self.coins:
+            if coin not in keys:
+                keys[coin] = max(keys.values(), default=0) + 1
+        return keys
+
+    # Table builders: full frame with a "date" column, one row per grain
+
+    def build_daily(self) -> pd.DataFrame:
+        keys = self.coin_keys()
+        frames = []
+        for coin, short in self.coins.items():
+            tech = _read(f"data/{short}_technical.csv")
+            if tech.empty:
+                continue
+            tech = tech.drop_duplicates("date", keep="last").reindex(columns=["date", *TECHNICAL_COLUMNS])
+            tech.insert(1, "coin_key", keys[coin])
+            frames.append(tech)
+        if not frames:
+            return pd.DataFrame(columns=["date"])
+        daily = pd.concat(frames, ignore_index=True)
+
+        fgi = _read("data/fgi.csv").drop_duplicates("date", keep="last")
+        fgi = fgi.reindex(columns=["date", "value", "classification"]).rename(
+            columns={"value": "fgi_value", "classification": "fgi_classification"})
+        macro = _read("data/macro.csv").drop_duplicates("date", keep="last").reindex(columns=["date", *MACRO_COLUMNS])
+        macro["market_closed"] = macro["market_closed"].astype("boolean")
+        return daily.merge(fgi, on="date", how="left").merge(macro, on="date", how="left")
+
+    def build_recommendations(self) -> pd.DataFrame:
+        keys = self.coin_keys()
+        frames = []
+        for coin, short in self.coins.items():
+            rec = _read(f"data/llama_recommendations_{short}.csv")
+            if rec.empty:
+                continue
+            rec = rec.drop_duplicates("date", keep="last")
+            direction = rec["recommendation"].map(parse_decision)
+            frames.append(pd.DataFrame({
+                "date": rec["date"],
+                "coin_key": keys[coin],
+                "recommendation": direction.map(_DIRECTION_LABELS),
+                "direction": direction,
+                "confidence": rec["confidence"].map(parse_confidence),
+                "rationale": rec["rationale"].astype("string").str.strip("* \n"),
+                # Repeated from an earlier day because the coin's regime did not change
+                "carried": rec["carried"].astype("boolean").fillna(False) if "carried" in rec else False,
+            }))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["date"])
+
+    def build_sentiment(self) -> pd.DataFrame:
+        news = _read(NEWS_FILE)
+        if news.empty:
+            return pd.DataFrame(columns=["date"])
+        label = news["sentiment"].astype("string").str.strip().str.lower()
+        news["score"] = label.map(SENTIMENT_SCORES).astype(float)
+        news["confidence"] = news["confidence"].map(parse_confidence)
+        scored = news[news["score"].notna()]
+
+        daily = news.groupby("date").agg(articles=("url", "size"), sources=("source", "nunique"))
+        daily = daily.join(scored.groupby("date").agg(
+            scored_articles=("score", "size"),
+            sentiment_mean=("score", "mean"),
+            confidence_mean=("confidence", "mean"),
+        ))
+        weighted = (scored["score"] * scored["confidence"]).groupby(scored["date"]).sum()
+        daily["sentiment_weighted"] = weighted / scored.groupby("date")["confidence"].sum().replace(0, np.nan)
+        counts = pd.crosstab(scored["date"], label[scored.index]).reindex(columns=list(SENTIMENT_SCORES), fill_value=0)
+        counts.columns = [f"{name.replace(' ', '_')}_articles" for name in counts.columns]
+        daily = daily.join(counts)
+        daily["scored_articles"] = daily["scored_articles"].fillna(0).astype(int)
+        daily[counts.columns] = daily[counts.columns].fillna(0).astype(int)
+        return daily.reset_index()
+
+    # Partitions
+
+    def _write_parquet(self, df: pd.DataFrame, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def _partition_dir(self, table: str, month: str) -> str:
+        return os.path.join(self.path, table, f"month={month}")
+
+    def write_table(self, table: str, df: pd.DataFrame) -> list:
+        """
+        Rewrite the month partitions of `table` whose rows changed, and drop months that are gone.
+
+        Returns:
+            list: Months rewritten
+        """
+        previous = self.state["months"].get(table, {})
+        hashes, months = {}, {}
+        if len(df):
+            df = df.sort_values([c for c in ("date", "coin_key") if c in df.columns]).reset_index(drop=True)
+            month = df["date"].dt.strftime("%Y-%m")
+            row_hashes = pd.util.hash_pandas_object(df, index=False)
+            for key, rows in df.groupby(month, sort=True).groups.items():
+                hashes[key] = hashlib.sha256(row_hashes[rows].to_numpy().tobytes()).hexdigest()
+                months[key] = rows
+
+        written = []
+        for key, rows in months.items():
+            if previous.get(key) == hashes[key] and os.path.exists(self._partition_dir(table, key)):
+                continue
+            part = df.loc[rows].copy()
+            part.insert(0, "date_key", date_key(part["date"]))
+            self._write_parquet(part.drop(columns="date"), os.path.join(self._partition_dir(table, key), "part-0.parquet"))
+            written.append(key)
+        for key in set(previous) - set(hashes):
+            shutil.rmtree(self._partition_dir(table, key), ignore_errors=True)
+        self.state["months"][table] = hashes
+        return written
+
+    def write_dimensions(self, first, last):
+        dates = pd.Series(pd.date_range(first, last, freq="D"))
+        dim_date = pd.DataFrame({
+            "date_key": date_key(dates),
+            "date": dates.dt.date,
+            "year": dates.dt.year,
+            "quarter": dates.dt.quarter,
+            "month": dates.dt.month,
+            "month_name": dates.dt.month_name(),
+            "iso_week": dates.dt.isocalendar().week.astype(int).to_numpy(),
+            "day_of_week": dates.dt.dayofweek + 1,
+            "day_name": dates.dt.day_name(),
+            "is_weekend": dates.dt.dayofweek >= 5,
+        })
+        self._write_parquet(dim_date, os.path.join(self.path, "dim_date.parquet"))
+
+        pairs = {coin: pair for pair, coin in self.pairs.items()}
+        keys = self.coin_keys()
+        dim_coin = pd.DataFrame({
+            "coin_key": list(keys.values()),
+            "coin": list(keys),
+            "pair": [pairs.get(coin) for coin in keys],
+            "tracked": [coin in self.coins for coin in keys],
+        })
+        self._write_parquet(dim_coin, os.path.join(self.path, "dim_coin.parquet"))
+
+    def run(self, force: bool = False) -> dict:
+        """
+        Refresh the tables whose sources changed (all of them with `force`).
+
+        Returns:
+            dict: Table name -> months rewritten
+        """
+        builders = {
+            "fact_daily": self.build_daily,
+            "fact_recommendation": self.build_recommendations,
+            "agg_sentiment_daily": self.build_sentiment,
+        }
+        written = {}
+        for table, paths in self.sources().items():
+            if not force and table in self.state["months"] and not self._changed(paths):
+                written[table] = []
+                continue
+            with span("export.table", target=table) as s:
+                written[table] = self.write_table(table, builders[table]())
+                s.set(partitions=len(written[table]))
+            self.state["files"].update({path: self._stat(path) for path in paths})
+
+        months = sorted(m for table in self.state["months"].values() for m in table)
+        if months and (any(written.values()) or not os.path.exists(os.path.join(self.path, "dim_date.parquet"))):
+            last = pd.Timestamp(months[-1]) + pd.offsets.MonthEnd(0)
+            self.write_dimensions(pd.Timestamp(months[0]), last)
+        os.makedirs(self.path, exist_ok=True)
+        self._save_state()
+        return written
+
+
+def main(force: bool = False):
+    started = time.perf_counter()
+    written = DashboardExport().run(force)
+    print(f"Dashboard export finished in {time.perf_counter() - started:.1f}s: "
+          + ", ".join(f"{table} {len(months)} partitions" for table, months in written.items()))
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the Power BI star schema as month-partitioned Parquet.")
+    parser.add_argument("--force", action="store_true", help="Rebuild every table, not just changed sources")
+    args = parser.parse_args()
+    main(args.force)
@@ -0,0 +1,105 @@
+import argparse
+import time
+
+import pandas as pd
+
+from etl.feature_store import FeatureStore
+from llama import ollama
+from llama.llama_prediction import KEEP_ALIVE, WINDOW, build_features, make_llama_prompt, parse_recommendation
+from llama.prompt_encoding import ENCODERS
+
+RESULTS_FILE = "data/prompt_encoding_bench.csv"
+COINS = ["btc", "eth", "bnb", "xrp", "ada", "sol"]
+# Fixed sampling so encodings are compared on the model's decisions, not on its randomness
+OPTIONS = {"temperature": 0, "seed": 0}
+
+
+def sample_windows(coins=COINS, windows: int = 3, step: int = 7) -> list:
+    """
+    `windows` feature frames per coin, ending today and every `step` days before.
+
+    Returns:
+        list: (coin, end date, frame) tuples
+    """
+    store = FeatureStore()
+    store.update()
+    samples = []
+    for short in coins:
+        merged = build_features(short, store)
+        if merged is None:
+            continue
+        for k in range(windows):
+            end = len(merged) - k * step
+            if end >= WINDOW:
+                frame = merged.iloc[:end]
+                samples.append((short.upper(), frame["date"].iat[-1].date().isoformat(), frame))
+    return samples
+
+
+def run(encodings=tuple(ENCODERS), coins=COINS, windows: int = 3, repeats: int = 1) -> pd.DataFrame:
+    """
+    Send every sampled window once per encoding (and repeat) to the model, uncached.
+
+    Encodings are interleaved per window so drift in server load affects them all alike.
+    """
+    rows = []
+    for repeat in range(repeats):
+        for coin, date, frame in sample_windows(coins, windows):
+            for encoding in encodings:
+                prompt = make_llama_prompt(frame, coin, encoding)
+                result = ollama.generate(prompt, options=OPTIONS, keep_alive=KEEP_ALIVE, use_cache=False)
+                decision, confidence, _ = parse_recommendation(result["response"])
+                rows.append({
+                    "repeat": repeat,
+                    "coin": coin,
+                    "date": date,
+                    "encoding": encoding,
+                    "prompt_chars": len(prompt),
+                    "prompt_eval_count": result.get("prompt_eval_count"),
+                    "prompt_eval_s": result.get("prompt_eval_duration", 0) / 1e9,
+                    "first_token_s": result["first_token_s"],
+                    "elapsed_s": result["elapsed_s"],
+                    "decision": decision,
+                    "confidence": confidence,
+                })
+                first_token = "no token" if result["first_token_s"] is None else f"{result['first_token_s']:.2f}s"
+                print(f"{coin} {date} {encoding:<12} {result.get('prompt_eval_count')} tokens, first token {first_token}")
+    return pd.DataFrame(rows)
+
+
+def summarize(results: pd.DataFrame, baseline: str = "markdown") -> pd.DataFrame:
+    """
+    Per encoding: median tokens and latencies, and how often the decision matches `baseline`'s.
+    """
+    results = results.assign(decision=results["decision"].str.extract(r"(?i)(buy|hold|sell)", expand=False).str.lower())
+    summary = results.groupby("encoding").agg(
+        prompt_tokens=("prompt_eval_count", "median"),
+        prompt_eval_s=("prompt_eval_s", "median"),
+        first_token_p50_s=("first_token_s", "median"),
+        first_token_p95_s=("first_token_s", lambda s: s.quantile(0.95)),
+        elapsed_p50_s=("elapsed_s", "median"),
+    )
+    if baseline in set(results["encoding"]):
+        reference = results[results["encoding"] == baseline].set_index(["repeat", "coin", "date"])["decision"]
+        joined = results.join(reference.rename("baseline"), on=["repeat", "coin", "date"])
+        summary["agrees_with_" + baseline] = (joined["decision"] == joined["baseline"]).groupby(joined["encoding"]).mean()
+    return summary.sort_values("first_token_p50_s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt table encodings on token count and time to first token.")
+    parser.add_argument("--encodings", nargs="+", choices=list(ENCODERS), default=list(ENCODERS))
+    parser.add_argument("--coins", nargs="+", default=COINS)
+    parser.add_argument("--windows", type=int, default=3, help="Windows per coin, a week apart")
+    parser.add_argument("--repeats", type=int, default=1)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    results = run(args.encodings, args.coins, args.windows, args.repeats)
+    results.to_csv(RESULTS_FILE, index=False)
+    print(summarize(results).to_string())
+    print(f"{len(results)} calls in {time.perf_counter() - started:.1f}s, details in {RESULTS_FILE}")
+
+
+if __name__ == "__main__":
+    main()
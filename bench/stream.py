@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from bench.stubs import DAY_MS, BinanceStub, KlineStreamStub
+from bench.suite import PeakRss, percentiles
+
+
+def run(args) -> dict:
+    """
+    Seed technical CSVs from the Binance stub, then run the stream service against the websocket
+    stub for `args.duration` seconds.
+    """
+    workdir = tempfile.mkdtemp(prefix="dipsignal-stream-")
+    rest = BinanceStub(args.history_days, symbols=args.symbols).start()
+    os.environ.update({
+        "BINANCE_API_URL": rest.url,
+        "DIPSIGNAL_TRACE_FILE": os.path.join(workdir, "traces.jsonl"),
+        "DIPSIGNAL_METRICS_FILE": os.path.join(workdir, "metrics.prom"),
+        "DIPSIGNAL_ALERTS_FILE": os.path.join(workdir, "alerts.jsonl"),
+    })
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    os.makedirs("data")
+    live = None
+    try:
+        from etl import fetch_binance
+        from etl.stream import StreamService
+
+        coins = {pair: base for pair, base in rest.symbols}
+        with contextlib.redirect_stdout(io.StringIO()):
+            fetch_binance.main(symbol_matching=coins, processes=1)
+        last_close = {pair: pd.read_csv(f"data/{base.lower()}_technical.csv")["close"].iat[-1]
+                      for pair, base in coins.items()}
+        rows_before = sum(len(pd.read_csv(f"data/{base.lower()}_technical.csv")) for base in coins.values())
+
+        # Today's candle is still open, so REST stored up to yesterday's and the stream continues with today's.
+        live = KlineStreamStub(int(time.time() * 1000) // DAY_MS * DAY_MS, tick=args.tick,
+                               ticks_per_bar=args.ticks_per_bar, dip_every=args.dip_every,
+                               start_prices=last_close).start()
+        service = StreamService(coins, url=live.url)
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        started = time.perf_counter()
+        with output, PeakRss() as memory:
+            asyncio.run(service.run(args.duration))
+        elapsed = time.perf_counter() - started
+
+        rows_after = sum(len(pd.read_csv(f"data/{base.lower()}_technical.csv")) for base in coins.values())
+        return {
+            "symbols": args.symbols, "seconds": round(elapsed, 2), "messages": service.messages,
+            "messages_per_s": round(service.messages / elapsed, 1), "alerts": len(service.latencies_ms),
+            **{f"alert_latency_{key}": value for key, value in percentiles([ms / 1000 for ms in service.latencies_ms]).items()},
+            "bars_checkpointed": rows_after - rows_before,
+            "peak_rss_mb": round(memory.peak / 1e6, 1) if memory.peak else None,
+        }
+    finally:
+        os.chdir(cwd)
+        rest.stop()
+        if live is not None:
+            live.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Alert latency of the stream service against a local websocket stub.")
+    parser.add_argument("--symbols", type=int, default=20, help="Synthetic pairs streamed")
+    parser.add_argument("--history-days", type=int, default=300, help="Daily candles seeded per pair")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to stream")
+    parser.add_argument("--tick", type=float, default=0.05, help="Seconds between updates per pair")
+    parser.add_argument("--ticks-per-bar", type=int, default=40, help="Updates before a bar closes")
+    parser.add_argument("--dip-every", type=int, default=3, help="Every Nth bar is a dip")
+    parser.add_argument("--verbose", action="store_true", help="Show the service's own output")
+    args = parser.parse_args(argv)
+
+    for key, value in run(args).items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding="utf-8")
+    main()
@@ -0,0 +1,369 @@
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import re
+import socket
+import threading
+import time
+import zlib
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+DAY_MS = 86_400_000
+INTERVAL_MS = {"1h": 3_600_000, "4h": 14_400_000, "1d": DAY_MS, "1w": 7 * DAY_MS}
+FGI_LABELS = [(25, "Extreme Fear"), (45, "Fear"), (55, "Neutral"), (75, "Greed"), (101, "Extreme Greed")]
+WORDS = ("bitcoin ether market rally selloff whale exchange listing regulator etf stablecoin liquidity "
+         "miners halving defi token upgrade network fees volume traders outflow inflow").split()
+
+
+class StubServer:
+    """
+    Local HTTP stand-in for an upstream API on 127.0.0.1.
+
+    Every request sleeps `latency` seconds before answering, so timings are deterministic.
+    Subclasses implement respond(handler, path, query).
+
+    Where fork is available the server runs in a child process, so serving does not compete
+    with the code under test for the GIL; request counts are then only kept in the child.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self):
+                with stub._lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                parts = urlsplit(self.path)
+                stub.respond(self, parts.path, {k: v[-1] for k, v in parse_qs(parts.query).items()})
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.process = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self, in_process: bool = False):
+        if not in_process and "fork" in multiprocessing.get_all_start_methods():
+            self.process = multiprocessing.get_context("fork").Process(target=self.server.serve_forever, daemon=True)
+            self.process.start()
+        else:
+            self.thread.start()
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+        else:
+            self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, handler, path: str, query: dict):
+        raise NotImplementedError
+
+    @staticmethod
+    def send(handler, body: bytes, content_type: str = "application/json", status: int = 200, headers: dict = None):
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+class BinanceStub(StubServer):
+    """
+    /api/v3/klines with `history_days` of candles per symbol at 1h, 4h, 1d or 1w, ending with the
+    candle open now. Prices are a random walk seeded by the symbol name and interval, so every run
+    serves the same data.
+
+    /api/v3/exchangeInfo and /api/v3/ticker/24hr list `symbols` USDT pairs S000USDT, S001USDT, ...
+    with descending quote volumes, for universe discovery.
+    """
+
+    def __init__(self, history_days: int = 1000, latency: float = 0.0, symbols: int = 0):
+        super().__init__(latency)
+        self.history_days = history_days
+        self.symbols = [(f"S{i:03d}USDT", f"S{i:03d}") for i in range(symbols)]
+        self.now_ms = int(time.time() * 1000)
+        self._series = {}
+
+    def first_open_ms(self, step_ms: int) -> int:
+        # The newest candle is the one still open now
+        return self.now_ms // step_ms * step_ms - (self.history_days * DAY_MS // step_ms - 1) * step_ms
+
+    def candles(self, symbol: str, step_ms: int = DAY_MS) -> np.ndarray:
+        with self._lock:
+            if (symbol, step_ms) not in self._series:
+                n = self.history_days * DAY_MS // step_ms
+                rng = np.random.default_rng([zlib.crc32(symbol.encode()), step_ms])
+                close = 10 + 90 * rng.random() * np.exp(np.cumsum(rng.normal(0, 0.03 * (step_ms / DAY_MS) ** 0.5, n)))
+                open_ = np.concatenate([[close[0]], close[:-1]])
+                spread = np.abs(rng.normal(0, 0.02, n)) * close
+                volume = rng.uniform(1e3, 1e6, n) * step_ms / DAY_MS
+                self._series[(symbol, step_ms)] = np.column_stack([open_, np.maximum(open_, close) + spread,
+                                                                   np.minimum(open_, close) - spread, close, volume])
+            return self._series[(symbol, step_ms)]
+
+    def respond(self, handler, path, query):
+        if path == "/api/v3/exchangeInfo":
+            listing = [{"symbol": pair, "baseAsset": base, "quoteAsset": "USDT", "status": "TRADING",
+                        "isSpotTradingAllowed": True} for pair, base in self.symbols]
+            return self.send(handler, json.dumps({"symbols": listing}).encode())
+        if path == "/api/v3/ticker/24hr":
+            tickers = [{"symbol": pair, "quoteVolume": f"{1e9 / (i + 1):.2f}"} for i, (pair, _) in enumerate(self.symbols)]
+            return self.send(handler, json.dumps(tickers).encode())
+        if path != "/api/v3/klines":
+            return self.send(handler, b'{"msg": "not found"}', status=404)
+        step_ms = INTERVAL_MS[query.get("interval", "1d")]
+        ohlcv = self.candles(query["symbol"], step_ms)
+        first_open_ms = self.first_open_ms(step_ms)
+        limit = int(query.get("limit", 500))
+        start_ms = int(query.get("startTime", 0))
+        first = max(0, -(-(start_ms - first_open_ms) // step_ms)) if "startTime" in query else max(0, len(ohlcv) - limit)
+        rows = []
+        for i in range(first, min(first + limit, len(ohlcv))):
+            open_ms = first_open_ms + i * step_ms
+            o, h, l, c, v = (f"{x:.8f}" for x in ohlcv[i])
+            rows.append([open_ms, o, h, l, c, v, open_ms + step_ms - 1, "0", 100, "0", "0", "0"])
+        self.send(handler, json.dumps(rows).encode())
+
+
+class FgiStub(StubServer):
+    """
+    alternative.me /fng/?limit=N with `days` of daily index values, newest first.
+    """
+
+    def __init__(self, days: int = 1000, latency: float = 0.0):
+        super().__init__(latency)
+        rng = np.random.default_rng(0)
+        today_s = int(time.time()) // 86400 * 86400
+        self.values = [(today_s - i * 86400, int(v)) for i, v in enumerate(rng.integers(5, 95, days))]
+
+    def respond(self, handler, path, query):
+        limit = int(query.get("limit", 1))
+        data = [{"value": str(value), "timestamp": str(ts),
+                 "value_classification": next(label for bound, label in FGI_LABELS if value < bound)}
+                for ts, value in self.values[:limit or len(self.values)]]
+        self.send(handler, json.dumps({"name": "Fear and Greed Index", "data": data}).encode())
+
+
+class RssStub(StubServer):
+    """
+    `feeds` RSS 2.0 feeds at /feed/<n>, each listing `articles` items with summaries of
+    `summary_words` words. Answers 304 when the client's If-None-Match matches the feed's ETag.
+
+    A `duplicate_share` of the items of every feed after the first retell the first feed's story
+    at the same position, with a different title prefix and one summary word changed.
+    """
+
+    def __init__(self, feeds: int = 3, articles: int = 50, summary_words: int = 40, latency: float = 0.0,
+                 duplicate_share: float = 0.0):
+        super().__init__(latency)
+        self.feeds = feeds
+        self._bodies = {}
+        rng = np.random.default_rng(1)
+        pub_date = formatdate(time.time(), usegmt=True)
+        stories = []
+        for n in range(feeds):
+            items = []
+            for i in range(articles):
+                if n and rng.random() < duplicate_share:
+                    title, words = stories[i]
+                    title = f"{rng.choice(WORDS)}: {title}"
+                    words = list(words)
+                    words[rng.integers(len(words))] = rng.choice(WORDS)
+                else:
+                    # Figures make each story distinct, as names and numbers do in real news
+                    title = " ".join([*rng.choice(WORDS, 7), str(rng.integers(10_000, 1_000_000))])
+                    words = [*rng.choice(WORDS, summary_words - 3), *map(str, rng.integers(100, 100_000, 3))]
+                    rng.shuffle(words)
+                if n == 0:
+                    stories.append((title, words))
+                summary = " ".join(words)
+                items.append(f"<item><title>{escape(title)}</title><link>https://news.example/{n}/{i}</link>"
+                             f"<guid>https://news.example/{n}/{i}</guid><pubDate>{pub_date}</pubDate>"
+                             f"<description>{escape(summary)}</description></item>")
+            body = (f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>Feed {n}</title>'
+                    f'{"".join(items)}</channel></rss>').encode()
+            self._bodies[f"/feed/{n}"] = (body, f'"{zlib.crc32(body):x}"')
+
+    def feed_urls(self) -> dict:
+        return {f"Stub {n}": f"{self.url}/feed/{n}" for n in range(self.feeds)}
+
+    def respond(self, handler, path, query):
+        if path not in self._bodies:
+            return self.send(handler, b"", status=404)
+        body, etag = self._bodies[path]
+        if handler.headers.get("If-None-Match") == etag:
+            handler.send_response(304)
+            handler.send_header("ETag", etag)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+        self.send(handler, body, "application/rss+xml", headers={"ETag": etag})
+
+
+class OllamaStub(StubServer):
+    """
+    /api/generate answering news-scoring and recommendation prompts in the formats the parsers
+    expect. After `latency` (the prefill), streamed responses emit one ~4 character token every
+    `token_delay` seconds.
+    """
+
+    def __init__(self, latency: float = 0.0, token_delay: float = 0.0):
+        super().__init__(latency)
+        self.token_delay = token_delay
+
+    @staticmethod
+    def answer(prompt: str) -> str:
+        articles = len(re.findall(r"^\d+\. Title:", prompt, re.M))
+        if articles:
+            return "".join(f"{i}. Sentiment: neutral Confidence: 0.5 Rationale: Stub answer.\n"
+                           for i in range(1, articles + 1))
+        decision = ["Buy", "Hold", "Sell"][zlib.crc32(prompt.encode()) % 3]
+        return f"1. Decision: {decision}\n2. Confidence: 0.6\n3. Rationale: Stub answer."
+
+    def respond(self, handler, path, query):
+        payload = json.loads(handler.rfile.read(int(handler.headers["Content-Length"])))
+        text = self.answer(payload["prompt"])
+        tokens = re.findall(r".{1,4}", text, re.S)
+        final = {
+            "model": payload["model"], "done": True,
+            "prompt_eval_count": len(payload["prompt"]) // 4, "eval_count": len(tokens),
+            "prompt_eval_duration": int(self.latency * 1e9), "eval_duration": int(len(tokens) * self.token_delay * 1e9),
+        }
+        if not payload.get("stream", True):
+            return self.send(handler, json.dumps({**final, "response": text}).encode())
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/x-ndjson")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def chunk(obj):
+            line = (json.dumps(obj) + "\n").encode()
+            handler.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+
+        for token in tokens:
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            chunk({"model": payload["model"], "response": token, "done": False})
+        chunk({**final, "response": ""})
+        handler.wfile.write(b"0\r\n\r\n")
+
+
+class KlineStreamStub:
+    """
+    Binance-style combined kline websocket at ws://127.0.0.1:<port>/stream?streams=<pair>@kline_<interval>/...
+
+    Every `tick` seconds each subscribed pair gets an update of its open bar; every `ticks_per_bar`
+    updates the bar closes ("x": true) and the next one opens `interval` later. Every `dip_every`th
+    bar falls `dip_pct` percent. The event time "E" is the send time, so a client can measure its
+    own latency. Runs in a forked child process where available, like StubServer.
+    """
+
+    def __init__(self, first_open_ms: int, interval: str = "1d", tick: float = 0.01, ticks_per_bar: int = 10,
+                 dip_every: int = 5, dip_pct: float = 15.0, start_prices: dict = None):
+        self.first_open_ms = first_open_ms
+        self.interval = interval
+        self.tick = tick
+        self.ticks_per_bar = ticks_per_bar
+        self.dip_every = dip_every
+        self.dip_pct = dip_pct
+        self.start_prices = start_prices or {}
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(("127.0.0.1", 0))
+        self.process = None
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.socket.getsockname()[1]}"
+
+    async def _feed(self, connection):
+        streams = parse_qs(urlsplit(connection.request.path).query).get("streams", [""])[0].split("/")
+        pairs = [stream.split("@")[0].upper() for stream in streams if stream]
+        step_ms = INTERVAL_MS[self.interval]
+        rng = np.random.default_rng(zlib.crc32(",".join(pairs).encode()))
+        bars = {}
+        for pair in pairs:
+            price = float(self.start_prices.get(pair, 100.0))
+            bars[pair] = {"t": self.first_open_ms, "o": price, "h": price, "l": price, "c": price, "v": 0.0}
+        tick = 0
+        while True:
+            tick += 1
+            closing = tick % self.ticks_per_bar == 0
+            for pair, bar in bars.items():
+                bar_number = (bar["t"] - self.first_open_ms) // step_ms + 1
+                drift = -self.dip_pct / 100 / self.ticks_per_bar if bar_number % self.dip_every == 0 else 0.0
+                bar["c"] *= 1 + drift + rng.normal(0, 0.002)
+                bar["h"], bar["l"] = max(bar["h"], bar["c"]), min(bar["l"], bar["c"])
+                bar["v"] += float(rng.uniform(1, 10))
+                kline = {"t": bar["t"], "T": bar["t"] + step_ms - 1, "s": pair, "i": self.interval,
+                         "o": f"{bar['o']:.8f}", "h": f"{bar['h']:.8f}", "l": f"{bar['l']:.8f}",
+                         "c": f"{bar['c']:.8f}", "v": f"{bar['v']:.8f}", "x": closing}
+                message = {"stream": f"{pair.lower()}@kline_{self.interval}",
+                           "data": {"e": "kline", "E": int(time.time() * 1000), "s": pair, "k": kline}}
+                await connection.send(json.dumps(message))
+                if closing:
+                    bars[pair] = {"t": bar["t"] + step_ms, "o": bar["c"], "h": bar["c"], "l": bar["c"],
+                                  "c": bar["c"], "v": 0.0}
+            await asyncio.sleep(self.tick)
+
+    async def _serve(self):
+        from websockets.asyncio.server import serve
+        from websockets.exceptions import ConnectionClosed
+
+        async def handler(connection):
+            with contextlib.suppress(ConnectionClosed):
+                await self._feed(connection)
+
+        async with serve(handler, sock=self.socket) as server:
+            await server.serve_forever()
+
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except KeyboardInterrupt:
+            pass
+
+    def start(self, in_process: bool = False):
+        self.socket.listen()
+        if not in_process and "fork" in multiprocessing.get_all_start_methods():
+            self.process = multiprocessing.get_context("fork").Process(target=self._run, daemon=True)
+            self.process.start()
+        else:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+        self.socket.close()
@@ -0,0 +1,218 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from bench.stubs import BinanceStub, FgiStub, OllamaStub, RssStub
+
+
+def percentiles(values) -> dict:
+    if not len(values):
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return {"p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2)}
+
+
+def read_spans(trace_file: str, since: float) -> pd.DataFrame:
+    if not os.path.exists(trace_file):
+        return pd.DataFrame(columns=["span", "seconds"])
+    with open(trace_file, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    spans = pd.DataFrame(records)
+    return spans[spans["start"] >= since] if len(spans) else pd.DataFrame(columns=["span", "seconds"])
+
+
+class PeakRss:
+    """
+    Samples the process's resident set size every `interval` seconds while active and keeps the
+    peak. Unlike tracemalloc it costs nothing measurable, so timings stay honest. Reads
+    /proc/self/statm, so it reports nothing off Linux.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _rss(self):
+        try:
+            with open("/proc/self/statm", "r") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except OSError:
+            return None
+
+    def _sample(self):
+        while True:
+            rss = self._rss()
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class Suite:
+    """
+    Drives the pipeline entry points end to end against local stubs in a scratch working directory.
+
+    Every scenario reports wall time, items per second, peak resident memory, and latency
+    percentiles of the HTTP / Ollama / CSV spans it recorded (see etl.tracing).
+    """
+
+    def __init__(self, workdir: str, trace_file: str, verbose: bool = False):
+        self.workdir = workdir
+        self.trace_file = trace_file
+        self.verbose = verbose
+        self.results = []
+
+    def measure(self, name: str, items_label: str, fn):
+        """
+        Run `fn` (returning the number of items processed) as scenario `name`.
+        """
+        output = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        since = time.time()
+        started = time.perf_counter()
+        with output, PeakRss() as memory:
+            items = fn()
+        elapsed = time.perf_counter() - started
+
+        row = {"scenario": name, "items": items, "unit": items_label, "seconds": round(elapsed, 3),
+               "items_per_s": round(items / elapsed, 1) if elapsed else None,
+               "peak_rss_mb": round(memory.peak / 1e6, 1) if memory.peak else None}
+        spans = read_spans(self.trace_file, since)
+        for span_name in ("http", "ollama", "csv.append", "csv.read"):
+            seconds = spans.loc[spans["span"] == span_name, "seconds"]
+            if len(seconds):
+                row.update({f"{span_name}_{key}": value for key, value in percentiles(seconds).items()})
+                row[f"{span_name}_calls"] = len(seconds)
+        self.results.append(row)
+        print(f"{name}: {items} {items_label} in {elapsed:.2f}s ({row['items_per_s']}/s), peak RSS {row['peak_rss_mb']} MB")
+        return row
+
+
+def write_macro(days: int):
+    """
+    Synthetic data/macro.csv (FRED and yfinance have no stub).
+    """
+    dates = pd.date_range(end=pd.Timestamp.today().normalize(), periods=days, freq="D")
+    rng = np.random.default_rng(2)
+    pd.DataFrame({
+        "date": dates.date, "dxy": (100 + rng.normal(0, 0.3, days).cumsum()).round(2),
+        "sp500": (4000 + rng.normal(0, 20, days).cumsum()).round(2), "cpi": 300.0, "interest_rate": 4.5,
+        "market_closed": dates.dayofweek >= 5,
+    }).to_csv("data/macro.csv", index=False)
+
+
+def run(args) -> pd.DataFrame:
+    workdir = tempfile.mkdtemp(prefix="dipsignal-bench-")
+    trace_file = os.path.join(workdir, "traces.jsonl")
+    stubs = {
+        "binance": BinanceStub(args.history_days, args.http_latency, args.symbols),
+        "fgi": FgiStub(args.history_days, args.http_latency),
+        "rss": RssStub(args.feeds, args.articles, args.summary_words, args.http_latency, args.duplicate_share),
+        "ollama": OllamaStub(args.llm_latency, args.token_delay),
+    }
+    for stub in stubs.values():
+        stub.start()
+
+    # The modules read these when first imported, so they are set before any import below.
+    os.environ.update({
+        "BINANCE_API_URL": stubs["binance"].url,
+        "FGI_URL": f"{stubs['fgi'].url}/fng/",
+        "OLLAMA_URL": stubs["ollama"].url,
+        "NEWS_FEEDS_FILE": "data/feeds.json",
+        "DIPSIGNAL_TRACE_FILE": trace_file,
+        "DIPSIGNAL_METRICS_FILE": os.path.join(workdir, "metrics.prom"),
+        "LLM_CACHE": "0",
+    })
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    os.makedirs("data")
+    try:
+        from etl import fetch_binance, fetch_fgi, news, universe
+        from llama import llama_news, llama_prediction
+
+        suite = Suite(workdir, trace_file, args.verbose)
+        # Every stub pair is discovered from the stub's exchangeInfo listing
+        with open("data/universe.json", "w", encoding="utf-8") as f:
+            json.dump({"discover": {"quote": "USDT", "limit": args.symbols}}, f)
+        coins = universe.load_universe()
+
+        suite.measure("fetch_binance (full history)", "candles",
+                      lambda: fetch_binance.main(max_workers=args.workers, processes=args.processes)
+                      or len(coins) * args.history_days)
+        suite.measure("fetch_binance (up to date)", "symbols",
+                      lambda: fetch_binance.main(max_workers=args.workers, processes=args.processes) or len(coins))
+        suite.measure("fetch_fgi", "rows", lambda: fetch_fgi.main() or min(250, args.history_days))
+        write_macro(args.history_days)
+
+        with open("data/feeds.json", "w", encoding="utf-8") as f:
+            json.dump(stubs["rss"].feed_urls(), f)
+        suite.measure("news (new articles)", "articles", lambda: news.main() or args.feeds * args.articles)
+        suite.measure("news (not modified)", "feeds", lambda: news.main() or args.feeds)
+        suite.measure("llama_news.process_batches", "articles",
+                      lambda: (llama_news.process_batches() or {"articles": 0})["articles"])
+
+        predicted = dict(list(universe.coins(coins).items())[:args.predict])
+        suite.measure("llama_prediction", "coins",
+                      lambda: llama_prediction.main(symbol_matching=predicted, processes=args.processes)
+                      or len(predicted))
+        return pd.DataFrame(suite.results)
+    finally:
+        os.chdir(cwd)
+        for stub in stubs.values():
+            stub.stop()
+        if args.keep:
+            print(f"Scratch directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark against local stub servers.")
+    parser.add_argument("--symbols", type=int, default=20, help="Synthetic Binance symbols")
+    parser.add_argument("--history-days", type=int, default=1000, help="Daily candles / FGI values served")
+    parser.add_argument("--feeds", type=int, default=5, help="RSS feeds")
+    parser.add_argument("--articles", type=int, default=200, help="Articles per feed")
+    parser.add_argument("--summary-words", type=int, default=40, help="Words per article summary")
+    parser.add_argument("--duplicate-share", type=float, default=0.3,
+                        help="Share of articles retelling a story from the first feed")
+    parser.add_argument("--predict", type=int, default=6, help="Coins sent to llama_prediction")
+    parser.add_argument("--http-latency", type=float, default=0.02, help="Seconds per Binance/FGI/RSS request")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds of prefill per Ollama request")
+    parser.add_argument("--token-delay", type=float, default=0.0005, help="Seconds per streamed token")
+    parser.add_argument("--workers", type=int, default=6, help="fetch_binance max_workers per shard")
+    parser.add_argument("--processes", type=int, help="Universe shards processed at once (default: UNIVERSE_PROCESSES)")
+    parser.add_argument("--output", help="Also write the results to this CSV file")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(results.set_index("scenario").to_string())
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding="utf-8")
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+
+# Only the standard library and the pipeline (which imports stage modules on demand) are loaded
+# at startup; every heavy dependency is imported by the stage that needs it.
+from pipeline import STAGES, Pipeline
+from pipeline import main as pipeline_main
+
+# Command words -> pipeline stage
+COMMANDS = {
+    ("fetch", "binance"): "fetch_binance",
+    ("fetch", "ohlcv"): "fetch_ohlcv",
+    ("fetch", "fgi"): "fetch_fgi",
+    ("fetch", "macro"): "fetch_macro",
+    ("fetch", "news"): "news",
+    ("predict",): "llama_prediction",
+    ("score", "news"): "llama_news",
+    ("export", "dashboard"): "dashboard_export",
+}
+# Commands outside the pipeline: module whose main(argv) gets the remaining arguments
+TOOLS = {
+    "stream": "etl.stream",
+    "backtest": "analysis.backtest",
+}
+
+
+def run_stage(name: str, force: bool = False) -> int:
+    from etl.tracing import export_metrics
+
+    status = Pipeline().run(only=[name], force=force)
+    export_metrics()
+    return 1 if status[name] in ("failed", "blocked") else 0
+
+
+def run_tool(name: str, argv: list) -> int:
+    import importlib
+
+    return importlib.import_module(TOOLS[name]).main(argv) or 0
+
+
+def import_time(statement: str) -> dict:
+    """
+    Run `statement` in a fresh interpreter under -X importtime.
+
+    Returns:
+        dict: {"total_ms": wall import time of everything, "packages": {top-level package: self ms}}
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            capture_output=True, text=True, check=True)
+    packages = defaultdict(float)
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1000
+        if not name[1:].startswith(" "):
+            # Top-level import: its cumulative time covers everything it pulled in
+            total += int(cumulative_us) / 1000
+    return {"total_ms": total, "packages": dict(packages)}
+
+
+def importtime_report(commands: list, top: int = 8, max_ms: float = None) -> int:
+    """
+    Print the import cost of the CLI itself and of each command's stage module, with the top-level
+    packages that account for most of it. Returns 1 when `max_ms` is given and the CLI's own
+    startup exceeds it, so a regression can fail a check.
+    """
+    targets = {"cli": "import cli"}
+    for words, stage in COMMANDS.items():
+        if not commands or " ".join(words) in commands:
+            module = next(s.target for s in STAGES if s.name == stage).split(":")[0]
+            targets[" ".join(words)] = f"import cli, {module}"
+    for name, module in TOOLS.items():
+        if not commands or name in commands:
+            targets[name] = f"import cli, {module}"
+
+    baseline = import_time("pass")["total_ms"]
+    print(f"{'command':<16}{'imports (ms)':>14}  heaviest packages (self ms)")
+    results = {}
+    for name, statement in targets.items():
+        report = import_time(statement)
+        results[name] = report["total_ms"]
+        heaviest = sorted(report["packages"].items(), key=lambda item: item[1], reverse=True)[:top]
+        print(f"{name:<16}{report['total_ms']:>14.1f}  " + ", ".join(f"{pkg} {ms:.0f}" for pkg, ms in heaviest))
+    print(f"(interpreter startup imports alone: {baseline:.1f} ms)")
+
+    if max_ms is not None and results["cli"] > max_ms:
+        print(f"❌ CLI startup imports take {results['cli']:.1f} ms, over the {max_ms:.0f} ms budget")
+        return 1
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Run one DipSignal stage, or the whole pipeline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # The pipeline and the tools parse their own options
+    commands.add_parser("run", help="Run the pipeline (same options as main_script.py)", add_help=False)
+
+    fetch = commands.add_parser("fetch", help="Run one fetcher")
+    fetch.add_argument("source", choices=[words[1] for words in COMMANDS if words[0] == "fetch"])
+
+    predict = commands.add_parser("predict", help="Generate today's LLaMA recommendations")
+    predict.add_argument("--force", action="store_true", help="Run even when the inputs are unchanged")
+
+    score = commands.add_parser("score", help="Score queued news with LLaMA")
+    score.add_argument("source", choices=["news"])
+    score.add_argument("--force", action="store_true", help="Run even when the inputs are unchanged")
+
+    for name, module in TOOLS.items():
+        commands.add_parser(name, help=f"Run {module}", add_help=False)
+
+    export = commands.add_parser("export", help="Write the Power BI star schema")
+    export.add_argument("target", choices=["dashboard"])
+    export.add_argument("--force", action="store_true", help="Run even when the inputs are unchanged")
+
+    report = commands.add_parser("importtime", help="Import cost of the CLI and each command")
+    report.add_argument("commands", nargs="*", help="Commands to measure, e.g. 'fetch fgi' (default: all)")
+    report.add_argument("--top", type=int, default=8, help="Packages listed per command")
+    report.add_argument("--max-ms", type=float, help="Exit with 1 when the CLI's own imports take longer")
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+    if args.command == "run":
+        return pipeline_main(rest)
+    if args.command in TOOLS:
+        return run_tool(args.command, rest)
+    if rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    if args.command == "importtime":
+        return importtime_report(args.commands, args.top, args.max_ms)
+
+    target = getattr(args, "source", None) or getattr(args, "target", None)
+    words = (args.command, target) if target else (args.command,)
+    return run_stage(COMMANDS[words], getattr(args, "force", False))
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding="utf-8")
+    raise SystemExit(main())
@@ -0,0 +1,198 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from etl.tracing import count
+
+CASSETTE_DIR = os.getenv("DIPSIGNAL_CASSETTE_DIR", "data/cassettes")
+MODES = ("live", "record", "replay")
+# Query parameters that depend on the clock rather than the data asked for (Binance sizes its
+# last kline page by the time of the run); a replay that misses on the exact request falls back
+# to the recording made without them
+LOOSE_PARAMS = ("limit", "endTime")
+# Headers that describe the wire encoding of the recorded body, which is stored decoded
+_WIRE_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+# Rate limits and server errors are not recorded; a replay should see the retried answer
+_TRANSIENT_STATUS = (418, 429)
+# Nor is a 304 to a conditional GET: it shares its key with the full response, which it would
+# replace with an empty body
+_NOT_MODIFIED = 304
+# Time of the recorded run, read back by now() in replay mode
+CLOCK_FILE = "clock.json"
+_clock_lock = threading.Lock()
+_recorded_clock = None
+
+
+class CassetteMiss(requests.ConnectionError):
+    """
+    Raised in replay mode for a request that was never recorded.
+    """
+
+
+def mode() -> str:
+    """
+    live (default) talks to the network, record also stores every response, replay serves
+    only stored responses. Set with DIPSIGNAL_HTTP_MODE.
+    """
+    value = os.getenv("DIPSIGNAL_HTTP_MODE", "live").lower()
+    if value not in MODES:
+        raise ValueError(f"DIPSIGNAL_HTTP_MODE must be one of {', '.join(MODES)}, not {value!r}")
+    return value
+
+
+def replaying() -> bool:
+    return mode() == "replay"
+
+
+def now() -> float:
+    """
+    Current time in epoch seconds, for requests whose range depends on the clock. A recording
+    stores the time it started under CLOCK_FILE and a replay runs at that time, so it asks for
+    the candles that were recorded rather than the ones closed since.
+    """
+    global _recorded_clock
+    current = mode()
+    path = os.path.join(CASSETTE_DIR, CLOCK_FILE)
+    if current == "replay":
+        if not os.path.exists(path):
+            raise CassetteMiss(f"No recorded clock in {CASSETTE_DIR}")
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["now"]
+    if current == "live":
+        return time.time()
+    with _clock_lock:
+        if _recorded_clock is None:
+            _recorded_clock = time.time()
+            os.makedirs(CASSETTE_DIR, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"now": _recorded_clock}, f)
+            os.replace(tmp_path, path)
+        return _recorded_clock
+
+
+def request_key(method: str, url: str, body=None, loose: bool = False) -> str:
+    """
+    SHA-256 of the method, URL (query parameters sorted) and body of a request.
+    """
+    parts = urlsplit(url)
+    params = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    if loose:
+        params = [(k, v) for k, v in params if k not in LOOSE_PARAMS]
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    digest = hashlib.sha256()
+    for part in (method.upper(), parts.netloc, parts.path, urlencode(params)):
+        digest.update(part.encode("utf-8") + b"\0")
+    digest.update(body or b"")
+    return digest.hexdigest()
+
+
+def _path(namespace: str, key: str, root: str = None) -> str:
+    return os.path.join(root or CASSETTE_DIR, namespace.replace(":", "_"), key[:2], f"{key}.json.gz")
+
+
+def load(namespace: str, key: str, root: str = None):
+    path = _path(namespace, key, root)
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(namespace: str, key: str, entry: dict, root: str = None):
+    path = _path(namespace, key, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
+
+
+class CassetteAdapter(HTTPAdapter):
+    """
+    Transport adapter that records responses to, or replays them from, the cassette store
+    according to mode(). Cassettes live under data/cassettes/{host}/, one gzipped JSON file per
+    request key, so a recording of the daily fetchers can be replayed with no network at all.
+    """
+
+    def send(self, request, **kwargs):
+        current = mode()
+        if current == "live":
+            return super().send(request, **kwargs)
+
+        host = urlsplit(request.url).netloc
+        key = request_key(request.method, request.url, request.body)
+        if current == "replay":
+            entry = load(host, key) or load(host, request_key(request.method, request.url, request.body, loose=True))
+            if entry is None:
+                count("cassette_misses_total", 1, "Requests with no recorded response in replay mode", host=host)
+                raise CassetteMiss(f"No cassette for {request.method} {request.url}", request=request)
+            count("cassette_hits_total", 1, "Responses served from cassettes", host=host)
+            return self._replay(request, entry)
+
+        response = super().send(request, **kwargs)
+        status = response.status_code
+        if status in _TRANSIENT_STATUS or status == _NOT_MODIFIED or status >= 500:
+            return response
+        entry = {
+            "method": request.method,
+            "url": request.url,
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() not in _WIRE_HEADERS},
+            # Reading the content also buffers it on the response handed back to the caller
+            "body": base64.b64encode(response.content).decode("ascii"),
+        }
+        save(host, key, entry)
+        save(host, request_key(request.method, request.url, request.body, loose=True), entry)
+        return response
+
+    def _replay(self, request, entry: dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry.get("reason")
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = base64.b64decode(entry["body"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+
+def recorded(namespace: str, key: dict, fetch, dump, restore):
+    """
+    Cassette for a call that does not go through the pooled session (client libraries with their
+    own transport): record stores `dump(fetch())` under `key`, replay returns `restore(text)`.
+
+    Parameters:
+        namespace (str): Directory under the cassette store, e.g. "fred"
+        key (dict): JSON-serialisable arguments identifying the call
+        fetch: Zero-argument callable doing the live call
+        dump / restore: Convert the result to and from text
+    """
+    current = mode()
+    if current == "live":
+        return fetch()
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    if current == "replay":
+        entry = load(namespace, digest)
+        if entry is None:
+            count("cassette_misses_total", 1, "Requests with no recorded response in replay mode", host=namespace)
+            raise CassetteMiss(f"No cassette for {namespace} {key}")
+        count("cassette_hits_total", 1, "Responses served from cassettes", host=namespace)
+        return restore(entry["body"])
+    value = fetch()
+    save(namespace, digest, {"key": key, "body": dump(value)})
+    return value
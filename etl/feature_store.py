@@ -0,0 +1,244 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from etl.locks import file_lock
+from etl.storage import read_rows
+
+STORE_DIR = "data/features"
+COINS = ["btc", "eth", "bnb", "xrp", "ada", "sol"]
+TECHNICAL_COLUMNS = ["open", "high", "low", "close", "volume", "sma_20", "sma_50", "sma_200", "rsi", "macd", "pct_change"]
+
+# source name -> (csv path, {csv column: store column})
+SOURCES = {
+    **{short: (f"data/{short}_technical.csv", {col: f"{short}_{col}" for col in TECHNICAL_COLUMNS}) for short in COINS},
+    "fgi": ("data/fgi.csv", {"value": "fgi_value", "classification": "fgi_classification"}),
+    "macro": ("data/macro.csv", {"dxy": "dxy", "sp500": "sp500", "cpi": "cpi", "interest_rate": "interest_rate",
+                                 "market_closed": "market_closed"}),
+}
+# Text columns stored as integer codes into meta["categories"][column]
+CATEGORICAL = {"fgi_classification"}
+
+
+def source(name: str) -> tuple:
+    """
+    (csv path, column mapping) of a source; any coin without an entry in SOURCES reads
+    data/{name}_technical.csv.
+    """
+    if name in SOURCES:
+        return SOURCES[name]
+    return f"data/{name}_technical.csv", {col: f"{name}_{col}" for col in TECHNICAL_COLUMNS}
+
+
+def _complete_columns(short: str) -> list:
+    """
+    Store columns that must all be present for a day to be in a coin's frame.
+    """
+    return [f"{short}_close", "fgi_value", "market_closed"]
+
+
+class FeatureStore:
+    """
+    One wide float64 matrix of every coin's technicals plus FGI and macro data, aligned on a
+    contiguous daily index (row = days since `start_date`), kept in data/features/values.f64 and
+    read through np.memmap.
+
+    update() only integrates rows newer than each source's watermark: new days are appended to the
+    file and their cells written in place, so consumers can read zero-copy slices instead of
+    re-reading and re-joining the CSVs.
+    """
+
+    def __init__(self, path: str = STORE_DIR):
+        self.path = path
+        self.values_path = os.path.join(path, "values.f64")
+        self.meta_path = os.path.join(path, "meta.json")
+        self.lock_path = os.path.join(path, "store.lock")
+        self.meta = self._load_meta()
+
+    def _load_meta(self) -> dict:
+        if not os.path.exists(self.meta_path):
+            return {"start_date": None, "rows": 0, "columns": [], "watermarks": {}, "categories": {}}
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_meta(self):
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp_path, self.meta_path)
+
+    def _reset(self):
+        self.meta = {"start_date": None, "rows": 0, "columns": [], "watermarks": {}, "categories": {}}
+        if os.path.exists(self.values_path):
+            os.remove(self.values_path)
+
+    def _row(self, dates: pd.Series) -> np.ndarray:
+        start = pd.Timestamp(self.meta["start_date"])
+        return ((dates - start).dt.days).to_numpy()
+
+    def _grow(self, rows: int):
+        """
+        Append NaN rows so the matrix covers `rows` days.
+        """
+        extra = rows - self.meta["rows"]
+        if extra <= 0:
+            return
+        with open(self.values_path, "ab") as f:
+            np.full((extra, len(self.meta["columns"])), np.nan).tofile(f)
+        self.meta["rows"] = rows
+
+    def _add_columns(self, columns: list):
+        """
+        Rewrite the matrix with extra columns (only when a new source appears).
+        """
+        old = self.values() if self.meta["rows"] else np.empty((0, 0))
+        new_columns = self.meta["columns"] + [c for c in columns if c not in self.meta["columns"]]
+        matrix = np.full((self.meta["rows"], len(new_columns)), np.nan)
+        matrix[:, :old.shape[1]] = old
+        del old
+        matrix.tofile(f"{self.values_path}.tmp")
+        os.replace(f"{self.values_path}.tmp", self.values_path)
+        self.meta["columns"] = new_columns
+
+    def _encode(self, column: str, values: pd.Series) -> np.ndarray:
+        if column not in CATEGORICAL:
+            if values.dtype == object:
+                values = values.map({"True": 1.0, "False": 0.0, True: 1.0, False: 0.0}).where(values.notna())
+            return values.astype(float).to_numpy()
+        categories = self.meta["categories"].setdefault(column, [])
+        for label in values.dropna().unique():
+            if label not in categories:
+                categories.append(label)
+        lookup = {label: code for code, label in enumerate(categories)}
+        return values.map(lookup).astype(float).to_numpy()
+
+    def known_sources(self) -> list:
+        """
+        SOURCES plus any other coin already integrated into the store.
+        """
+        return list(dict.fromkeys([*SOURCES, *self.meta["watermarks"]]))
+
+    def update(self, sources=None) -> dict:
+        """
+        Integrate rows appended to the source CSVs since the last update.
+
+        Parameters:
+            sources (list): Source names to refresh (default: known_sources())
+
+        Returns:
+            dict: Number of new rows integrated per source
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with file_lock(self.lock_path):
+            self.meta = self._load_meta()
+            added = self._update(list(sources or self.known_sources()))
+            self._save_meta()
+        return added
+
+    def _update(self, sources: list) -> dict:
+        added = {}
+        frames = {}
+        for name in sources:
+            csv_path, mapping = source(name)
+            if not os.path.exists(csv_path):
+                continue
+            watermark = self.meta["watermarks"].get(name)
+            start = pd.Timestamp(watermark) + pd.Timedelta(days=1) if watermark else None
+            df = read_rows(csv_path, start=start)
+            df["date"] = pd.to_datetime(df["date"], utc=True).dt.tz_localize(None).dt.normalize()
+            df = df.drop_duplicates("date").sort_values("date")
+            added[name] = len(df)
+            if not df.empty:
+                frames[name] = df
+        if not frames:
+            return added
+
+        first_date = min(df["date"].iat[0] for df in frames.values())
+        if self.meta["start_date"] is None:
+            self.meta["start_date"] = first_date.date().isoformat()
+        elif first_date < pd.Timestamp(self.meta["start_date"]):
+            # History now starts before the index: rebuild every source from scratch.
+            known = list(dict.fromkeys(self.known_sources() + sources))
+            self._reset()
+            return self._update(known)
+
+        # Columns and rows for all sources are added at once, so the file is rewritten at most once.
+        missing = [col for name in frames for col in source(name)[1].values() if col not in self.meta["columns"]]
+        if missing:
+            self._add_columns(missing)
+        self._grow(max(int(self._row(df["date"]).max()) for df in frames.values()) + 1)
+
+        position = {col: i for i, col in enumerate(self.meta["columns"])}
+        matrix = self.values(mode="r+")
+        for name, df in frames.items():
+            rows = self._row(df["date"])
+            for csv_col, store_col in source(name)[1].items():
+                if csv_col in df.columns:
+                    matrix[rows, position[store_col]] = self._encode(store_col, df[csv_col])
+            self.meta["watermarks"][name] = df["date"].iat[-1].date().isoformat()
+        matrix.flush()
+        del matrix
+        return added
+
+    def values(self, mode: str = "r") -> np.memmap:
+        """
+        The whole (days, columns) matrix as a memory map.
+        """
+        return np.memmap(self.values_path, dtype=np.float64, mode=mode,
+                         shape=(self.meta["rows"], len(self.meta["columns"])))
+
+    def dates(self) -> pd.DatetimeIndex:
+        return pd.date_range(self.meta["start_date"], periods=self.meta["rows"], freq="D")
+
+    def frame(self, columns: list, start=None, end=None) -> pd.DataFrame:
+        """
+        DataFrame over a date range for the given store columns, built on the memmap without copying
+        when the columns are contiguous. Categorical columns are decoded back to labels.
+        """
+        dates = self.dates()
+        lo = 0 if start is None else max(0, dates.searchsorted(pd.Timestamp(start)))
+        hi = len(dates) if end is None else dates.searchsorted(pd.Timestamp(end), side="right")
+        index = [self.meta["columns"].index(col) for col in columns]
+        matrix = self.values()
+        if index and index == list(range(index[0], index[0] + len(index))):
+            block = matrix[lo:hi, index[0]:index[0] + len(index)]
+        else:
+            block = matrix[lo:hi][:, index]
+        df = pd.DataFrame(block, index=dates[lo:hi], columns=columns, copy=False)
+        for col in CATEGORICAL.intersection(columns):
+            labels = pd.Series(self.meta["categories"].get(col, []), dtype=object)
+            df[col] = df[col].map(labels)
+        df.index.name = "date"
+        return df
+
+    def coin_dates(self, short: str, start=None, end=None) -> pd.DatetimeIndex:
+        """
+        Days of coin_frame(short), read from three columns instead of building the frame.
+        """
+        present = self.frame(_complete_columns(short), start, end).notna().all(axis=1)
+        return present.index[present.to_numpy()]
+
+    def coin_frame(self, short: str, start=None, end=None) -> pd.DataFrame:
+        """
+        One coin's technicals joined with FGI and macro data on the days all three are present, with
+        the source CSV column names and a `date` column: the frame the per-coin inner merge of the
+        CSVs used to produce.
+        """
+        mapping = {**source(short)[1], **SOURCES["fgi"][1], **SOURCES["macro"][1]}
+        df = self.frame(list(mapping.values()), start, end)
+        df = df[df[_complete_columns(short)].notna().all(axis=1)]
+        df = df.rename(columns={store_col: csv_col for csv_col, store_col in mapping.items()}).reset_index()
+        df["value"] = df["value"].astype(int)
+        df["market_closed"] = df["market_closed"].astype(bool)
+        return df
+
+
+def main():
+    added = FeatureStore().update()
+    print(f"Feature store updated: {added}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,29 @@
 import pandas as pd
-import pandas_ta as ta
-import requests
-import time
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from etl import cassette, indicators, universe
+from etl.feature_store import FeatureStore
+from etl.http import TokenBucket, get_session
+from etl.locks import file_lock
 from etl.to_csv import append_unique_rows
 
+BINANCE_API_URL = os.getenv("BINANCE_API_URL", "https://api.binance.com")
+KLINES_URL = f"{BINANCE_API_URL}/api/v3/klines"
+KLINE_COLUMNS = [
+    "open_time", "open", "high", "low", "close", "volume",
+    "close_time", "quote_asset_volume", "num_trades",
+    "taker_buy_base", "taker_buy_quote", "ignore"
+]
+INTERVAL_MS = {
+    "1m": 60_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "6h": 21_600_000,
+    "12h": 43_200_000, "1d": 86_400_000, "1w": 604_800_000,
+}
+
+# Binance allows 6000 request weight per minute per IP; keep some headroom for other clients.
+REQUEST_WEIGHT_PER_MINUTE = 5000
+rate_limiter = TokenBucket(REQUEST_WEIGHT_PER_MINUTE, period=60.0)
+
 def fetch_ohlcv_binance_full(symbol="BTCUSDT", interval="1d", start_date="2018-02-01", days=4000):
     """
     Fetch up to `days` of OHLCV data by paginating Binance API (1000 data limit per request).
@@ -12,16 +32,15 @@ def fetch_ohlcv_binance_full(symbol="BTCUSDT", interval="1d", start_date="2018-0
         symbol (str): Trading pair (e.g., 'BTCUSDT')
         interval (str): Interval (e.g., '1d')
         start_date (str): Start date in 'YYYY-MM-DD' format
-        days (int): Total number of days to fetch
+        days (int): Total number of candles to fetch (days for '1d')
 
     Returns:
         pd.DataFrame: Full OHLCV data
     """
-    url = "https://api.binance.com/api/v3/klines"
     all_data = []
     limit = 1000
     start_ts = int(pd.to_datetime(start_date).timestamp() * 1000)
-    one_day_ms = 24 * 60 * 60 * 1000
+    step_ms = INTERVAL_MS[interval]
     total_batches = (days // limit) + (1 if days % limit else 0)
 
     for _ in range(total_batches):
@@ -31,16 +50,13 @@ def fetch_ohlcv_binance_full(symbol="BTCUSDT", interval="1d", start_date="2018-0
             "startTime": start_ts,
             "limit": min(limit, days)
         }
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        batch = response.json()
+        batch = _get_klines(params)
         if not batch:
             break
 
         all_data.extend(batch)
-        start_ts = batch[-1][0] + one_day_ms
+        start_ts = batch[-1][0] + step_ms
         days -= limit
-        time.sleep(0.5)  # Avoid hitting rate limits
 
     df = pd.DataFrame(all_data, columns=[
         "open_time", "open", "high", "low", "close", "volume",
@@ -65,7 +81,6 @@ def fetch_ohlcv_binance(symbol: str, interval="1d", limit=250):
         pd.DataFrame: DataFrame with date, open, high, low, close, volume
     """
 
-    url = "https://api.binance.com/api/v3/klines"
     params = {
         "symbol": symbol.upper(),
         "interval": interval,
@@ -73,9 +88,7 @@ def fetch_ohlcv_binance(symbol: str, interval="1d", limit=250):
     }
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = _get_klines(params)
     except Exception as e:
         print(f"Error: {e}")
         exit(1)
@@ -86,6 +99,9 @@ def fetch_ohlcv_binance(symbol: str, interval="1d", limit=250):
         "taker_buy_base", "taker_buy_quote", "ignore"
     ])
 
+    # Today's candle is still open; its close would change after being stored.
+    df = df[df["close_time"] < cassette.now() * 1000].copy()
+
     # Process relevant columns
     df["date"] = pd.to_datetime(df["open_time"], unit="ms").dt.date
     df[["open", "high", "low", "close", "volume"]] = df[["open", "high", "low", "close", "volume"]].astype(float)
@@ -93,57 +109,260 @@ def fetch_ohlcv_binance(symbol: str, interval="1d", limit=250):
     df = df[["date", "symbol", "open", "high", "low", "close", "volume"]]
     return df
 
-def calculate_indicators(df: pd.DataFrame) -> pd.DataFrame:
+def kline_weight(limit: int) -> int:
+    """
+    Request weight Binance charges for a klines call with the given `limit`.
+    """
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+def _get_klines(params: dict) -> list:
+    """
+    GET /api/v3/klines through the pooled session, paying the request weight to the shared limiter.
+    Backs off on 429/418 for as long as Binance asks. Replayed responses cost no weight.
+    """
+    session = get_session()
+    while True:
+        if not cassette.replaying():
+            rate_limiter.acquire(kline_weight(params["limit"]))
+        response = session.get(KLINES_URL, params=params, timeout=10)
+        if response.status_code in (418, 429):
+            retry_after = float(response.headers.get("Retry-After", 60))
+            print(f"Binance rate limit hit, backing off {retry_after:.0f}s")
+            rate_limiter.drain(retry_after)
+            continue
+        response.raise_for_status()
+        return response.json()
+
+def iter_klines(symbol: str, start_ms: int, interval="1d", end_ms: int = None):
+    """
+    Yield raw kline pages (lists of at most 1000 rows) opening at or after `start_ms`, one request
+    at a time, so callers can write each page out before the next one is fetched.
+
+    Parameters:
+        symbol (str): Trading pair symbol (e.g., BTCUSDT)
+        start_ms (int): Open time of the first wanted candle, in epoch milliseconds
+        interval (str): Candlestick interval (e.g., '1d', '4h', etc.)
+        end_ms (int): Optional open time bound, defaults to now
+    """
+    step_ms = INTERVAL_MS[interval]
+    end_ms = end_ms if end_ms is not None else int(cassette.now() * 1000)
+
+    while start_ms <= end_ms:
+        # Ask for no more candles than are missing so the request weight stays minimal.
+        missing = (end_ms - start_ms) // step_ms + 1
+        params = {
+            "symbol": symbol.upper(),
+            "interval": interval,
+            "startTime": start_ms,
+            "limit": int(min(1000, missing))
+        }
+        batch = _get_klines(params)
+        if not batch:
+            return
+        yield batch
+        start_ms = batch[-1][0] + step_ms
+        if len(batch) < params["limit"]:
+            return
+
+def fetch_ohlcv_binance_since(symbol: str, start_ms: int, interval="1d", end_ms: int = None):
+    """
+    Fetch every closed candle opening at or after `start_ms`, paginating 1000 candles per request.
+
+    Parameters:
+        symbol (str): Trading pair symbol (e.g., BTCUSDT)
+        start_ms (int): Open time of the first wanted candle, in epoch milliseconds
+        interval (str): Candlestick interval (e.g., '1d', '4h', etc.)
+        end_ms (int): Optional open time bound, defaults to now
+
+    Returns:
+        pd.DataFrame: DataFrame with date, symbol, open, high, low, close, volume
+    """
+    now_ms = int(cassette.now() * 1000)
+    all_data = [row for batch in iter_klines(symbol, start_ms, interval, end_ms)
+                for row in batch if row[6] < now_ms]
+
+    df = pd.DataFrame(all_data, columns=KLINE_COLUMNS)
+    df["date"] = pd.to_datetime(df["open_time"], unit="ms").dt.date
+    df[["open", "high", "low", "close", "volume"]] = df[["open", "high", "low", "close", "volume"]].astype(float)
+    df["symbol"] = symbol
+    return df[["date", "symbol", "open", "high", "low", "close", "volume"]]
+
+def calculate_indicators(df: pd.DataFrame, state: dict = None) -> tuple:
     """
     Given a OHLCV DataFrame with 'close' column, compute:
     - SMA20, SMA50, SMA200
     - RSI
     - MACD (macd line only)
     - Daily % change
-    Returns new DataFrame with added columns.
+
+    Only the rows of `df` are computed. `state` is the rolling indicator state left by the
+    candle just before the first row (see etl.indicators); when omitted, `df` is the full history.
+
+    Returns:
+        tuple: (new DataFrame with added columns, updated indicator state)
     """
 
     df = df.copy()
+    columns, state = indicators.update(state, df["close"].to_numpy())
+    for name, values in columns.items():
+        df[name] = pd.Series(values, index=df.index).round(2)
 
-    # Simple Moving Averages
-    df['sma_20'] = ta.sma(df['close'], length=20).round(2)
-    df['sma_50'] = ta.sma(df['close'], length=50).round(2)
-    df['sma_200'] = ta.sma(df['close'], length=200).round(2)
+    return df, state
 
-    # RSI
-    df['rsi'] = ta.rsi(df['close'], length=14).round(2)
+def technical_lock(csv_path: str):
+    """
+    Lock held while appending to a technical CSV; the stream checkpointer writes the same files.
+    """
+    return file_lock(f"{csv_path}.lock")
 
-    # MACD
-    macd = ta.macd(df['close'], fast=12, slow=26, signal=9)
-    df['macd'] = macd['MACD_12_26_9'].round(2)
+def last_stored_date(csv_path: str):
+    """
+    Read the date of the last row of a technical CSV without loading the whole file.
 
-    # Daily percentage change
-    df['pct_change'] = (df['close'].pct_change() * 100).round(2)
+    Returns:
+        str | None: 'YYYY-MM-DD' date of the last stored candle, or None if the file is missing or empty
+    """
+    if not os.path.exists(csv_path):
+        return None
+    with open(csv_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        lines = [line for line in f.read().decode("utf-8").splitlines() if line.strip()]
+    if not lines or lines[-1].startswith("date,"):
+        return None
+    return lines[-1].split(",", 1)[0]
 
+def load_indicator_state(csv_path: str, state: dict = None) -> dict:
+    """
+    Return the indicator state matching the stored history in `csv_path`.
 
-    return df
+    The saved state is trusted when it ends on the same date as the CSV; otherwise it is
+    rebuilt once from the stored closes.
+    """
+    last_date = last_stored_date(csv_path)
+    if last_date is None:
+        return None
+    if state is not None and state.get("last_date") == last_date:
+        return state
 
-def main():
-    
-    symbol_matching = {
-        "BTCUSDT": "BTC",
-        "ETHUSDT": "ETH",
-        "BNBUSDT": "BNB",
-        "XRPUSDT": "XRP",
-        "ADAUSDT": "ADA",
-        "SOLUSDT": "SOL",
-    }
+    stored = pd.read_csv(csv_path, usecols=["date", "close"])
+    _, state = indicators.compute_full(stored["close"].to_numpy())
+    state["last_date"] = last_date
+    return state
+
+def update_symbol(sym: str, short: str, state: dict = None, delta: bool = True) -> dict:
+    """
+    Fetch new candles for one symbol, compute their indicators and append them to its technical CSV.
+
+    With `delta`, only the range after the last stored date is requested; otherwise the latest
+    250 candles are fetched and the already stored ones dropped.
+
+    Returns:
+        dict: Updated indicator state for the symbol
+    """
+    csv_path = f"data/{short.lower()}_technical.csv"
+    state = load_indicator_state(csv_path, state)
 
-    for sym, short in symbol_matching.items():
+    if not delta:
         df = fetch_ohlcv_binance(symbol=sym)
-        df = calculate_indicators(df)   
+    elif state is None:
+        # Nothing stored yet: pull the whole listing history so indicators start from the first candle.
+        df = fetch_ohlcv_binance_since(sym, 0)
+    else:
+        start_ms = int(pd.Timestamp(state["last_date"]).timestamp() * 1000) + INTERVAL_MS["1d"]
+        # The next candle is only stored once it has closed.
+        if start_ms + INTERVAL_MS["1d"] > cassette.now() * 1000:
+            print(f"{short} is up to date.")
+            return state
+        df = fetch_ohlcv_binance_since(sym, start_ms)
+
+    if state is not None:
+        # Candles already stored keep their values; only the new ones go through the engine.
+        df = df[df["date"].astype(str) > state["last_date"]]
+
+    if df.empty:
+        print(f"No new {short} candles from Binance.")
+        return state
+
+    df, state = calculate_indicators(df, state)
+    state["last_date"] = str(df["date"].iloc[-1])
+    print(f"Fetched {len(df)} rows of {short} data.")
+
+    with technical_lock(csv_path):
+        append_unique_rows(df, csv_path, subset_cols=["date"])
+    return state
+
+def update_shard(symbol_matching: dict, mode: str = "delta", max_workers: int = 6, request_weight: float = None) -> dict:
+    """
+    Update the technical CSVs of one shard of the universe.
+
+    Parameters:
+        symbol_matching (dict): Binance pair -> coin short name
+        mode (str): 'delta' or 'window' (see main())
+        max_workers (int): Symbols fetched in parallel in delta mode
+        request_weight (float): Request weight per minute this process may use; set when shards
+            run in separate processes so their limiters add up to REQUEST_WEIGHT_PER_MINUTE
+
+    Returns:
+        dict: Updated indicator state per pair of the shard
+    """
+    global rate_limiter
+    if request_weight is not None:
+        rate_limiter = TokenBucket(request_weight, period=60.0)
+
+    saved = indicators.load_states()
+    states = {sym: saved[sym] for sym in symbol_matching if sym in saved}
+    if mode == "window":
+        for sym, short in symbol_matching.items():
+            states[sym] = update_symbol(sym, short, states.get(sym), delta=False)
+    else:
+        # Delta mode: each symbol only asks for the candles after its last stored date.
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(update_symbol, sym, short, states.get(sym)): sym
+                for sym, short in symbol_matching.items()
+            }
+            for future in as_completed(futures):
+                sym = futures[future]
+                try:
+                    states[sym] = future.result()
+                except Exception as e:
+                    print(f"Error fetching {sym}: {e}")
+    return states
+
+def main(mode: str = "delta", max_workers: int = 6, symbol_matching: dict = None, processes: int = None):
+    """
+    Update every technical CSV.
+
+    The universe is split into shards of about universe.SHARD_SIZE pairs, each updated by its own
+    worker process, so memory stays bounded by one shard per process however many pairs are tracked.
+
+    Parameters:
+        mode (str): 'delta' fetches only missing candles, concurrently per symbol;
+            'window' re-fetches the latest 250 candles one symbol at a time
+        max_workers (int): Symbols fetched in parallel per shard in delta mode
+        symbol_matching (dict): Binance pair -> coin short name (default: universe.load_universe())
+        processes (int): Shards updated at the same time (default: universe.PROCESSES)
+    """
+
+    symbol_matching = symbol_matching or universe.load_universe()
+    shards = universe.shard(symbol_matching, universe.shard_count(symbol_matching))
+    processes = min(processes or universe.PROCESSES, len(shards))
 
-        if df.empty:
-            print("No data fetched from Binance.")
-        else:
-            print(f"Fetched {len(df)} rows of {short} data.")
+    # The processes share one IP, so they split its request weight budget.
+    request_weight = REQUEST_WEIGHT_PER_MINUTE / processes if processes > 1 else None
+    states = indicators.load_states()
+    for updated in universe.map_shards(update_shard, shards, processes, mode, max_workers, request_weight):
+        states.update(updated)
 
-        append_unique_rows(df, f"data/{short.lower()}_technical.csv", subset_cols=["date"])
+    indicators.merge_states(states)
+    FeatureStore().update([short.lower() for short in symbol_matching.values()])
 
 
 if __name__ == "__main__":
@@ -1,11 +1,15 @@
-import requests
+import os
 import pandas as pd
+from etl.feature_store import FeatureStore
+from etl.http import get_session
 from etl.to_csv import append_unique_rows
 
+FGI_URL = os.getenv("FGI_URL", "https://api.alternative.me/fng/")
 
 
-def fetch_fgi(url='https://api.alternative.me/fng/?limit=250', timeout=10):
-    response = requests.get(url, timeout=timeout)
+
+def fetch_fgi(url=f'{FGI_URL}?limit=250', timeout=10):
+    response = get_session().get(url, timeout=timeout)
     response.raise_for_status()
 
     data = response.json()
@@ -32,6 +36,7 @@ def main():
     raw = fetch_fgi()
     if raw is not None:
         append_unique_rows(raw, 'data/fgi.csv', subset_cols=["date"])
+        FeatureStore().update(["fgi"])
     else:
         print("No FGI data available.")
 
@@ -1,53 +1,204 @@
+import json
+from io import StringIO
 import pandas as pd
-from fredapi import Fred
-import yfinance as yf
 import os
+import threading
+import time
+from etl import cassette
+from etl.feature_store import FeatureStore
+from etl.storage import read_last_row
 from etl.to_csv import append_unique_rows
+from etl.tracing import span
 
+MACRO_FILE = "data/macro.csv"
+# Date of the newest observation seen per series
+WATERMARK_FILE = "data/macro_watermarks.json"
+FRED_SERIES = {
+    "cpi": "CPIAUCSL",
+    "interest_rate": "FEDFUNDS",
+    "sp500": "SP500",
+}
+SERIES = [*FRED_SERIES, "dxy"]
+# Days re-requested before a watermark, so revised or late observations are picked up
+REVISION_LOOKBACK_DAYS = {"cpi": 95, "interest_rate": 35, "sp500": 7, "dxy": 7}
+# Seconds a daily run waits for the series; slower ones are retried on the next run
+FETCH_TIMEOUT = float(os.getenv("MACRO_FETCH_TIMEOUT", 60))
+
+
+def fetch_series(name: str, start_date, end_date=None) -> pd.Series:
+    """
+    Observations of one macro series from `start_date` on, indexed by date.
+
+    fredapi and yfinance bring their own transport, so record/replay happens per series here
+    rather than in the pooled session.
+    """
+    return cassette.recorded(
+        "fred" if name in FRED_SERIES else "yfinance",
+        {"series": name, "start": str(start_date), "end": None if end_date is None else str(end_date)},
+        lambda: _download_series(name, start_date, end_date),
+        dump=lambda s: s.to_json(date_format="iso"),
+        restore=lambda text: _restore_series(text, name),
+    )
+
+
+def _restore_series(text: str, name: str) -> pd.Series:
+    s = pd.read_json(StringIO(text), typ="series", dtype=float)
+    s.index = pd.to_datetime(s.index).tz_localize(None)
+    s.name = name
+    return s
+
+
+def _download_series(name: str, start_date, end_date=None) -> pd.Series:
+    # Client libraries are imported on first use; replays and the CLI never load them
+    if name in FRED_SERIES:
+        from fredapi import Fred
+
+        fred = Fred(api_key=os.getenv("FRED_API_KEY"))
+        with span("http", target="fred", series=FRED_SERIES[name], since=str(start_date)):
+            s = fred.get_series(FRED_SERIES[name], start_date, end_date)
+    else:
+        import yfinance as yf
+
+        with span("http", target="yfinance", ticker="DX-Y.NYB", since=str(start_date)):
+            s = yf.download("DX-Y.NYB", start=start_date, end=end_date, interval="1d", auto_adjust=False,
+                            progress=False, timeout=FETCH_TIMEOUT)["Close"]
+        if isinstance(s, pd.DataFrame):
+            s = s.iloc[:, 0]
+    s = s.dropna()
+    s.index = pd.to_datetime(s.index).tz_localize(None).normalize()
+    s.name = name
+    return s
+
+
+def fetch_all(starts: dict, end_date=None, timeout: float = None) -> dict:
+    """
+    Fetch every series from its own start date concurrently.
+
+    Series that fail, or are not back within `timeout` seconds, are left out of the result rather
+    than holding up the run; main() then writes no rows and keeps the watermarks, so the days
+    are filled in by the next run that gets every series. fredapi has no request timeout, so each series is fetched on a daemon thread
+    that a late answer cannot keep alive past the end of the run.
+    """
+    results, errors = {}, {}
+
+    def fetch(name, start):
+        try:
+            results[name] = fetch_series(name, start, end_date)
+        except Exception as e:
+            errors[name] = e
+
+    threads = {name: threading.Thread(target=fetch, args=(name, start), name=f"macro-{name}", daemon=True)
+               for name, start in starts.items()}
+    for thread in threads.values():
+        thread.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for thread in threads.values():
+        thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    observations = {}
+    for name, thread in threads.items():
+        if thread.is_alive():
+            print(f"⚠️ {name} did not answer within {timeout:.0f}s, retrying next run")
+        elif name in errors:
+            print(f"⚠️ Could not fetch {name}: {errors[name]}")
+        else:
+            observations[name] = results[name]
+    return observations
 
-def fetch_macro_data(start_date="2018-02-1", end_date=None):
-    FRED_API_KEY = os.getenv("FRED_API_KEY")
-    fred = Fred(api_key=FRED_API_KEY)
-
-    # FRED series
-    fred_series = {
-        "cpi": "CPIAUCSL",
-        "interest_rate": "FEDFUNDS",
-        "sp500": "SP500"
-    }
-
-    df_list = []
-    for name, series_id in fred_series.items():
-        s = fred.get_series(series_id, start_date, end_date)
-        s.name = name
-        df_list.append(s)
-
-    fred_df = pd.concat(df_list, axis=1)
-
-    # Fetch DXY from Yahoo Finance
-    dxy = yf.download("DX-Y.NYB", start=start_date, end=end_date, interval="1d", auto_adjust=False)["Close"]
-    dxy.name = "dxy"
-
-    # Merge and detect market closed days
-    macro_df = pd.concat([fred_df, dxy], axis=1)
-    full_index = pd.date_range(start=macro_df.index.min(), end=macro_df.index.max(), freq="D")
-    macro_df = macro_df.reindex(full_index)
-    macro_df.index.name = "date"
+
+def build_daily(observations: dict, last_row: pd.Series = None) -> pd.DataFrame:
+    """
+    Daily rows after `last_row` (or from the first observation) up to the newest observation.
+
+    Values are forward-filled from the observations, continuing from `last_row` for series with
+    nothing newer, and market_closed marks days on which no series has an observation. Rows are
+    stored for good, so none are built while a series is missing from `observations` (failed or
+    timed out): its values after `last_row` are unknown, and the next run fills those days in.
+    """
+    columns = ["date", "dxy", "sp500", "cpi", "interest_rate", "market_closed"]
+    if any(name not in observations for name in SERIES):
+        return pd.DataFrame(columns=columns)
+    observed = pd.concat(list(observations.values()), axis=1).reindex(columns=SERIES) if observations else None
+    if observed is None or observed.dropna(how="all").empty:
+        return pd.DataFrame(columns=columns)
+    observed = observed.dropna(how="all").sort_index()
+
+    first = observed.index.min() if last_row is None else pd.Timestamp(last_row["date"]) + pd.Timedelta(days=1)
+    days = pd.date_range(start=first, end=observed.index.max(), freq="D")
+    if days.empty:
+        return pd.DataFrame(columns=columns)
+
+    macro_df = observed.reindex(observed.index.union(days))
+    if last_row is not None:
+        # Earlier than every observation, so observations from the lookback window take precedence
+        seed = pd.DataFrame([last_row[SERIES].astype(float)], index=[macro_df.index.min() - pd.Timedelta(days=1)])
+        macro_df = pd.concat([seed, macro_df])
 
     # Detect missing data before fill
-    macro_df["market_closed"] = macro_df[["cpi", "interest_rate", "sp500", "DX-Y.NYB"]].isna().all(axis=1)
+    market_closed = observed.reindex(days).isna().all(axis=1)
 
     # Forward fill and round
-    macro_df = macro_df.ffill().round(2).reset_index()
+    macro_df = macro_df.ffill().reindex(days).round(2)
+    macro_df["market_closed"] = market_closed
+    macro_df.index.name = "date"
+    return macro_df.reset_index()[columns]
+
+
+def fetch_macro_data(start_date="2018-02-1", end_date=None):
+    """
+    The full daily macro frame since `start_date`.
+    """
+    return build_daily(fetch_all({name: start_date for name in SERIES}, end_date))
+
+
+def load_watermarks(path: str = WATERMARK_FILE) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_watermarks(watermarks: dict, path: str = WATERMARK_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(watermarks, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main(start_date="2018-02-1"):
+    """
+    Extend data/macro.csv with the days since its last row, asking each series only for the
+    observations after its watermark (less REVISION_LOOKBACK_DAYS).
+    """
+    last_row = read_last_row(MACRO_FILE)
+
+    if last_row is None:
+        # First run: the whole history, waiting for every series so no column starts out empty
+        observations = fetch_all({name: start_date for name in SERIES})
+    else:
+        watermarks = load_watermarks()
+        starts = {}
+        for name in SERIES:
+            watermark = pd.Timestamp(watermarks.get(name, last_row["date"]))
+            starts[name] = (watermark - pd.Timedelta(days=REVISION_LOOKBACK_DAYS[name])).date().isoformat()
+        observations = fetch_all(starts, timeout=FETCH_TIMEOUT)
+
+    missing = [name for name in SERIES if name not in observations]
+    if missing:
+        # Watermarks stay put too, so the next run asks again for everything after the last row
+        print(f"No new macro rows until {', '.join(missing)} can be fetched.")
+        return
 
-    # Reorder and select columns
-    macro_df['dxy'] = macro_df['DX-Y.NYB']
-    macro_df = macro_df[["date", "dxy", "sp500", "cpi", "interest_rate", "market_closed"]]
-    return macro_df
+    df_new = build_daily(observations, last_row)
+    if len(df_new):
+        append_unique_rows(df_new, MACRO_FILE, subset_cols=["date"])
+    else:
+        print("No new macro observations.")
 
-def main():
-    df_new = fetch_macro_data()
-    append_unique_rows(df_new, 'data/macro.csv', subset_cols=["date"])
+    watermarks = load_watermarks()
+    watermarks.update({name: s.index.max().date().isoformat() for name, s in observations.items() if len(s)})
+    save_watermarks(watermarks)
+    FeatureStore().update(["macro"])
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
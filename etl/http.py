@@ -0,0 +1,81 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from etl.cassette import CassetteAdapter
+from etl.tracing import span
+
+_sessions = {}
+_session_lock = threading.Lock()
+
+
+class TracedSession(requests.Session):
+    """
+    Session that records every request as an "http" span targeted at the host.
+    """
+
+    def request(self, method, url, *args, **kwargs):
+        parts = urlsplit(url)
+        with span("http", target=parts.netloc, method=method, path=parts.path) as s:
+            response = super().request(method, url, *args, **kwargs)
+            s.set(status=response.status_code, bytes=response.headers.get("Content-Length"))
+            return response
+
+
+def get_session(pool_size: int = 16, cassettes: bool = True) -> requests.Session:
+    """
+    Return the process-wide pooled requests session shared by the ETL fetchers.
+
+    With `cassettes` (the upstream data sources) requests go through the cassette store, so
+    DIPSIGNAL_HTTP_MODE=record/replay applies to them; other callers get a plain live session.
+    """
+    with _session_lock:
+        if cassettes not in _sessions:
+            session = TracedSession()
+            adapter_class = CassetteAdapter if cassettes else HTTPAdapter
+            adapter = adapter_class(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[cassettes] = session
+    return _sessions[cassettes]
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Each request acquires its cost in tokens, which refill
+    continuously at `capacity / period` per second.
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, cost: float = 1.0):
+        cost = min(cost, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                wait = (cost - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self, seconds: float):
+        """
+        Empty the bucket and hold it empty for `seconds` (used when the server says back off).
+        """
+        with self.lock:
+            self.tokens = -seconds * self.rate
+            self.updated = time.monotonic()
@@ -0,0 +1,273 @@
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from etl.locks import file_lock
+
+SMA_WINDOWS = (20, 50, 200)
+RSI_LENGTH = 14
+MACD_FAST = 12
+MACD_SLOW = 26
+STATE_FILE = "data/indicator_state.json"
+
+# Closes kept in the state: enough to slide the longest SMA window forward.
+TAIL_LENGTH = max(SMA_WINDOWS) - 1
+# Block length for the closed-form EMA recursion; keeps decay ** -k well inside float64.
+_EWM_BLOCK = 64
+
+
+def _ewm_from(x: np.ndarray, alpha: float, prev: float) -> np.ndarray:
+    """
+    Vectorized y[t] = (1 - alpha) * y[t-1] + alpha * x[t], seeded with y[-1] = prev.
+    """
+    out = np.empty(len(x), dtype=float)
+    decay = 1.0 - alpha
+    for start in range(0, len(x), _EWM_BLOCK):
+        chunk = x[start:start + _EWM_BLOCK]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        out[start:start + len(chunk)] = powers * (prev + alpha * np.cumsum(chunk / powers))
+        prev = out[start + len(chunk) - 1]
+    return out
+
+
+def _sma(buf: np.ndarray, window: int, first_index: int, offset: int) -> np.ndarray:
+    """
+    SMA of `buf[offset:]`, where buf[0] is candle number `first_index` of the full history.
+    """
+    sums = np.concatenate(([0.0], np.cumsum(buf)))
+    idx = np.arange(offset, len(buf))
+    out = np.full(len(idx), np.nan)
+    valid = (idx + first_index) >= window - 1
+    ends = idx[valid] + 1
+    out[valid] = (sums[ends] - sums[ends - window]) / window
+    return out
+
+
+def _ema_full(close: np.ndarray, length: int):
+    """
+    EMA seeded with the SMA of the first `length` closes (pandas_ta's default).
+    """
+    out = np.full(len(close), np.nan)
+    if len(close) < length:
+        return out, None
+    seed = close[:length].mean()
+    out[length - 1] = seed
+    out[length:] = _ewm_from(close[length:], 2.0 / (length + 1), seed)
+    return out, float(out[-1])
+
+
+def _rsi_from_averages(avg_gain: np.ndarray, avg_loss: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 100.0 * avg_gain / (avg_gain + avg_loss)
+
+
+def _rsi_full(close: np.ndarray, length: int):
+    """
+    Wilder RSI: averages seeded with the mean of the first `length` changes, then smoothed with alpha = 1/length.
+    """
+    out = np.full(len(close), np.nan)
+    if len(close) <= length:
+        return out, None, None
+    change = np.diff(close)
+    gain = np.clip(change, 0, None)
+    loss = np.clip(-change, 0, None)
+    seed_gain, seed_loss = gain[:length].mean(), loss[:length].mean()
+    avg_gain = np.concatenate(([seed_gain], _ewm_from(gain[length:], 1.0 / length, seed_gain)))
+    avg_loss = np.concatenate(([seed_loss], _ewm_from(loss[length:], 1.0 / length, seed_loss)))
+    out[length:] = _rsi_from_averages(avg_gain, avg_loss)
+    return out, float(avg_gain[-1]), float(avg_loss[-1])
+
+
+def compute_full(close) -> tuple:
+    """
+    Recompute every indicator over a complete close history.
+
+    Parameters:
+        close (array-like): Close prices, oldest first, starting at the first candle ever stored
+
+    Returns:
+        tuple: (dict of unrounded indicator arrays, state to continue from with update())
+    """
+    close = np.asarray(close, dtype=float)
+    columns = {f"sma_{w}": _sma(close, w, 0, 0) for w in SMA_WINDOWS}
+    columns["rsi"], avg_gain, avg_loss = _rsi_full(close, RSI_LENGTH)
+    ema_fast, fast_state = _ema_full(close, MACD_FAST)
+    ema_slow, slow_state = _ema_full(close, MACD_SLOW)
+    columns["macd"] = ema_fast - ema_slow
+    pct = np.full(len(close), np.nan)
+    pct[1:] = (close[1:] / close[:-1] - 1.0) * 100
+    columns["pct_change"] = pct
+
+    state = {
+        "count": int(len(close)),
+        "tail": close[-TAIL_LENGTH:].tolist(),
+        "ema_fast": fast_state,
+        "ema_slow": slow_state,
+        "avg_gain": avg_gain,
+        "avg_loss": avg_loss,
+    }
+    return columns, state
+
+
+def update(state: dict, close) -> tuple:
+    """
+    Compute indicators for new candles only, continuing from a saved rolling state.
+
+    Parameters:
+        state (dict | None): State returned by compute_full()/update(), or None for an empty history
+        close (array-like): Close prices of the new candles, oldest first
+
+    Returns:
+        tuple: (dict of unrounded indicator arrays for the new candles, updated state)
+    """
+    close = np.asarray(close, dtype=float)
+    tail = np.asarray(state["tail"], dtype=float) if state else np.empty(0)
+    count = state["count"] if state else 0
+
+    # While the whole history still fits in the tail a full recompute is exact and just as cheap.
+    if count <= TAIL_LENGTH:
+        columns, new_state = compute_full(np.concatenate((tail, close)))
+        columns = {name: values[count:] for name, values in columns.items()}
+        new_state = {**(state or {}), **new_state}
+        return columns, new_state
+
+    if len(close) == 0:
+        return {name: np.empty(0) for name in [f"sma_{w}" for w in SMA_WINDOWS] + ["rsi", "macd", "pct_change"]}, state
+
+    buf = np.concatenate((tail, close))
+    first_index = count - len(tail)
+    columns = {f"sma_{w}": _sma(buf, w, first_index, len(tail)) for w in SMA_WINDOWS}
+
+    change = np.diff(buf[len(tail) - 1:])
+    avg_gain = _ewm_from(np.clip(change, 0, None), 1.0 / RSI_LENGTH, state["avg_gain"])
+    avg_loss = _ewm_from(np.clip(-change, 0, None), 1.0 / RSI_LENGTH, state["avg_loss"])
+    columns["rsi"] = _rsi_from_averages(avg_gain, avg_loss)
+
+    ema_fast = _ewm_from(close, 2.0 / (MACD_FAST + 1), state["ema_fast"])
+    ema_slow = _ewm_from(close, 2.0 / (MACD_SLOW + 1), state["ema_slow"])
+    columns["macd"] = ema_fast - ema_slow
+    columns["pct_change"] = (buf[len(tail):] / buf[len(tail) - 1:-1] - 1.0) * 100
+
+    new_state = {
+        **state,
+        "count": int(count + len(close)),
+        "tail": buf[-TAIL_LENGTH:].tolist(),
+        "ema_fast": float(ema_fast[-1]),
+        "ema_slow": float(ema_slow[-1]),
+        "avg_gain": float(avg_gain[-1]),
+        "avg_loss": float(avg_loss[-1]),
+    }
+    return columns, new_state
+
+
+def step(state: dict, close: float) -> dict:
+    """
+    Indicator values for one more candle closing at `close`, without advancing `state`.
+
+    Same results as update() with a single close, in scalar arithmetic: the live stream calls
+    it on every tick of the still-open candle, where array setup would dominate the cost.
+    """
+    if not state or state["count"] <= TAIL_LENGTH:
+        columns, _ = update(state, [close])
+        return {name: float(values[-1]) for name, values in columns.items()}
+
+    tail = state["tail"]
+    values = {f"sma_{w}": (math.fsum(tail[len(tail) - w + 1:]) + close) / w for w in SMA_WINDOWS}
+    change = close - tail[-1]
+    alpha = 1.0 / RSI_LENGTH
+    avg_gain = (1.0 - alpha) * state["avg_gain"] + alpha * max(change, 0.0)
+    avg_loss = (1.0 - alpha) * state["avg_loss"] + alpha * max(-change, 0.0)
+    values["rsi"] = 100.0 * avg_gain / (avg_gain + avg_loss) if avg_gain + avg_loss else float("nan")
+    fast, slow = 2.0 / (MACD_FAST + 1), 2.0 / (MACD_SLOW + 1)
+    values["macd"] = ((1.0 - fast) * state["ema_fast"] + fast * close) - ((1.0 - slow) * state["ema_slow"] + slow * close)
+    values["pct_change"] = (close / tail[-1] - 1.0) * 100
+    return values
+
+
+def load_states(path: str = STATE_FILE) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_states(states: dict, path: str = STATE_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(states, f)
+    os.replace(tmp_path, path)
+
+
+def merge_states(updated: dict, path: str = STATE_FILE) -> dict:
+    """
+    Write `updated` states into the state file under its lock, keeping whichever of the stored and
+    the updated state of a pair reaches the later date, so concurrent writers (fetch_binance, the
+    stream checkpointer) never roll a pair back or drop each other's pairs.
+
+    Returns:
+        dict: Every stored state after the merge
+    """
+    with file_lock(f"{path}.lock"):
+        states = load_states(path)
+        for pair, state in updated.items():
+            stored = states.get(pair)
+            if state is not None and (stored is None or stored.get("last_date", "") <= state.get("last_date", "")):
+                states[pair] = state
+        save_states(states, path)
+    return states
+
+
+def verify_incremental(close, max_chunk: int = 10, seed: int = 0) -> dict:
+    """
+    Feed `close` through update() in random-sized chunks and compare with compute_full() over the whole history.
+
+    Returns:
+        dict: Maximum absolute difference per indicator column
+    """
+    close = np.asarray(close, dtype=float)
+    expected, _ = compute_full(close)
+    rng = np.random.default_rng(seed)
+
+    parts = {name: [] for name in expected}
+    state, pos = None, 0
+    while pos < len(close):
+        step = int(rng.integers(1, max_chunk + 1))
+        columns, state = update(state, close[pos:pos + step])
+        for name, values in columns.items():
+            parts[name].append(values)
+        pos += step
+
+    diffs = {}
+    for name, values in expected.items():
+        actual = np.concatenate(parts[name])
+        if not np.array_equal(np.isnan(actual), np.isnan(values)):
+            diffs[name] = np.inf
+            continue
+        mask = ~np.isnan(values)
+        diffs[name] = float(np.max(np.abs(actual[mask] - values[mask]), initial=0.0))
+    return diffs
+
+
+def main():
+    """
+    Test harness: replay every stored technical history incrementally and check it matches a full recompute.
+    """
+    failed = False
+    for name in sorted(os.listdir("data")):
+        if not name.endswith("_technical.csv"):
+            continue
+        close = pd.read_csv(os.path.join("data", name), usecols=["close"])["close"].to_numpy()
+        diffs = verify_incremental(close)
+        worst = max(diffs.values())
+        status = "OK" if worst < 1e-6 else "MISMATCH"
+        failed = failed or status != "OK"
+        print(f"{status} {name}: {len(close)} candles, max abs diff {worst:.2e}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
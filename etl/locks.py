@@ -0,0 +1,86 @@
+import os
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+
+# A lock file of another host older than this belongs to a crashed process.
+STALE_LOCK_SECONDS = 60
+
+
+def pid_alive(pid: int) -> bool:
+    """
+    Whether a process with this PID is running on this host.
+    """
+    if os.name == "nt":
+        # os.kill(pid, 0) would terminate the process on Windows
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_owner(lock_path: str) -> str:
+    with open(lock_path) as f:
+        return f.read()
+
+
+def _is_stale(lock_path: str, owner: str, stale_seconds: float) -> bool:
+    """
+    Whether the holder recorded in `owner` ("host pid token") is gone: its process has exited when
+    it is on this host, otherwise the lock is older than `stale_seconds`.
+    """
+    host, _, rest = owner.partition(" ")
+    pid = rest.split(" ")[0]
+    if host == socket.gethostname() and pid.isdigit():
+        return not pid_alive(int(pid))
+    return time.time() - os.path.getmtime(lock_path) > stale_seconds
+
+
+@contextmanager
+def file_lock(lock_path: str, stale_seconds: float = STALE_LOCK_SECONDS):
+    """
+    Cross-process lock held by exclusively creating `lock_path`; works on every OS and filesystem.
+
+    The file records its holder, so a lock left by a crashed process is taken over and a holder
+    only ever removes its own lock.
+    """
+    owner = f"{socket.gethostname()} {os.getpid()} {uuid.uuid4().hex}"
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                holder = _read_owner(lock_path)
+                if _is_stale(lock_path, holder, stale_seconds) and _read_owner(lock_path) == holder:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.05)
+    try:
+        os.write(fd, owner.encode())
+    finally:
+        os.close(fd)
+    try:
+        yield
+    finally:
+        try:
+            if _read_owner(lock_path) == owner:
+                os.remove(lock_path)
+        except FileNotFoundError:
+            pass
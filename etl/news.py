@@ -2,8 +2,14 @@ import feedparser
 from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import json
 import os
 import re
+from etl.http import get_session
+from etl.news_dedup import NewsIndex
+from etl.news_queue import NewsQueue
+from etl.tracing import span
 
 # RSS Feed URLs
 FEEDS = {
@@ -11,8 +17,34 @@ FEEDS = {
     "Cointelegraph": "https://cointelegraph.com/rss",
     "Decrypt": "https://decrypt.co/feed"
 }
+# Optional JSON file {"source name": "feed url", ...} replacing FEEDS
+FEEDS_FILE = os.getenv("NEWS_FEEDS_FILE", "data/feeds.json")
+# ETag / Last-Modified per feed URL from the previous run
+VALIDATORS_FILE = "data/feed_validators.json"
+ARTICLE_COLUMNS = ["date", "source", "title", "summary", "url"]
+
+def load_feeds(path=FEEDS_FILE):
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return FEEDS
+
+def load_validators(path=VALIDATORS_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_validators(validators, path=VALIDATORS_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(validators, f, indent=2)
+    os.replace(tmp_path, path)
 
 def clean_html(text):
+    # Most summaries are plain text; only build a soup when there is markup to strip.
+    if "<" not in text and "&" not in text:
+        return text.strip()
     return BeautifulSoup(text, "html.parser").get_text().strip()
 
 def parse_date(entry):
@@ -20,24 +52,75 @@ def parse_date(entry):
         return datetime(*entry.published_parsed[:3]).strftime("%Y-%m-%d")
     return None
 
-def fetch_feed(source, url):
-    parsed = feedparser.parse(url)
+def fetch_feed(source, url, validators=None, seen_urls=frozenset()):
+    """
+    Conditionally GET one feed and parse the entries not seen before.
+
+    Parameters:
+        source (str): Source name stored with each article
+        url (str): Feed URL
+        validators (dict): {"etag", "last_modified"} from the previous fetch of this feed
+        seen_urls (set): Article links (or GUIDs) already stored, skipped before any HTML cleaning
+
+    Returns:
+        tuple: (list of article dicts, validators to send next time)
+    """
+    validators = validators or {}
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    response = get_session().get(url, headers=headers, timeout=15)
+    if response.status_code == 304:
+        print(f"{source}: not modified")
+        return [], validators
+    response.raise_for_status()
+
+    parsed = feedparser.parse(response.content)
     articles = []
     for entry in parsed.entries:
+        link = entry.get("link", "")
+        if link in seen_urls or entry.get("id") in seen_urls:
+            continue
         articles.append({
             "date": parse_date(entry),
             "source": source,
             "title": entry.get("title", "").strip(),
             "summary": clean_html(entry.get("summary", entry.get("description", ""))),
-            "url": entry.get("link", "")
+            "url": link
         })
-    return articles
 
-def fetch_all_news():
+    new_validators = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    return articles, new_validators
+
+def fetch_all_news(feeds=None, validators=None, seen_urls=frozenset(), max_workers=8):
+    """
+    Fetch every configured feed concurrently. `validators` (keyed by feed URL) is updated in
+    place so the caller can persist it once the articles are stored.
+    """
+    feeds = feeds if feeds is not None else load_feeds()
+    validators = validators if validators is not None else {}
+
     all_data = []
-    for source, url in FEEDS.items():
-        all_data.extend(fetch_feed(source, url))
-    df = pd.DataFrame(all_data)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_feed, source, url, validators.get(url), seen_urls): (source, url)
+            for source, url in feeds.items()
+        }
+        for future, (source, url) in futures.items():
+            try:
+                articles, validators[url] = future.result()
+            except Exception as e:
+                print(f"Error fetching {source}: {e}")
+                continue
+            all_data.extend(articles)
+
+    df = pd.DataFrame(all_data, columns=ARTICLE_COLUMNS)
     df.dropna(subset=["date", "title", "url"], inplace=True)
     df.sort_values("date", ascending=False, inplace=True)
     df.reset_index(drop=True, inplace=True)
@@ -55,45 +138,50 @@ def append_unique_rows(new_data: pd.DataFrame, csv_path1: str, csv_path2: str =
 
     new_data["date"] = pd.to_datetime(new_data["date"]).dt.date
 
-    # Load already scored (existing) data to filter out duplicates
-    if os.path.exists(csv_path1):
-        existing_data = pd.read_csv(csv_path1)
-        existing_data["date"] = pd.to_datetime(existing_data["date"]).dt.date
-    else:
-        existing_data = pd.DataFrame(columns=new_data.columns)
-
-    # Keep only rows not in scored data
-    merged = pd.merge(
-        new_data,
-        existing_data[subset_cols].drop_duplicates(),
-        on=subset_cols,
-        how="left",
-        indicator=True
-    )
-    new_unique = merged[merged["_merge"] == "left_only"].drop(columns="_merge")
-
-    if new_unique.empty:
-        print("No new rows to append.")
-        return
-
     if csv_path2 is None:
         csv_path2 = csv_path1
 
-    if os.path.exists(csv_path2):
-        old_raw = pd.read_csv(csv_path2)
-        old_raw["date"] = pd.to_datetime(old_raw["date"]).dt.date
-        new_unique = pd.concat([old_raw, new_unique], ignore_index=True)
-
-    new_unique.to_csv(csv_path2, index=False, )
-    print(f" Appended {len(new_unique)} new rows to {csv_path2}")
+    with span("csv.append", target=os.path.basename(csv_path2), rows=len(new_data)):
+        # Load already scored (existing) data to filter out duplicates
+        if os.path.exists(csv_path1):
+            existing_data = pd.read_csv(csv_path1)
+            existing_data["date"] = pd.to_datetime(existing_data["date"]).dt.date
+        else:
+            existing_data = pd.DataFrame(columns=new_data.columns)
+
+        # Keep only rows not in scored data
+        merged = pd.merge(
+            new_data,
+            existing_data[subset_cols].drop_duplicates(),
+            on=subset_cols,
+            how="left",
+            indicator=True
+        )
+        new_unique = merged[merged["_merge"] == "left_only"].drop(columns="_merge")
+
+        if new_unique.empty:
+            print("No new rows to append.")
+            return
+
+        if os.path.exists(csv_path2):
+            old_raw = pd.read_csv(csv_path2)
+            old_raw["date"] = pd.to_datetime(old_raw["date"]).dt.date
+            new_unique = pd.concat([old_raw, new_unique], ignore_index=True)
+
+        new_unique.to_csv(csv_path2, index=False, )
+        print(f" Appended {len(new_unique)} new rows to {csv_path2}")
 
 def main():
     
-    df_news = fetch_all_news()
-
     # Load both existing files
-    scored_df = pd.read_csv("data/news_scored.csv") if os.path.exists("data/news_scored.csv") else pd.DataFrame(columns=df_news.columns)
-    raw_df = pd.read_csv("data/raw_news.csv") if os.path.exists("data/raw_news.csv") else pd.DataFrame(columns=df_news.columns)
+    with span("csv.read", target="news_scored.csv"):
+        scored_df = pd.read_csv("data/news_scored.csv") if os.path.exists("data/news_scored.csv") else pd.DataFrame(columns=ARTICLE_COLUMNS)
+    with span("csv.read", target="raw_news.csv"):
+        raw_df = pd.read_csv("data/raw_news.csv") if os.path.exists("data/raw_news.csv") else pd.DataFrame(columns=ARTICLE_COLUMNS)
+
+    seen_urls = set(scored_df["url"].dropna()) | set(raw_df["url"].dropna())
+    validators = load_validators()
+    df_news = fetch_all_news(validators=validators, seen_urls=seen_urls)
 
     expected_cols = ["date", "source", "title", "summary", "url", "sentiment", "confidence", "rationale"]
 
@@ -103,7 +191,7 @@ def main():
                 df[col] = pd.NA
 
     dfs = [df for df in [scored_df, raw_df] if not df.empty]
-    combined_seen = pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+    combined_seen = pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame(columns=expected_cols)
 
     subset = ["date", "title", "source", "summary", "url"]
 
@@ -112,12 +200,21 @@ def main():
     new_articles = merged[merged["_merge"] == "left_only"].drop(columns="_merge")
 
     if not new_articles.empty:
-        updated_raw = pd.concat([raw_df, new_articles], ignore_index=True)
-        updated_raw.to_csv("data/raw_news.csv", index=False)
-        print(f"Added {len(new_articles)} new articles to raw_news.csv")
+        # Clustered before queueing so the scorer can send one article per story to the LLM.
+        index = NewsIndex()
+        with span("news.dedup", target="minhash", rows=len(new_articles)):
+            clusters = index.add(new_articles)
+        duplicates = sum(cluster != url for cluster, url in zip(clusters, new_articles["url"]))
+        # Appended through the queue so the offsets of pending articles never move.
+        NewsQueue().enqueue(new_articles)
+        index.save()
+        print(f"Added {len(new_articles)} new articles to raw_news.csv ({duplicates} near-duplicates)")
     else:
         print(" No new articles found.")
 
+    # Only remember the validators once the articles they cover are stored.
+    save_validators(validators)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
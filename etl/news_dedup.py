@@ -0,0 +1,140 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+INDEX_FILE = "data/news_dedup.npz"
+# MinHash signature length, split into BANDS bands of NUM_PERM // BANDS rows for LSH
+NUM_PERM = 128
+BANDS = 32
+# Bytes per shingle; packed into one integer, so at most 4
+SHINGLE_SIZE = 4
+# Estimated Jaccard similarity of title+summary shingles above which two articles are one story
+THRESHOLD = float(os.getenv("NEWS_DEDUP_THRESHOLD", 0.6))
+# Articles further apart than this are never clustered, and older ones leave the index
+WINDOW_DAYS = int(os.getenv("NEWS_DEDUP_WINDOW_DAYS", 3))
+
+# Multiply-shift hash functions, one per permutation; the seed is fixed so signatures stored in
+# the index stay comparable across runs
+_rng = np.random.default_rng(20240611)
+_A = _rng.integers(0, np.iinfo(np.uint64).max, NUM_PERM, dtype=np.uint64, endpoint=True) | np.uint64(1)
+_B = _rng.integers(0, np.iinfo(np.uint64).max, NUM_PERM, dtype=np.uint64, endpoint=True)
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text: str) -> np.ndarray:
+    """
+    Distinct 4-byte shingles of the lower-cased words of `text` (UTF-8), each packed into an integer.
+    """
+    normalized = " ".join(_WORD.findall(str(text).lower())).encode("utf-8").ljust(SHINGLE_SIZE)
+    data = np.frombuffer(normalized, dtype=np.uint8).astype(np.uint64)
+    grams = np.zeros(len(data) - SHINGLE_SIZE + 1, dtype=np.uint64)
+    for offset in range(SHINGLE_SIZE):
+        grams = (grams << np.uint64(8)) | data[offset:len(data) - SHINGLE_SIZE + 1 + offset]
+    return np.unique(grams)
+
+
+def minhash(text: str) -> np.ndarray:
+    """
+    NUM_PERM-value MinHash signature of `text`; the fraction of equal values between two
+    signatures estimates the Jaccard similarity of their shingle sets.
+    """
+    hashes = shingles(text)
+    # (a * h + b) mod 2**64, top 32 bits: uint64 arithmetic wraps, which is the modulus
+    return ((np.outer(hashes, _A) + _B) >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+
+def article_text(title, summary) -> str:
+    return f"{'' if pd.isna(title) else title} {'' if pd.isna(summary) else summary}"
+
+
+class NewsIndex:
+    """
+    Persistent MinHash/LSH index of recent articles, mapping each to the first article of its
+    near-duplicate cluster (its representative).
+
+    Signatures are banded into BANDS buckets, so a new article is only compared with the articles
+    sharing a bucket instead of every stored one; candidates are confirmed on the estimated
+    Jaccard similarity. The index keeps WINDOW_DAYS of articles in data/news_dedup.npz.
+    """
+
+    def __init__(self, path: str = INDEX_FILE):
+        self.path = path
+        self.signatures = []
+        self.days = []
+        self.urls = []
+        self.clusters = []
+        if os.path.exists(path):
+            with np.load(path) as stored:
+                self.signatures = list(stored["signatures"])
+                self.days = stored["days"].tolist()
+                self.urls = stored["urls"].tolist()
+                self.clusters = stored["clusters"].tolist()
+        self._position = {url: i for i, url in enumerate(self.urls)}
+        self._buckets = {}
+        for i, signature in enumerate(self.signatures):
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, []).append(i)
+
+    @staticmethod
+    def _band_keys(signature: np.ndarray):
+        rows = NUM_PERM // BANDS
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(BANDS)]
+
+    def cluster_of(self, url: str) -> str:
+        """
+        URL of the representative of `url`'s cluster (`url` itself when it is one, or unknown).
+        """
+        i = self._position.get(url)
+        return url if i is None else self.clusters[i]
+
+    def add(self, articles: pd.DataFrame) -> list:
+        """
+        Cluster and index new articles in row order; an article joins the cluster of its most
+        similar indexed article within WINDOW_DAYS, or starts its own.
+
+        Returns:
+            list: Representative URL per article
+        """
+        days = (pd.to_datetime(articles["date"], errors="coerce").to_numpy("datetime64[D]")
+                .astype(np.int64))
+        representatives = []
+        for row, day in zip(articles.itertuples(index=False), days):
+            if row.url in self._position:
+                representatives.append(self.cluster_of(row.url))
+                continue
+            signature = minhash(article_text(row.title, row.summary))
+            keys = self._band_keys(signature)
+            candidates = {i for key in keys for i in self._buckets.get(key, ())}
+            best, best_similarity = None, THRESHOLD
+            for i in candidates:
+                if abs(self.days[i] - day) > WINDOW_DAYS:
+                    continue
+                similarity = float(np.mean(self.signatures[i] == signature))
+                if similarity >= best_similarity:
+                    best, best_similarity = i, similarity
+            cluster = row.url if best is None else self.clusters[best]
+
+            i = len(self.urls)
+            self.urls.append(row.url)
+            self.clusters.append(cluster)
+            self.days.append(int(day))
+            self.signatures.append(signature)
+            self._position[row.url] = i
+            for key in keys:
+                self._buckets.setdefault(key, []).append(i)
+            representatives.append(cluster)
+        return representatives
+
+    def save(self):
+        """
+        Write the index, dropping articles older than WINDOW_DAYS before the newest one.
+        """
+        days = np.array(self.days, dtype=np.int64)
+        keep = days >= days.max() - WINDOW_DAYS if len(days) else np.zeros(0, dtype=bool)
+        signatures = np.array(self.signatures, dtype=np.uint32).reshape(-1, NUM_PERM)
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(tmp_path, signatures=signatures[keep], days=days[keep],
+                 urls=np.array(self.urls, dtype=str)[keep], clusters=np.array(self.clusters, dtype=str)[keep])
+        os.replace(tmp_path, self.path)
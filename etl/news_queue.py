@@ -0,0 +1,326 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from etl.locks import file_lock, pid_alive
+
+RAW_FILE = "data/raw_news.csv"
+SCORED_FILE = "data/news_scored.csv"
+JOURNAL_FILE = "data/news_queue.jsonl"
+# A lease runs out unless renewed; keep_alive() renews it every third of this while a batch is scored
+LEASE_SECONDS = 600
+
+
+def _file_size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _append_durable(path: str, text: str):
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class NewsQueue:
+    """
+    Journaled work queue over the append-only raw_news.csv inbox.
+
+    Pending articles are addressed by their row offset in raw_news.csv. Workers lease offset
+    ranges and ack them once the scored rows are appended to news_scored.csv; both events go to
+    an append-only JSON-lines journal, so nothing is rewritten per batch and a crashed run resumes
+    exactly after the last acked batch. The journal records the size of news_scored.csv at every
+    ack, and a partial append left by a crash is cut off before the next commit.
+
+    All mutations happen under a lock file, so several scorer processes can share the queue.
+    Every lease carries a token: once a lease has run out and its rows were leased again, or acked
+    by someone else, the original holder can neither renew nor ack it, so no batch is stored twice.
+    """
+
+    def __init__(self, raw_path=RAW_FILE, scored_path=SCORED_FILE, journal_path=JOURNAL_FILE,
+                 worker=None, lease_seconds=LEASE_SECONDS):
+        self.raw_path = raw_path
+        self.scored_path = scored_path
+        self.journal_path = journal_path
+        self.lock_path = f"{journal_path}.lock"
+        self.worker = worker or os.getenv("NEWS_QUEUE_WORKER", "default")
+        self.lease_seconds = lease_seconds
+
+        self._journal_id = None
+        self._journal_pos = 0
+        self._acked = []
+        self._leases = {}
+        self._scored_size = None
+        self._raw = None
+        self._raw_size = -1
+        # Token of every lease taken through this instance
+        self._tokens = {}
+
+        with self._locked():
+            # Take back what a crashed process on this host held; live processes keep their leases.
+            host = socket.gethostname()
+            for (start, end), lease in list(self._leases.items()):
+                if lease.get("host") == host and lease.get("pid") is not None and not pid_alive(lease["pid"]):
+                    self._write({"op": "release", "start": start, "end": end, "token": lease.get("token")})
+                    del self._leases[(start, end)]
+
+    @contextmanager
+    def _locked(self):
+        with file_lock(self.lock_path):
+            self._sync()
+            yield
+
+    def _reset_journal(self):
+        self._journal_pos = 0
+        self._acked = []
+        self._leases = {}
+        self._scored_size = _file_size(self.scored_path)
+        tmp_path = f"{self.journal_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"op": "init", "id": uuid.uuid4().hex, "scored_size": self._scored_size}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def _write(self, record: dict):
+        _append_durable(self.journal_path, json.dumps(record) + "\n")
+
+    def _sync(self):
+        """
+        Replay journal records written since the last sync (by any worker) and finish an
+        interrupted truncate.
+        """
+        if not os.path.exists(self.journal_path):
+            self._reset_journal()
+
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            journal_id = json.loads(f.readline())["id"]
+        if journal_id != self._journal_id:
+            # Another worker compacted the queue and started a new journal.
+            self._journal_id = journal_id
+            self._journal_pos = 0
+            self._acked = []
+            self._leases = {}
+
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            f.seek(self._journal_pos)
+            lines = f.read().splitlines(keepends=True)
+        last_op = None
+        for line in lines:
+            if not line.endswith("\n"):
+                # Torn write from a crash: drop it so the next record starts on a clean line.
+                with open(self.journal_path, "r+b") as f:
+                    f.truncate(self._journal_pos)
+                break
+            self._journal_pos += len(line.encode("utf-8"))
+            record = json.loads(line)
+            last_op = record["op"]
+            key = (record.get("start"), record.get("end"))
+            if last_op == "init":
+                self._scored_size = record["scored_size"]
+            elif last_op == "lease":
+                self._leases[key] = record
+            elif last_op == "renew":
+                if self._holds(key, record.get("token")):
+                    self._leases[key] = {**self._leases[key], "expires": record["expires"]}
+            elif last_op == "release":
+                if self._holds(key, record.get("token")):
+                    del self._leases[key]
+            elif last_op == "ack":
+                if self._holds(key, record.get("token")):
+                    del self._leases[key]
+                self._acked.append(key)
+                self._scored_size = record["scored_size"]
+
+        if last_op == "truncate":
+            self._truncate_raw()
+
+    def _holds(self, key: tuple, token) -> bool:
+        """
+        Whether the lease on `key` is the one issued with `token`.
+        """
+        return key in self._leases and self._leases[key].get("token") == token
+
+    def _owns(self, start: int, end: int) -> bool:
+        """
+        Whether this instance still holds the lease on [start, end): not leased again by
+        another worker, and no overlapping range acked since.
+        """
+        if not self._holds((start, end), self._tokens.get((start, end))):
+            return False
+        return not any(s < end and start < e for s, e in self._acked)
+
+    def _truncate_raw(self):
+        header = ""
+        if os.path.exists(self.raw_path):
+            with open(self.raw_path, "r", encoding="utf-8", newline="") as f:
+                header = f.readline()
+        with open(self.raw_path, "w", encoding="utf-8", newline="") as f:
+            f.write(header)
+        self._raw = None
+        self._reset_journal()
+
+    def _load_raw(self) -> pd.DataFrame:
+        size = _file_size(self.raw_path)
+        if self._raw is None or size != self._raw_size:
+            self._raw = pd.read_csv(self.raw_path) if size else pd.DataFrame()
+            self._raw_size = size
+        return self._raw
+
+    def _taken(self, n_rows: int, include_leases: bool = True) -> np.ndarray:
+        now = time.time()
+        taken = np.zeros(n_rows, dtype=bool)
+        for start, end in self._acked:
+            taken[start:end] = True
+        if include_leases:
+            for (start, end), lease in self._leases.items():
+                if lease["expires"] > now:
+                    taken[start:end] = True
+        return taken
+
+    def pending(self) -> int:
+        with self._locked():
+            raw = self._load_raw()
+            return int((~self._taken(len(raw))).sum())
+
+    def enqueue(self, articles: pd.DataFrame):
+        """
+        Append new articles to the raw inbox (the only way rows should be added to it).
+        """
+        with self._locked():
+            exists = _file_size(self.raw_path) > 0
+            if exists:
+                columns = list(pd.read_csv(self.raw_path, nrows=0).columns)
+                articles = articles.reindex(columns=columns)
+            articles.to_csv(self.raw_path, mode="a", header=not exists, index=False)
+
+    def lease(self, size: int, cost=None, budget: float = None):
+        """
+        Lease the next run of at most `size` pending articles.
+
+        Parameters:
+            size (int): Maximum number of articles
+            cost (callable): Optional function mapping a DataFrame of rows to per-row costs
+            budget (float): With `cost`, stop before the running cost exceeds this (at least one row is leased)
+
+        Returns:
+            tuple | None: (start, end, DataFrame of the leased rows), or None when nothing is pending
+        """
+        with self._locked():
+            raw = self._load_raw()
+            free = np.flatnonzero(~self._taken(len(raw)))
+            if len(free) == 0:
+                return None
+            # Only a contiguous run of free rows can be leased as one range.
+            run = free[:size]
+            breaks = np.flatnonzero(np.diff(run) != 1)
+            start = int(run[0])
+            end = int(run[breaks[0]] if len(breaks) else run[-1]) + 1
+            if cost is not None and budget is not None:
+                running = np.cumsum(np.asarray(cost(raw.iloc[start:end]), dtype=float))
+                end = start + max(1, int(np.searchsorted(running, budget, side="right")))
+            record = {
+                "op": "lease", "start": start, "end": end, "token": uuid.uuid4().hex,
+                "worker": self.worker, "host": socket.gethostname(), "pid": os.getpid(),
+                "expires": time.time() + self.lease_seconds,
+            }
+            self._write(record)
+            self._leases[(start, end)] = record
+            self._tokens[(start, end)] = record["token"]
+            return start, end, raw.iloc[start:end]
+
+    def renew(self, start: int, end: int) -> bool:
+        """
+        Extend a lease by another `lease_seconds`.
+
+        Returns:
+            bool: False when the lease was taken over and must not be acked
+        """
+        with self._locked():
+            if not self._owns(start, end):
+                return False
+            expires = time.time() + self.lease_seconds
+            self._write({"op": "renew", "start": start, "end": end,
+                         "token": self._tokens[(start, end)], "expires": expires})
+            self._leases[(start, end)] = {**self._leases[(start, end)], "expires": expires}
+            return True
+
+    @contextmanager
+    def keep_alive(self, start: int, end: int):
+        """
+        Renew the lease on [start, end) in the background while the block runs.
+        """
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.lease_seconds / 3):
+                if not self.renew(start, end):
+                    return
+
+        thread = threading.Thread(target=renew, name=f"lease-{start}-{end}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def release(self, start: int, end: int):
+        with self._locked():
+            token = self._tokens.pop((start, end), None)
+            self._write({"op": "release", "start": start, "end": end, "token": token})
+            if self._holds((start, end), token):
+                del self._leases[(start, end)]
+
+    def ack(self, start: int, end: int, scored: pd.DataFrame) -> bool:
+        """
+        Append the scored rows of a lease to news_scored.csv and mark the lease done.
+
+        Returns:
+            bool: False, storing nothing, when the lease was taken over (it ran out and its rows
+                were leased again or acked by another worker)
+        """
+        with self._locked():
+            if not self._owns(start, end):
+                token = self._tokens.pop((start, end), None)
+                self._write({"op": "release", "start": start, "end": end, "token": token})
+                return False
+            # Anything past the last acked size is a partial append from a crashed commit.
+            if _file_size(self.scored_path) > self._scored_size:
+                with open(self.scored_path, "r+b") as f:
+                    f.truncate(self._scored_size)
+
+            write_header = self._scored_size == 0
+            with open(self.scored_path, "a", encoding="utf-8", newline="") as f:
+                scored.to_csv(f, header=write_header, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._scored_size = _file_size(self.scored_path)
+            token = self._tokens.pop((start, end))
+            self._write({"op": "ack", "start": start, "end": end, "token": token, "scored_size": self._scored_size})
+            del self._leases[(start, end)]
+            self._acked.append((start, end))
+            return True
+
+    def compact(self) -> bool:
+        """
+        Once every article is acked, empty the raw inbox and start a fresh journal.
+
+        Returns:
+            bool: Whether the queue was drained and compacted
+        """
+        with self._locked():
+            raw = self._load_raw()
+            if len(raw) == 0 or not self._taken(len(raw), include_leases=False).all():
+                return False
+            self._write({"op": "truncate"})
+            self._truncate_raw()
+            return True
@@ -0,0 +1,234 @@
+import argparse
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from etl import cassette, fetch_binance, indicators, universe
+from etl.fetch_binance import INTERVAL_MS, REQUEST_WEIGHT_PER_MINUTE, iter_klines
+from etl.http import TokenBucket
+from etl.tracing import span
+
+STORE_DIR = "data/ohlcv"
+# The only interval downloaded; every coarser one is resampled from it
+BASE_INTERVAL = os.getenv("OHLCV_BASE_INTERVAL", "1h")
+# Columns of the stored arrays; open_time is epoch milliseconds, exact in float64
+COLUMNS = ["open_time", "open", "high", "low", "close", "volume"]
+# Binance weeks open on Monday; the epoch was a Thursday
+WEEK_OFFSET_MS = 4 * INTERVAL_MS["1d"]
+
+
+def _bucket(open_time: np.ndarray, step_ms: int) -> np.ndarray:
+    offset = WEEK_OFFSET_MS if step_ms == INTERVAL_MS["1w"] else 0
+    return (open_time - offset) // step_ms * step_ms + offset
+
+
+def aggregate(rows: np.ndarray, step_ms: int) -> tuple:
+    """
+    Resample consecutive base candles (COLUMNS layout, sorted by open_time) into `step_ms` bars.
+
+    Returns:
+        tuple: (bars in COLUMNS layout, number of base candles in each bar)
+    """
+    if not len(rows):
+        return np.empty((0, len(COLUMNS))), np.empty(0, dtype=int)
+    bucket = _bucket(rows[:, 0].astype(np.int64), step_ms)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(rows)]
+    bars = np.column_stack([
+        bucket[starts],
+        rows[starts, 1],
+        np.maximum.reduceat(rows[:, 2], starts),
+        np.minimum.reduceat(rows[:, 3], starts),
+        rows[ends - 1, 4],
+        np.add.reduceat(rows[:, 5], starts),
+    ])
+    return bars, ends - starts
+
+
+class OhlcvStore:
+    """
+    Candles of every pair at BASE_INTERVAL, one .npy file per pair and month under
+    data/ohlcv/{pair}/{interval}/YYYY-MM.npy.
+
+    Only closed candles are stored, so a month file only changes while its month is current and
+    ingest() never rewrites more than the months it adds to. Readers stream the files one month at
+    a time, which keeps years of hourly candles for hundreds of pairs out of memory.
+    """
+
+    def __init__(self, path: str = STORE_DIR, interval: str = BASE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.step_ms = INTERVAL_MS[interval]
+
+    def _dir(self, pair: str) -> str:
+        return os.path.join(self.path, pair, self.interval)
+
+    def months(self, pair: str) -> list:
+        return sorted(glob.glob(os.path.join(self._dir(pair), "*.npy")))
+
+    def last_open_ms(self, pair: str):
+        """
+        Open time of the newest stored candle, or None when nothing is stored.
+        """
+        months = self.months(pair)
+        if not months:
+            return None
+        return int(np.load(months[-1], mmap_mode="r")[-1, 0])
+
+    def _write(self, pair: str, rows: np.ndarray):
+        os.makedirs(self._dir(pair), exist_ok=True)
+        month = pd.to_datetime(rows[:, 0], unit="ms").strftime("%Y-%m").to_numpy()
+        for key in np.unique(month):
+            path = os.path.join(self._dir(pair), f"{key}.npy")
+            new = rows[month == key]
+            if os.path.exists(path):
+                stored = np.load(path)
+                new = np.concatenate([stored, new[new[:, 0] > stored[-1, 0]]])
+            tmp_path = f"{path}.tmp.npy"
+            np.save(tmp_path, new)
+            os.replace(tmp_path, path)
+
+    def ingest(self, pair: str) -> int:
+        """
+        Download the closed candles after the newest stored one, writing each 1000-candle page as
+        it arrives. A pair seen for the first time gets its whole listing history.
+
+        Returns:
+            int: Candles added
+        """
+        last = self.last_open_ms(pair)
+        start_ms = 0 if last is None else last + self.step_ms
+        now_ms = int(cassette.now() * 1000)
+        added = 0
+        with span("ohlcv.ingest", target=self.interval, pair=pair) as s:
+            for batch in iter_klines(pair, start_ms, self.interval, now_ms):
+                rows = np.array([row[:6] for row in batch if row[6] < now_ms], dtype=float)
+                if len(rows):
+                    self._write(pair, rows)
+                    added += len(rows)
+            s.set(rows=added)
+        return added
+
+    def chunks(self, pair: str):
+        """
+        Yield the stored candles of `pair` one month at a time (COLUMNS layout).
+        """
+        for path in self.months(pair):
+            yield np.load(path)
+
+    def bars(self, pair: str, interval: str = None, start=None, end=None, partial: bool = False):
+        """
+        Yield `interval` bars of `pair` with their indicators as DataFrames, one per stored month.
+
+        Bars are resampled from the base candles and indicators continued across chunks with the
+        incremental engine (etl.indicators), so only one month of candles is in memory at a time.
+        Indicators always start from the first stored candle; `start` / `end` only filter what is
+        yielded. The last bar is dropped while its period is still open, unless `partial`.
+
+        Parameters:
+            interval (str): Any multiple of the base interval in INTERVAL_MS (default: the base)
+            start, end: Optional bounds on the bar open date
+        """
+        interval = interval or self.interval
+        step_ms = INTERVAL_MS[interval]
+        if step_ms % self.step_ms:
+            raise ValueError(f"Cannot resample {self.interval} candles to {interval}")
+        start = pd.to_datetime(start) if start is not None else None
+        end = pd.to_datetime(end) if end is not None else None
+
+        state = None
+        carry = np.empty((0, len(COLUMNS)))
+        chunks = self.chunks(pair)
+        chunk = next(chunks, None)
+        while chunk is not None:
+            following = next(chunks, None)
+            rows = np.concatenate([carry, chunk])
+            bars, counts = aggregate(rows, step_ms)
+            if following is not None and len(bars):
+                # The last bar may continue in the next month (weeks do); finish it there.
+                carry = rows[-counts[-1]:]
+                bars = bars[:-1]
+            elif len(bars) and not partial and counts[-1] < step_ms // self.step_ms:
+                bars = bars[:-1]
+
+            if len(bars):
+                columns, state = indicators.update(state, bars[:, 4])
+                frame = pd.DataFrame(bars[:, 1:], columns=COLUMNS[1:])
+                frame.insert(0, "date", pd.to_datetime(bars[:, 0].astype(np.int64), unit="ms"))
+                for name, values in columns.items():
+                    frame[name] = values
+                if start is not None:
+                    frame = frame[frame["date"] >= start]
+                if end is not None:
+                    frame = frame[frame["date"] <= end]
+                if len(frame):
+                    yield frame.reset_index(drop=True)
+            chunk = following
+
+    def frame(self, pair: str, interval: str = None, start=None, end=None, partial: bool = False) -> pd.DataFrame:
+        """
+        bars() concatenated into one DataFrame; bound it with `start` for long histories.
+        """
+        frames = list(self.bars(pair, interval, start, end, partial))
+        if not frames:
+            return pd.DataFrame(columns=["date", *COLUMNS[1:]])
+        return pd.concat(frames, ignore_index=True)
+
+
+def ingest_shard(symbol_matching: dict, interval: str = BASE_INTERVAL, request_weight: float = None) -> dict:
+    """
+    Ingest one shard of the universe. `request_weight` is the Binance request weight per minute
+    this process may use, set when shards run in separate processes (see fetch_binance.update_shard).
+    """
+    if request_weight is not None:
+        fetch_binance.rate_limiter = TokenBucket(request_weight, period=60.0)
+    store = OhlcvStore(interval=interval)
+    added = {}
+    for pair in symbol_matching:
+        try:
+            added[pair] = store.ingest(pair)
+        except Exception as e:
+            print(f"Error fetching {interval} candles for {pair}: {e}")
+    return added
+
+
+def main(symbol_matching: dict = None, interval: str = BASE_INTERVAL, processes: int = None):
+    """
+    Bring the base-interval candles of the whole universe up to date, one shard per process.
+    """
+    symbol_matching = symbol_matching or universe.load_universe()
+    shards = universe.shard(symbol_matching, universe.shard_count(symbol_matching))
+    processes = min(processes or universe.PROCESSES, len(shards))
+
+    # The processes share one IP, so they split its request weight budget.
+    request_weight = REQUEST_WEIGHT_PER_MINUTE / processes if processes > 1 else None
+    added = {}
+    for part in universe.map_shards(ingest_shard, shards, processes, interval, request_weight):
+        added.update(part)
+    print(f"Stored {sum(added.values())} new {interval} candles for {len(added)} pairs.")
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-timeframe OHLCV store.")
+    parser.add_argument("--resample", metavar="INTERVAL", help="Write this interval's bars instead of ingesting")
+    parser.add_argument("--pair", help="Pair to resample, e.g. BTCUSDT")
+    parser.add_argument("--start", help="First bar date (YYYY-MM-DD)")
+    parser.add_argument("--output", help="CSV path for --pair (default: data/{coin}_{interval}.csv)")
+    args = parser.parse_args()
+
+    if args.resample:
+        coins = universe.load_universe()
+        pairs = [args.pair] if args.pair else list(coins)
+        store = OhlcvStore()
+        for pair in pairs:
+            output = args.output if args.pair and args.output else f"data/{coins.get(pair, pair).lower()}_{args.resample}.csv"
+            if os.path.exists(output):
+                os.remove(output)
+            for i, frame in enumerate(store.bars(pair, args.resample, start=args.start)):
+                frame.round(8).to_csv(output, mode="a", header=i == 0, index=False)
+            print(f"Wrote {output}")
+    else:
+        main()
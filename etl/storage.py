@@ -0,0 +1,259 @@
+import csv
+import os
+import sqlite3
+from io import StringIO
+
+import pandas as pd
+
+from etl.tracing import span
+
+DB_FILE = "data/dipsignal.db"
+
+
+def _table_name(csv_path: str) -> str:
+    return os.path.splitext(os.path.basename(csv_path))[0]
+
+
+def _csv_header(csv_path: str) -> list:
+    if not os.path.exists(csv_path):
+        return []
+    with open(csv_path, "r", newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), [])
+
+
+def _to_sql_value(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, bool):
+        # Stored as text so the CSV export keeps writing True/False rather than 1/0.
+        return str(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def _filter_dates(df: pd.DataFrame, start=None, end=None) -> pd.DataFrame:
+    if start is not None:
+        df = df[df["date"] >= pd.to_datetime(start)]
+    if end is not None:
+        df = df[df["date"] <= pd.to_datetime(end)]
+    return df
+
+
+class CsvStore:
+    """
+    Original backend: the CSV file is the store and is rewritten on every append.
+    """
+
+    def append(self, new_data: pd.DataFrame, csv_path1: str, csv_path2: str = None, subset_cols=["date"]) -> int:
+        if os.path.exists(csv_path1):
+            existing_data = pd.read_csv(csv_path1)
+            existing_data["date"] = pd.to_datetime(existing_data["date"]).dt.date
+            combined = pd.concat([existing_data, new_data], ignore_index=True)
+            combined = combined.drop_duplicates(subset=subset_cols)
+            existing_rows = len(existing_data)
+        else:
+            combined = new_data.drop_duplicates(subset=subset_cols)
+            existing_rows = 0
+
+        if csv_path2 is None:
+            csv_path2 = csv_path1
+
+        combined.to_csv(csv_path2, index=False)
+        return len(combined) - existing_rows
+
+    def read(self, csv_path: str, start=None, end=None) -> pd.DataFrame:
+        df = pd.read_csv(csv_path)
+        df["date"] = pd.to_datetime(df["date"])
+        return _filter_dates(df, start, end).reset_index(drop=True)
+
+    def last_row(self, csv_path: str):
+        """
+        The last row of the CSV, read from the end of the file, or None when there is none.
+        """
+        header = _csv_header(csv_path)
+        if not header:
+            return None
+        with open(csv_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 4096))
+            lines = [line for line in f.read().decode("utf-8").splitlines() if line.strip()]
+        if not lines or next(csv.reader([lines[-1]])) == header:
+            return None
+        df = pd.read_csv(StringIO(f"{','.join(header)}\n{lines[-1]}\n"))
+        df["date"] = pd.to_datetime(df["date"])
+        return df.iloc[0]
+
+
+class SqliteStore:
+    """
+    SQLite backend: one table per dataset with a primary key on the dedup columns.
+
+    Appends insert only the new rows (existing keys win, as with the CSV backend) and the
+    CSV file is kept as an export by appending just those rows to it.
+    """
+
+    def __init__(self, db_path: str = DB_FILE):
+        self.db_path = db_path
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _columns(self, conn, table: str) -> list:
+        return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+    def _ensure_table(self, conn, table: str, columns: list, subset_cols: list, csv_path: str) -> list:
+        existing = self._columns(conn, table)
+        if not existing:
+            column_sql = ", ".join(f'"{col}"' for col in columns)
+            key_sql = ", ".join(f'"{col}"' for col in subset_cols)
+            conn.execute(f'CREATE TABLE "{table}" ({column_sql}, PRIMARY KEY ({key_sql}))')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{table}_date" ON "{table}" ("date")')
+            existing = list(columns)
+            # First use of this dataset: import the rows the CSV already holds.
+            if os.path.exists(csv_path):
+                history = pd.read_csv(csv_path)
+                history["date"] = pd.to_datetime(history["date"]).dt.date
+                existing = self._ensure_table(conn, table, list(history.columns), subset_cols, csv_path)
+                self._insert(conn, table, history, subset_cols)
+        for col in columns:
+            if col not in existing:
+                conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{col}"')
+                existing.append(col)
+        return existing
+
+    def _existing_keys(self, conn, table: str, subset_cols: list, keys: list) -> set:
+        """
+        Stored dedup keys that may collide with `keys`, looked up on the date index when the
+        key includes the date.
+        """
+        key_sql = ", ".join(f'"{col}"' for col in subset_cols)
+        if "date" not in subset_cols:
+            return set(conn.execute(f'SELECT {key_sql} FROM "{table}"'))
+        position = subset_cols.index("date")
+        dates = [key[position] for key in keys if key[position] is not None]
+        if not dates:
+            return set()
+        return set(conn.execute(f'SELECT {key_sql} FROM "{table}" WHERE "date" BETWEEN ? AND ?',
+                                (min(dates), max(dates))))
+
+    def _insert(self, conn, table: str, df: pd.DataFrame, subset_cols: list) -> list:
+        """
+        Insert the rows of `df` whose key is not stored yet (nor earlier in `df`) in one
+        executemany, and return their positions.
+        """
+        columns = list(df.columns)
+        rows = [[_to_sql_value(value) for value in row] for row in df.itertuples(index=False, name=None)]
+        key_index = [columns.index(col) for col in subset_cols]
+        keys = [tuple(row[i] for i in key_index) for row in rows]
+
+        seen = self._existing_keys(conn, table, subset_cols, keys)
+        inserted = []
+        for position, key in enumerate(keys):
+            if key not in seen:
+                seen.add(key)
+                inserted.append(position)
+
+        column_sql = ", ".join(f'"{col}"' for col in columns)
+        placeholders = ", ".join("?" for _ in columns)
+        conn.executemany(f'INSERT OR IGNORE INTO "{table}" ({column_sql}) VALUES ({placeholders})',
+                         [rows[position] for position in inserted])
+        return inserted
+
+    def append(self, new_data: pd.DataFrame, csv_path1: str, csv_path2: str = None, subset_cols=["date"]) -> int:
+        table = _table_name(csv_path1)
+        if csv_path2 is None:
+            csv_path2 = csv_path1
+
+        with self._connect() as conn:
+            columns = self._ensure_table(conn, table, list(new_data.columns), subset_cols, csv_path1)
+            inserted = self._insert(conn, table, new_data, subset_cols)
+
+        new_rows = new_data.iloc[inserted]
+        if new_rows.empty:
+            return 0
+
+        header = _csv_header(csv_path2)
+        if header and set(new_rows.columns) <= set(header):
+            new_rows.reindex(columns=header).to_csv(csv_path2, mode="a", header=False, index=False)
+        else:
+            self.export_csv(csv_path1, csv_path2, columns)
+        return len(new_rows)
+
+    def read(self, csv_path: str, start=None, end=None) -> pd.DataFrame:
+        table = _table_name(csv_path)
+        clauses, params = [], []
+        if start is not None:
+            clauses.append('"date" >= ?')
+            params.append(pd.to_datetime(start).date().isoformat())
+        if end is not None:
+            clauses.append('"date" <= ?')
+            params.append(pd.to_datetime(end).date().isoformat())
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._connect() as conn:
+            if not self._columns(conn, table):
+                return CsvStore().read(csv_path, start, end)
+            df = pd.read_sql_query(f'SELECT * FROM "{table}"{where} ORDER BY rowid', conn, params=params)
+        return self._decode(df)
+
+    def last_row(self, csv_path: str):
+        table = _table_name(csv_path)
+        with self._connect() as conn:
+            if not self._columns(conn, table):
+                return CsvStore().last_row(csv_path)
+            df = pd.read_sql_query(f'SELECT * FROM "{table}" ORDER BY rowid DESC LIMIT 1', conn)
+        return self._decode(df).iloc[0] if len(df) else None
+
+    @staticmethod
+    def _decode(df: pd.DataFrame) -> pd.DataFrame:
+        for col in df.columns[df.dtypes == object]:
+            if df[col].isin(["True", "False"]).all():
+                df[col] = df[col] == "True"
+        df["date"] = pd.to_datetime(df["date"])
+        return df
+
+    def export_csv(self, csv_path: str, export_path: str = None, columns: list = None):
+        """
+        Rewrite the CSV export of a dataset from the database.
+        """
+        df = self.read(csv_path)
+        df["date"] = df["date"].dt.date
+        if columns is not None:
+            df = df[columns]
+        df.to_csv(export_path or csv_path, index=False)
+
+
+def get_store():
+    """
+    Storage backend selected with DIPSIGNAL_STORAGE ('csv' by default, or 'sqlite').
+    """
+    backend = os.getenv("DIPSIGNAL_STORAGE", "csv").lower()
+    if backend == "sqlite":
+        return SqliteStore(os.getenv("DIPSIGNAL_DB", DB_FILE))
+    if backend == "csv":
+        return CsvStore()
+    raise ValueError(f"Unknown DIPSIGNAL_STORAGE backend: {backend}")
+
+
+def read_rows(csv_path: str, start=None, end=None) -> pd.DataFrame:
+    """
+    Load the rows of a dataset whose date falls in [start, end], with 'date' parsed to datetime.
+    """
+    with span("csv.read", target=os.path.basename(csv_path), since=start, until=end) as s:
+        df = get_store().read(csv_path, start, end)
+        s.set(rows=len(df))
+    return df
+
+
+def read_last_row(csv_path: str):
+    """
+    The last stored row of a dataset as a Series with 'date' parsed, or None when there is none;
+    the CSV backend reads only the end of the file.
+    """
+    with span("csv.read", target=os.path.basename(csv_path), last_row=True) as s:
+        row = get_store().last_row(csv_path)
+        s.set(rows=0 if row is None else 1)
+    return row
@@ -0,0 +1,385 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+
+from etl import indicators, universe
+from etl.feature_store import FeatureStore
+from etl.fetch_binance import INTERVAL_MS, iter_klines, load_indicator_state, technical_lock, update_symbol
+from etl.storage import read_rows
+from etl.to_csv import append_unique_rows
+from etl.tracing import count
+
+STREAM_URL = os.getenv("BINANCE_STREAM_URL", "wss://stream.binance.com:9443")
+ALERTS_FILE = os.getenv("DIPSIGNAL_ALERTS_FILE", "data/alerts.jsonl")
+ALERT_RULES_FILE = os.getenv("ALERT_RULES_FILE", "data/alert_rules.json")
+# Closed bars kept per symbol
+RING_SIZE = 500
+# Binance allows up to 1024 streams on one connection
+STREAMS_PER_CONNECTION = 200
+
+# Every condition of a rule must hold for it to fire; it fires at most once per bar.
+DEFAULT_RULES = [
+    {"name": "rsi_oversold", "rsi_below": 30},
+    {"name": "below_sma_20", "below_sma": 20, "pct": 5},
+    {"name": "drawdown", "drop_from_high": 10, "lookback": 30},
+]
+
+
+def load_rules(path=ALERT_RULES_FILE):
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return DEFAULT_RULES
+
+
+class RingBuffer:
+    """
+    The last `capacity` closed bars of a symbol: open times plus an open/high/low/close/volume
+    float64 array, allocated once. Appending overwrites the oldest bar.
+    """
+
+    def __init__(self, capacity: int = RING_SIZE):
+        self.open_times = np.zeros(capacity, dtype=np.int64)
+        self.bars = np.full((capacity, 5), np.nan)
+        self.size = 0
+        self.next = 0
+
+    def append(self, open_time: int, bar: np.ndarray):
+        self.open_times[self.next] = open_time
+        self.bars[self.next] = bar
+        self.next = (self.next + 1) % len(self.bars)
+        self.size = min(self.size + 1, len(self.bars))
+
+    def last(self, n: int) -> np.ndarray:
+        """
+        The newest `n` bars, oldest first.
+        """
+        n = min(n, self.size)
+        return self.bars[(self.next - n + np.arange(n)) % len(self.bars)]
+
+    @property
+    def last_open_time(self):
+        return int(self.open_times[self.next - 1]) if self.size else None
+
+
+class SymbolStream:
+    """
+    Live state of one pair: its ring buffer and the indicator state after its last closed bar.
+    """
+
+    def __init__(self, pair: str, short: str, interval: str, capacity: int = RING_SIZE):
+        self.pair = pair
+        self.short = short
+        self.interval = interval
+        self.ring = RingBuffer(capacity)
+        self.state = None
+        self.fired = set()
+
+    def seed(self, saved_state: dict = None):
+        """
+        Fill the ring and indicator state from history: the technical CSV and its saved state for
+        1d, else the latest closed candles from the REST API.
+        """
+        if self.interval == "1d":
+            csv_path = f"data/{self.short}_technical.csv"
+            if not os.path.exists(csv_path):
+                return
+            self.state = load_indicator_state(csv_path, saved_state)
+            history = read_rows(csv_path).tail(len(self.ring.bars))
+            open_times = history["date"].astype("int64") // 1_000_000
+            bars = history[["open", "high", "low", "close", "volume"]].to_numpy(dtype=float)
+        else:
+            now_ms = int(time.time() * 1000)
+            start_ms = now_ms - len(self.ring.bars) * INTERVAL_MS[self.interval]
+            rows = [row for batch in iter_klines(self.pair, start_ms, self.interval) for row in batch if row[6] < now_ms]
+            if not rows:
+                return
+            open_times = [row[0] for row in rows]
+            bars = np.array([row[1:6] for row in rows], dtype=float)
+            _, self.state = indicators.compute_full(bars[:, 3])
+        for open_time, bar in zip(open_times, bars):
+            self.ring.append(int(open_time), bar)
+
+    def on_kline(self, kline: dict):
+        """
+        Apply one kline update and return the bar with its indicators, or None for a bar that is
+        already closed here. Partial bars get provisional indicators without moving the state.
+        """
+        last = self.ring.last_open_time
+        if last is not None and kline["t"] <= last:
+            return None
+        bar = [float(kline[key]) for key in ("o", "h", "l", "c", "v")]
+        if kline["x"]:
+            columns, state = indicators.update(self.state, bar[3:4])
+            values = {name: float(column[-1]) for name, column in columns.items()}
+            self.ring.append(kline["t"], bar)
+            self.state = state
+        else:
+            values = indicators.step(self.state, bar[3])
+        return {"open_time": kline["t"], "closed": bool(kline["x"]),
+                **dict(zip(("open", "high", "low", "close", "volume"), bar)), **values}
+
+
+def evaluate(rule: dict, snapshot: dict, ring: RingBuffer):
+    """
+    The reasons `rule` holds for this bar, or None when one of its conditions does not.
+    """
+    close = snapshot["close"]
+    reasons = []
+    if "rsi_below" in rule:
+        if not snapshot["rsi"] < rule["rsi_below"]:
+            return None
+        reasons.append(f"RSI {snapshot['rsi']:.1f} < {rule['rsi_below']}")
+    if "below_sma" in rule:
+        sma = snapshot[f"sma_{rule['below_sma']}"]
+        if not close <= sma * (1 - rule.get("pct", 0) / 100):
+            return None
+        reasons.append(f"{(close / sma - 1) * 100:.1f}% vs SMA{rule['below_sma']}")
+    if "drop_from_high" in rule:
+        highs = ring.last(rule.get("lookback", 30) - 1)[:, 1]
+        peak = max(snapshot["high"], np.max(highs) if len(highs) else -np.inf)
+        if not close <= peak * (1 - rule["drop_from_high"] / 100):
+            return None
+        reasons.append(f"{(close / peak - 1) * 100:.1f}% from {rule.get('lookback', 30)}-bar high")
+    return reasons or None
+
+
+class StreamService:
+    """
+    Long-running asyncio service: subscribes to the kline streams of the universe, keeps each
+    pair's bars in a ring buffer, recomputes its indicators incrementally on every update and
+    fires the dip rules straight from the message handler.
+
+    Alerts go to stdout and ALERTS_FILE (one JSON object per line, written off the event loop)
+    with their latency from the exchange's event time. In 1d mode each closed bar is also checkpointed into the pair's
+    technical CSV and indicator state, off the event loop.
+    """
+
+    def __init__(self, symbol_matching: dict = None, interval: str = "1d", rules: list = None,
+                 url: str = STREAM_URL, capacity: int = RING_SIZE, checkpoint: bool = None, on_alert=None):
+        symbol_matching = symbol_matching or universe.load_universe()
+        self.interval = interval
+        self.url = url
+        self.rules = rules if rules is not None else load_rules()
+        # The technical CSVs are daily, so only 1d bars are checkpointed
+        self.checkpoint = interval == "1d" and checkpoint is not False
+        self.on_alert = on_alert
+        self.symbols = {pair: SymbolStream(pair, short.lower(), interval, capacity)
+                        for pair, short in symbol_matching.items()}
+        self.messages = 0
+        self.latencies_ms = deque(maxlen=10_000)
+        self._closed = None
+        self._alerts = None
+
+    def seed(self):
+        states = indicators.load_states()
+        for stream in self.symbols.values():
+            try:
+                stream.seed(states.get(stream.pair))
+            except Exception as e:
+                print(f"Could not seed {stream.pair}, starting without history: {e}")
+
+    def handle(self, payload: dict, received_ms: float) -> list:
+        """
+        Process one websocket message and return the alerts it fired.
+        """
+        data = payload.get("data", payload)
+        kline = data.get("k")
+        stream = self.symbols.get(data.get("s"))
+        if kline is None or stream is None:
+            return []
+        self.messages += 1
+        snapshot = stream.on_kline(kline)
+        if snapshot is None:
+            return []
+
+        alerts = []
+        for rule in self.rules:
+            key = (rule["name"], snapshot["open_time"])
+            if key in stream.fired:
+                continue
+            reasons = evaluate(rule, snapshot, stream.ring)
+            if reasons:
+                stream.fired.add(key)
+                alerts.append(self._alert(stream, rule, reasons, snapshot, data.get("E", received_ms)))
+
+        if snapshot["closed"]:
+            # Bars before this one can no longer fire
+            stream.fired = {key for key in stream.fired if key[1] > snapshot["open_time"]}
+            if self.checkpoint and self._closed is not None:
+                self._closed.put_nowait((stream, snapshot))
+        return alerts
+
+    def _alert(self, stream: SymbolStream, rule: dict, reasons: list, snapshot: dict, event_ms: float) -> dict:
+        latency_ms = time.time() * 1000 - event_ms
+        self.latencies_ms.append(latency_ms)
+        alert = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "pair": stream.pair, "rule": rule["name"], "reason": "; ".join(reasons),
+            "close": snapshot["close"], "bar": pd.Timestamp(snapshot["open_time"], unit="ms").isoformat(),
+            "closed": snapshot["closed"], "latency_ms": round(latency_ms, 3),
+        }
+        print(f"🔔 {stream.pair} {rule['name']}: {alert['reason']} (close {snapshot['close']:g})")
+        if self._alerts is not None:
+            self._alerts.put_nowait(alert)
+        else:
+            self._write_alerts([alert])
+        count("stream_alerts_total", 1, "Dip alerts fired by the stream service", rule=rule["name"])
+        if self.on_alert is not None:
+            self.on_alert(alert)
+        return alert
+
+    @staticmethod
+    def _write_alerts(alerts: list):
+        with open(ALERTS_FILE, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(alert) + "\n" for alert in alerts)
+
+    async def _alert_writer(self):
+        while True:
+            # Alerts fired while the last batch was being written go out together, off the event loop.
+            alerts = [await self._alerts.get()]
+            while not self._alerts.empty():
+                alerts.append(self._alerts.get_nowait())
+            try:
+                await asyncio.to_thread(self._write_alerts, alerts)
+            except Exception as e:
+                print(f"Could not write {len(alerts)} alerts: {e}")
+            finally:
+                for _ in alerts:
+                    self._alerts.task_done()
+
+    def _save_bars(self, closed: list) -> dict:
+        """
+        Append closed 1d bars to the technical CSVs, one append per pair, and return the saved
+        indicator state of every pair touched.
+
+        Indicators are continued from the saved state rather than the stream's, so the stored rows
+        are exactly what fetch_binance would have written. Neither writer stores an open candle, so
+        a bar already stored for a date is final and merge_states may keep it.
+        """
+        states = indicators.load_states()
+        rows = {}
+        for stream, snapshot in closed:
+            date = pd.Timestamp(snapshot["open_time"], unit="ms").date()
+            previous = str(date - pd.Timedelta(days=1))
+            csv_path = f"data/{stream.short}_technical.csv"
+            saved = states.get(stream.pair)
+            if stream not in rows:
+                # Trusted only while it matches the CSV's last row (see load_indicator_state).
+                saved = load_indicator_state(csv_path, saved)
+            if saved is None or saved["last_date"] < previous:
+                # Bars were missed (the service was down, or the CSV is new): catch up through REST.
+                if stream in rows:
+                    with technical_lock(csv_path):
+                        append_unique_rows(pd.DataFrame(rows.pop(stream)), csv_path)
+                saved = states[stream.pair] = update_symbol(stream.pair, stream.short, saved)
+            if saved is None or saved["last_date"] != previous:
+                # This bar is already stored, by the catch-up or fetch_binance. update_symbol only
+                # stores closed candles, so the stored row holds the same final values.
+                continue
+            columns, state = indicators.update(saved, [snapshot["close"]])
+            rows.setdefault(stream, []).append({
+                "date": date, **{key: snapshot[key] for key in ("open", "high", "low", "close", "volume")},
+                **{name: round(float(values[-1]), 2) for name, values in columns.items()}, "symbol": stream.pair,
+            })
+            states[stream.pair] = {**state, "last_date": str(date)}
+        for stream, new_rows in rows.items():
+            csv_path = f"data/{stream.short}_technical.csv"
+            with technical_lock(csv_path):
+                append_unique_rows(pd.DataFrame(new_rows), csv_path)
+
+        states = indicators.merge_states({stream.pair: states.get(stream.pair) for stream, _ in closed})
+        FeatureStore().update(list(dict.fromkeys(stream.short for stream, _ in closed)))
+        return {stream.pair: states.get(stream.pair) for stream, _ in closed}
+
+    async def _checkpointer(self):
+        while True:
+            # Whatever closed while the last batch was being written goes out together.
+            closed = [await self._closed.get()]
+            while not self._closed.empty():
+                closed.append(self._closed.get_nowait())
+            try:
+                saved = await asyncio.to_thread(self._save_bars, closed)
+                # After a REST catch-up the saved state covers the full history; continue from it.
+                for stream, snapshot in closed:
+                    state = saved.get(stream.pair)
+                    if state is not None and state.get("last_date") == pd.Timestamp(snapshot["open_time"], unit="ms").date().isoformat() \
+                            and stream.ring.last_open_time == snapshot["open_time"]:
+                        stream.state = state
+            except Exception as e:
+                print(f"Could not checkpoint {len(closed)} bars: {e}")
+            finally:
+                for _ in closed:
+                    self._closed.task_done()
+
+    async def _listen(self, pairs: list):
+        streams = "/".join(f"{pair.lower()}@kline_{self.interval}" for pair in pairs)
+        delay = 1
+        while True:
+            try:
+                async with connect(f"{self.url}/stream?streams={streams}", max_size=None) as websocket:
+                    delay = 1
+                    async for message in websocket:
+                        self.handle(json.loads(message), time.time() * 1000)
+            except (OSError, ConnectionClosed, InvalidHandshake) as e:
+                # Binance also drops every connection after 24h
+                print(f"Stream disconnected ({e}), reconnecting in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+
+    async def run(self, duration: float = None):
+        """
+        Stream until cancelled, or for `duration` seconds.
+        """
+        await asyncio.to_thread(self.seed)
+        self._closed = asyncio.Queue()
+        self._alerts = asyncio.Queue()
+        pairs = list(self.symbols)
+        tasks = [asyncio.create_task(self._listen(pairs[i:i + STREAMS_PER_CONNECTION]))
+                 for i in range(0, len(pairs), STREAMS_PER_CONNECTION)]
+        checkpointer = asyncio.create_task(self._checkpointer())
+        alert_writer = asyncio.create_task(self._alert_writer())
+        print(f"Streaming {len(pairs)} pairs at {self.interval} over {len(tasks)} connection(s)")
+        try:
+            await asyncio.wait(tasks, timeout=duration)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._closed.join()
+            await self._alerts.join()
+            checkpointer.cancel()
+            alert_writer.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream klines and fire dip alerts.")
+    parser.add_argument("--interval", default="1d", choices=list(INTERVAL_MS))
+    parser.add_argument("--symbols", nargs="+", help="Pairs to stream (default: the universe)")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument("--no-checkpoint", dest="checkpoint", action="store_false", default=None,
+                        help="Do not write closed 1d bars to the technical CSVs")
+    args = parser.parse_args(argv)
+
+    symbol_matching = universe.load_universe()
+    if args.symbols:
+        symbol_matching = {pair: symbol_matching.get(pair, pair.removesuffix("USDT")) for pair in args.symbols}
+    service = StreamService(symbol_matching, args.interval, checkpoint=args.checkpoint)
+    try:
+        asyncio.run(service.run(args.duration))
+    except KeyboardInterrupt:
+        pass
+    print(f"Processed {service.messages} messages")
+
+
+if __name__ == "__main__":
+    main()
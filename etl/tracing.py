@@ -0,0 +1,194 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+TRACE_FILE = os.getenv("DIPSIGNAL_TRACE_FILE", "data/traces.jsonl")
+METRICS_FILE = os.getenv("DIPSIGNAL_METRICS_FILE", "data/metrics.prom")
+METRIC_PREFIX = "dipsignal"
+
+RUN_ID = uuid.uuid4().hex[:12]
+
+_lock = threading.Lock()
+_spans = defaultdict(lambda: {"count": 0, "errors": 0, "seconds": 0.0})
+_counters = defaultdict(float)
+_help = {}
+_exit_hook = False
+
+
+def tracing_enabled() -> bool:
+    """
+    Tracing is on unless DIPSIGNAL_TRACING is set to 0/false/off.
+    """
+    return os.getenv("DIPSIGNAL_TRACING", "1").lower() not in ("0", "false", "off", "no")
+
+
+class Span:
+    """
+    One timed operation. Attributes set while it runs end up in its JSON line.
+    """
+
+    def __init__(self, name: str, target: str, attrs: dict):
+        self.name = name
+        self.target = target
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+def _register_exit_hook():
+    global _exit_hook
+    if not _exit_hook:
+        _exit_hook = True
+        atexit.register(export_metrics)
+
+
+def _write_line(record: dict):
+    line = json.dumps(record, default=str) + "\n"
+    with _lock:
+        os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+        with open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+@contextmanager
+def span(name: str, target: str = "", **attrs):
+    """
+    Time the enclosed block as span `name` and record it as a JSON line in TRACE_FILE.
+
+    `target` (host, file or model) is the only attribute that becomes a Prometheus label, so
+    keep it low-cardinality; everything else goes to the JSON line only.
+
+    Usage:
+        with span("http", target="api.binance.com", symbol=symbol) as s:
+            ...
+            s.set(status=response.status_code)
+    """
+    current = Span(name, target, attrs)
+    if not tracing_enabled():
+        yield current
+        return
+
+    started_at = time.time()
+    started = time.perf_counter()
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            stats = _spans[(name, target)]
+            stats["count"] += 1
+            stats["seconds"] += elapsed
+            stats["errors"] += error is not None
+        _register_exit_hook()
+        record = {
+            "run": RUN_ID, "span": name, "target": target, "start": round(started_at, 6),
+            "seconds": round(elapsed, 6), "thread": threading.current_thread().name,
+            "status": "error" if error else "ok", **current.attrs,
+        }
+        if error:
+            record["error"] = error
+        _write_line(record)
+
+
+def count(metric: str, value: float, description: str = "", **labels):
+    """
+    Add `value` to the counter `metric` (exported as dipsignal_<metric>).
+    """
+    if not tracing_enabled() or value is None:
+        return
+    with _lock:
+        _counters[(metric, tuple(sorted(labels.items())))] += value
+        if description:
+            _help[metric] = description
+    _register_exit_hook()
+
+
+def take_metrics() -> dict:
+    """
+    The spans and counters recorded in this process since the last call, removing them here.
+    Worker processes return this with their result, since they exit without running atexit hooks.
+    """
+    with _lock:
+        taken = {"spans": {key: dict(stats) for key, stats in _spans.items()},
+                 "counters": dict(_counters), "help": dict(_help)}
+        _spans.clear()
+        _counters.clear()
+    return taken
+
+
+def merge_metrics(taken: dict):
+    """
+    Add metrics taken in another process (take_metrics) to this one's, for export_metrics.
+    """
+    if not tracing_enabled() or not (taken["spans"] or taken["counters"]):
+        return
+    with _lock:
+        for key, stats in taken["spans"].items():
+            for field, value in stats.items():
+                _spans[key][field] += value
+        for key, value in taken["counters"].items():
+            _counters[key] += value
+        _help.update(taken["help"])
+    _register_exit_hook()
+
+
+def _labels(**labels) -> str:
+    escaped = {key: str(value).replace("\\", "\\\\").replace('"', '\\"') for key, value in labels.items()}
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+
+def render_metrics() -> str:
+    """
+    The metrics collected in this process, in the Prometheus text exposition format.
+    """
+    with _lock:
+        spans = {key: dict(stats) for key, stats in _spans.items()}
+        counters = dict(_counters)
+        help_text = dict(_help)
+
+    lines = []
+    for suffix, field, description in [
+        ("span_seconds_total", "seconds", "Wall-clock seconds spent in spans"),
+        ("span_count_total", "count", "Spans recorded"),
+        ("span_errors_total", "errors", "Spans that raised"),
+    ]:
+        lines += [f"# HELP {METRIC_PREFIX}_{suffix} {description}", f"# TYPE {METRIC_PREFIX}_{suffix} counter"]
+        for (name, target), stats in sorted(spans.items()):
+            lines.append(f"{METRIC_PREFIX}_{suffix}{_labels(span=name, target=target)} {stats[field]:g}")
+
+    for metric in sorted({metric for metric, _ in counters}):
+        lines += [f"# HELP {METRIC_PREFIX}_{metric} {help_text.get(metric, metric)}",
+                  f"# TYPE {METRIC_PREFIX}_{metric} counter"]
+        for (name, labels), value in sorted(counters.items()):
+            if name == metric:
+                lines.append(f"{METRIC_PREFIX}_{metric}{_labels(**dict(labels))} {value:g}")
+
+    lines += [f"# HELP {METRIC_PREFIX}_run_timestamp_seconds When these metrics were written",
+              f"# TYPE {METRIC_PREFIX}_run_timestamp_seconds gauge",
+              f"{METRIC_PREFIX}_run_timestamp_seconds {time.time():.0f}"]
+    return "\n".join(lines) + "\n"
+
+
+def export_metrics(path: str = None):
+    """
+    Write the Prometheus textfile (for node_exporter's textfile collector) atomically.
+    Called automatically at exit once anything was recorded.
+    """
+    if not tracing_enabled() or not (_spans or _counters):
+        return
+    path = path or METRICS_FILE
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_metrics())
+    os.replace(tmp_path, path)
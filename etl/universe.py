@@ -0,0 +1,153 @@
+import json
+import multiprocessing
+import os
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from etl.tracing import merge_metrics, take_metrics
+
+UNIVERSE_FILE = os.getenv("DIPSIGNAL_UNIVERSE_FILE", "data/universe.json")
+# Discovered listings are kept for the day so every stage of a run sees the same universe
+DISCOVERED_FILE = "data/universe_discovered.json"
+# Pairs per shard and shards processed at once; memory is bounded by PROCESSES shards in flight
+SHARD_SIZE = int(os.getenv("UNIVERSE_SHARD_SIZE", 50))
+PROCESSES = int(os.getenv("UNIVERSE_PROCESSES", min(4, os.cpu_count() or 1)))
+DEFAULT_UNIVERSE = {
+    "BTCUSDT": "BTC",
+    "ETHUSDT": "ETH",
+    "BNBUSDT": "BNB",
+    "XRPUSDT": "XRP",
+    "ADAUSDT": "ADA",
+    "SOLUSDT": "SOL",
+}
+
+
+def _binance_url() -> str:
+    return os.getenv("BINANCE_API_URL", "https://api.binance.com")
+
+
+def discover(quote: str = "USDT", min_quote_volume: float = 0.0, limit: int = None, exclude=()) -> dict:
+    """
+    Build the universe from Binance's exchangeInfo listing: every trading spot pair quoted in
+    `quote`, with at least `min_quote_volume` traded over 24h, largest first.
+
+    Returns:
+        dict: Pair -> coin short name, e.g. {"BTCUSDT": "BTC"}
+    """
+    # Imported here so the pipeline and CLI can read the universe without loading requests
+    from etl.http import get_session
+
+    session = get_session()
+    response = session.get(f"{_binance_url()}/api/v3/exchangeInfo", timeout=30)
+    response.raise_for_status()
+    listed = {
+        item["symbol"]: item["baseAsset"]
+        for item in response.json()["symbols"]
+        if item.get("status") == "TRADING" and item.get("quoteAsset") == quote
+        and item.get("isSpotTradingAllowed", True) and item["baseAsset"] not in exclude
+    }
+
+    response = session.get(f"{_binance_url()}/api/v3/ticker/24hr", timeout=30)
+    response.raise_for_status()
+    volumes = {item["symbol"]: float(item.get("quoteVolume", 0)) for item in response.json()}
+
+    pairs = sorted((pair for pair in listed if volumes.get(pair, 0.0) >= min_quote_volume),
+                   key=lambda pair: volumes.get(pair, 0.0), reverse=True)
+    return {pair: listed[pair] for pair in pairs[:limit]}
+
+
+def load_universe(path: str = UNIVERSE_FILE, refresh: bool = False) -> dict:
+    """
+    The tracked pairs, from `path` when it exists, else the six default coins.
+
+    The file either lists pairs, {"symbols": {"BTCUSDT": "BTC", ...}}, or asks for discovery,
+    {"discover": {"quote": "USDT", "min_quote_volume": 10000000, "limit": 300, "exclude": [...]}},
+    optionally with "include" pairs that are always tracked. A discovered universe is stored in
+    DISCOVERED_FILE and reused for the rest of the day unless `refresh`.
+
+    Returns:
+        dict: Pair -> coin short name, e.g. {"BTCUSDT": "BTC"}
+    """
+    if not os.path.exists(path):
+        return dict(DEFAULT_UNIVERSE)
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    universe = dict(config.get("include", {}))
+    if "symbols" in config:
+        universe.update(config["symbols"])
+    if "discover" in config:
+        today = date.today().isoformat()
+        cached = None
+        if not refresh and os.path.exists(DISCOVERED_FILE):
+            with open(DISCOVERED_FILE, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        if cached is None or cached.get("date") != today or cached.get("config") != config["discover"]:
+            cached = {"date": today, "config": config["discover"], "symbols": discover(**config["discover"])}
+            tmp_path = f"{DISCOVERED_FILE}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cached, f, indent=2)
+            os.replace(tmp_path, DISCOVERED_FILE)
+        universe.update(cached["symbols"])
+    return universe
+
+
+def coins(universe: dict = None) -> dict:
+    """
+    Coin name -> file short name ({"BTC": "btc"}), the form the LLaMA stages use.
+    """
+    universe = universe if universe is not None else load_universe()
+    return {coin: coin.lower() for coin in universe.values()}
+
+
+def technical_files(universe: dict = None) -> list:
+    return [f"data/{short}_technical.csv" for short in coins(universe).values()]
+
+
+def shard_count(universe: dict, shard_size: int = SHARD_SIZE) -> int:
+    return max(1, -(-len(universe) // shard_size))
+
+
+def shard(universe: dict, n_shards: int) -> list:
+    """
+    Split the universe into `n_shards` dicts. A pair's shard depends only on its name, so adding
+    or removing pairs does not move the others.
+    """
+    shards = [{} for _ in range(max(1, n_shards))]
+    for pair, coin in universe.items():
+        shards[zlib.crc32(pair.encode()) % len(shards)][pair] = coin
+    return [part for part in shards if part]
+
+
+def map_shards(fn, shards: list, processes: int, *args):
+    """
+    Call fn(shard, *args) for every shard in a pool of `processes` worker processes, yielding the
+    results in shard order. Each worker handles one shard and is then replaced, so a process
+    never holds more than one shard's data. The spans and counters a worker records are merged
+    into this process's metrics.
+
+    Workers are started by a fork server (spawned where there is none), not forked from the
+    caller: the pipeline calls this from stage threads, and a fork taken while another thread
+    holds a lock (tracing, urllib3's pools) leaves that lock held forever in the child.
+    """
+    if processes <= 1 or len(shards) <= 1:
+        for part in shards:
+            yield fn(part, *args)
+        return
+    options = {"max_tasks_per_child": 1} if sys.version_info >= (3, 11) else {}
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(method), **options) as executor:
+        for result, metrics in executor.map(_traced_shard, [fn] * len(shards), shards,
+                                            *([arg] * len(shards) for arg in args)):
+            merge_metrics(metrics)
+            yield result
+
+
+def _traced_shard(fn, part: dict, *args) -> tuple:
+    """
+    fn(part, *args) in a worker process, with the metrics it recorded; workers exit without
+    running atexit hooks, so the parent exports them.
+    """
+    return fn(part, *args), take_metrics()
@@ -1,11 +1,22 @@
 import pandas as pd
-import requests
+import threading
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
+from etl.news_dedup import NewsIndex
+from etl.news_queue import NewsQueue
+from llama import ollama
 
-BATCH_SIZE = 10
+# Batches are sized by estimated prompt tokens; BATCH_SIZE only caps the article count
+# so the numbered answer stays easy for the model to follow.
+BATCH_SIZE = 25
+BATCH_TOKEN_BUDGET = int(os.getenv("NEWS_BATCH_TOKEN_BUDGET", 1500))
+# Requests kept in flight against Ollama (match OLLAMA_NUM_PARALLEL on the server)
+CONCURRENCY = int(os.getenv("NEWS_SCORING_CONCURRENCY", 2))
 RAW_FILE = "data/raw_news.csv"
 SCORED_FILE = "data/news_scored.csv"
+# Sentiments that record a failed answer; never copied to the rest of a story's cluster
+FAILED_SENTIMENTS = ("error", "exception", "missing", "parse_error")
 
 def build_batched_prompt(batch):
     prompt = (
@@ -23,70 +34,182 @@ def build_batched_prompt(batch):
         prompt += f"{i}. Title: {row.title}\n   Summary: {row.summary}\n"
     return prompt
 
+def article_tokens(batch):
+    return [ollama.estimate_tokens(f"{i}. Title: {row.title}\n   Summary: {row.summary}\n")
+            for i, row in enumerate(batch.itertuples(), start=1)]
+
+def parse_line(line):
+    """
+    Parse one 'N. Sentiment: ... Confidence: ... Rationale: ...' answer line.
+
+    Returns:
+        tuple | None: (N, (sentiment, confidence, rationale)), or None if the line is not an answer
+    """
+    number = line.split(".", 1)[0].strip()
+    if not number.isdigit():
+        return None
+    try:
+        sentiment = line.split("Sentiment:")[1].split("Confidence:")[0].strip()
+        confidence = line.split("Confidence:")[1].split("Rationale:")[0].strip()
+        rationale = line.split("Rationale:")[1].strip()
+    except Exception:
+        sentiment, confidence, rationale = "parse_error", 0, "parse_error"
+    return int(number), (sentiment, confidence, rationale)
+
+def collect_results(parsed, batch_size):
+    return [parsed.get(i, ("missing", 0, "missing")) for i in range(1, batch_size + 1)]
+
 def parse_batched_response(response_text, batch_size):
-    lines = response_text.strip().splitlines()
-    results = []
-
-    for i in range(1, batch_size + 1):
-        line = next((l for l in lines if l.startswith(f"{i}.")), None)
-        if line:
-            try:
-                sentiment = line.split("Sentiment:")[1].split("Confidence:")[0].strip()
-                confidence = line.split("Confidence:")[1].split("Rationale:")[0].strip()
-                rationale = line.split("Rationale:")[1].strip()
-            except Exception:
-                sentiment, confidence, rationale = "parse_error", 0, "parse_error"
-        else:
-            sentiment, confidence, rationale = "missing", 0, "missing"
-        results.append((sentiment, confidence, rationale))
-    return results
-
-def get_batch_sentiment(batch):
+    parsed = {}
+    for line in response_text.strip().splitlines():
+        item = parse_line(line)
+        if item and item[0] not in parsed:
+            parsed[item[0]] = item[1]
+    return collect_results(parsed, batch_size)
+
+def get_batch_sentiment(batch, stats=None):
+    """
+    Score one batch, parsing each answer line as soon as it is streamed back.
+    `stats` (dict) accumulates Ollama's prompt/eval token counts when given.
+    """
     prompt = build_batched_prompt(batch)
+    parsed = {}
+
+    def on_line(line):
+        item = parse_line(line.strip())
+        if item and item[0] not in parsed:
+            parsed[item[0]] = item[1]
+
     try:
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={
-                "model": "llama3.1",
-                "prompt": prompt,
-                "stream": False
-            }
-        )
-        if response.status_code == 200:
-            return parse_batched_response(response.json()["response"], len(batch))
-        else:
+        result = ollama.generate(prompt, on_line=on_line)
+    except Exception as e:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+        if status is not None:
             return [("error", 0, "http_error")] * len(batch)
-    except Exception:
         return [("exception", 0, "exception_thrown")] * len(batch)
 
-def process_batches():
+    if stats is not None and not result["cached"]:
+        stats["prompt_tokens"] += result.get("prompt_eval_count", 0)
+        stats["eval_tokens"] += result.get("eval_count", 0)
+    return collect_results(parsed, len(batch))
+
+def scored_representatives(index, path=SCORED_FILE):
+    """
+    Stored (sentiment, confidence, rationale) of the cluster representatives already in news_scored.csv.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return {}
+    scored = pd.read_csv(path, usecols=["url", "sentiment", "confidence", "rationale"])
+    scored = scored[~scored["sentiment"].isin(FAILED_SENTIMENTS)]
+    return {
+        row.url: (row.sentiment, row.confidence, row.rationale)
+        for row in scored.itertuples(index=False)
+        if index.cluster_of(row.url) == row.url
+    }
+
+def score_batch(batch, index, known, stats=None):
+    """
+    Sentiment per article of `batch`, sending one article per near-duplicate cluster to Ollama.
+
+    An article whose cluster representative is already scored (`known`, or earlier in the batch)
+    gets the representative's sentiment; it is only sent itself when the representative is
+    not scored yet, e.g. while another worker holds it, or when the representative's answer in
+    this batch failed (FAILED_SENTIMENTS are never copied).
+    """
+    clusters = [index.cluster_of(url) for url in batch["url"]]
+    in_batch = set(batch["url"])
+    send = [cluster == url or (cluster not in known and cluster not in in_batch)
+            for cluster, url in zip(clusters, batch["url"])]
+
+    results = dict(zip(batch["url"][send], get_batch_sentiment(batch[send], stats) if any(send) else []))
+    retry = [not sent and cluster not in known and results[cluster][0] in FAILED_SENTIMENTS
+             for sent, cluster in zip(send, clusters)]
+    if any(retry):
+        results.update(zip(batch["url"][retry], get_batch_sentiment(batch[retry], stats)))
+    return [results[url] if url in results else results.get(cluster, known.get(cluster))
+            for cluster, url in zip(clusters, batch["url"])]
+
+def process_batches(worker=None, concurrency=CONCURRENCY):
+    """
+    Score pending articles from the news queue.
+
+    `concurrency` scorer threads each lease a batch sized to BATCH_TOKEN_BUDGET estimated
+    prompt tokens, stream it through Ollama and ack it once its rows are appended to
+    news_scored.csv. A crashed run resumes after the last finished batch, and several
+    processes (distinct `worker` names) can score the same backlog without overlap.
+
+    Near-duplicates (etl.news_dedup) of an already scored story cost no prompt tokens: they
+    take the representative's sentiment, so the budget fills with distinct stories.
+    """
     if not os.path.exists(RAW_FILE):
         print("No raw_news.csv file found.")
         return
-    
-    raw_df = pd.read_csv(RAW_FILE)
-    if len(raw_df.index) == 0:
+
+    queue = NewsQueue(raw_path=RAW_FILE, scored_path=SCORED_FILE, worker=worker)
+    if queue.pending() == 0:
         print("raw_news.csv is empty.")
         return
 
-    while not raw_df.empty or len(raw_df.index) > 0:
-        batch = raw_df.head(BATCH_SIZE).copy()
-        results = get_batch_sentiment(batch)
+    index = NewsIndex()
+    known = scored_representatives(index)
+    stats = {"articles": 0, "duplicates": 0, "prompt_tokens": 0, "eval_tokens": 0}
+    stats_lock = threading.Lock()
+
+    def cost(rows):
+        # Only a copy of an already scored story is free; one whose representative is still to be
+        # scored may be sent itself, if the representative is held elsewhere or its answer fails.
+        tokens = article_tokens(rows)
+        clusters = [index.cluster_of(url) for url in rows["url"]]
+        with stats_lock:
+            free = [cluster != url and cluster in known for cluster, url in zip(clusters, rows["url"])]
+        return [0 if is_free else t for is_free, t in zip(free, tokens)]
+
+    def score_until_empty():
+        while True:
+            lease = queue.lease(BATCH_SIZE, cost=cost, budget=BATCH_TOKEN_BUDGET)
+            if lease is None:
+                return
+            start, end, rows = lease
+            batch = rows.copy()
+            batch_stats = {"prompt_tokens": 0, "eval_tokens": 0}
+            with stats_lock:
+                known_now = dict(known)
+            with queue.keep_alive(start, end):
+                results = score_batch(batch, index, known_now, batch_stats)
 
-        batch['sentiment'], batch['confidence'], batch['rationale'] = zip(*results)
+            batch['sentiment'], batch['confidence'], batch['rationale'] = zip(*results)
+            if not queue.ack(start, end, batch):
+                print(f"Lease on rows {start}-{end} was taken over; dropped its {len(batch)} scores.")
+                continue
 
-        # Append to scored file
-        if not os.path.exists(SCORED_FILE):
-            batch.to_csv(SCORED_FILE, index=False)
-        else:
-            batch.to_csv(SCORED_FILE, mode='a', header=False, index=False)
+            duplicates = sum(index.cluster_of(url) != url for url in batch["url"])
+            with stats_lock:
+                known.update({url: result for url, result in zip(batch["url"], results)
+                              if index.cluster_of(url) == url and result[0] not in FAILED_SENTIMENTS})
+                stats["articles"] += len(batch)
+                stats["duplicates"] += duplicates
+                stats["prompt_tokens"] += batch_stats["prompt_tokens"]
+                stats["eval_tokens"] += batch_stats["eval_tokens"]
+            print(f"Processed batch of {len(batch)} articles ({duplicates} near-duplicates).")
 
-        # Remove processed rows from raw_df and update file
-        raw_df = raw_df.iloc[BATCH_SIZE:]
-        raw_df.to_csv(RAW_FILE, index=False)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(score_until_empty) for _ in range(concurrency)]:
+            future.result()
+    elapsed = max(time.perf_counter() - started, 1e-9)
+
+    print(
+        f"Scored {stats['articles']} articles in {elapsed:.1f}s: "
+        f"{stats['articles'] / elapsed:.2f} articles/s, "
+        f"{stats['eval_tokens'] / elapsed:.1f} generated tokens/s, "
+        f"{stats['prompt_tokens'] / elapsed:.1f} prompt tokens/s, "
+        f"{stats['duplicates']} near-duplicates"
+    )
+    print(ollama.cache_summary())
 
-        print(f"Processed batch of {len(batch)} articles.")
-        time.sleep(1)
+    # Drained: empty raw_news.csv as the old per-batch rewrite eventually did.
+    queue.compact()
+    return stats
 
 if __name__ == "__main__":
     process_batches()
@@ -1,119 +1,352 @@
 import pandas as pd
 import requests
+import time
 from datetime import datetime
 import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+import argparse
+from etl import universe
+from etl.feature_store import FeatureStore
 from etl.to_csv import append_unique_rows
+from llama import ollama, regime
+from llama.prompt_encoding import ENCODERS, encode_table
 
+# Coin requests in flight at once (match OLLAMA_NUM_PARALLEL on the server)
+CONCURRENCY = int(os.getenv("PREDICTION_CONCURRENCY", 2))
+KEEP_ALIVE = "30m"
+LATENCY_FILE = "data/llama_prediction_latency.csv"
+BACKFILL_FILE = "data/llama_backfill_{short}.csv"
+WINDOW = 30
+# coin_frame column -> prompt column name, after the coin prefix
+COIN_FEATURES = {
+    "open": "open_price",
+    "high": "high_price",
+    "low": "low_price",
+    "close": "close_price",
+    "volume": "volume",
+    "sma_20": "simple_moving_average_20",
+    "sma_50": "simple_moving_average_50",
+    "sma_200": "simple_moving_average_200",
+    "rsi": "rsi",
+    "macd": "macd",
+    "pct_change": "pct_change",
+}
+# coin_frame column -> prompt column name, the same for every coin
+SHARED_FEATURES = {
+    "value": "fear_and_greed_index_value",
+    "classification": "fear_and_greed_index_classification",
+    "dxy": "dollar_index",
+}
 
-def make_llama_prompt(merged: pd.DataFrame, coin: str) -> str:
-    table = merged.tail(30).to_markdown(index=True)
-    prompt = f"""
-    You are a financial assistant LLM that analyzes macroeconomic and technical indicators to generate a decision on {coin}.
-    You will be given a table with the last 30 days of metrics. Based on the patterns in the data and any signals from technical indicators or macro conditions, give a recommendation on whether to Buy, Hold, or Sell {coin}.
+# Identical for every coin and placed first, so the server's prompt cache can reuse its prefill
+# and only the coin name and table are new work per call.
+PROMPT_PREFIX = """You are a financial assistant LLM that analyzes macroeconomic and technical indicators to generate a decision on a cryptocurrency.
+You will be given the coin name and a table with the last 30 days of its metrics. Based on the patterns in the data and any signals from technical indicators or macro conditions, give a recommendation on whether to Buy, Hold, or Sell the coin.
 
-    Respond with the following format:
-    1. Decision: Buy / Hold / Sell
-    2. Confidence: Float between 0 and 1
-    3. Rationale: A brief explanation using the data trends.
+Respond with the following format:
+1. Decision: Buy / Hold / Sell
+2. Confidence: Float between 0 and 1
+3. Rationale: A brief explanation using the data trends.
 
-    {table}
+"""
+
+
+def make_llama_prompt(merged: pd.DataFrame, coin: str, encoding: str = None) -> str:
+    table = encode_table(merged.tail(WINDOW), coin, encoding)
+    return f"{PROMPT_PREFIX}Coin: {coin}\n\n{table}\n"
+
+
+def build_features(short: str, store: FeatureStore):
+    if short not in store.meta["watermarks"]:
+        print(f"⚠️ Skipping {short.upper()} — no technical data in the feature store.")
+        return None
+
+    # Technicals already joined with FGI and macro data on common dates
+    merged = store.coin_frame(short)
+
+    # Columns given to the model, renamed to include the coin-specific prefix
+    columns = {
+        **{col: f"{short}_{name}" for col, name in COIN_FEATURES.items()},
+        **SHARED_FEATURES,
+    }
+    merged = merged[["date", *columns]].rename(columns=columns)
+    return merged[["date"] + sorted(columns.values())]
+
+
+def parse_recommendation(output: str) -> tuple:
+    lines = output.strip().splitlines()
+    decision = next((line.split(":")[1].strip() for line in lines if "Decision" in line), "")
+    confidence = next((line.split(":")[1].strip() for line in lines if "Confidence" in line), "")
+    rationale = next((line.split(":")[1].strip() for line in lines if "Rationale" in line), "")
+    return decision, confidence, rationale
+
+
+def predict(coin: str, prompt: str) -> dict:
+    """
+    Ask the model for one coin's recommendation and time the call.
     """
-    return prompt
-
-
-def main():
-    # Load external data once
-    fgi_df = pd.read_csv("data/fgi.csv")
-    macro_df = pd.read_csv("data/macro.csv")
-    fgi_df["date"] = pd.to_datetime(fgi_df["date"])
-    macro_df["date"] = pd.to_datetime(macro_df["date"])
-
-    symbol_matching = {
-        "BTC": "btc",
-        "ETH": "eth",
-        "BNB": "bnb",
-        "XRP": "xrp",
-        "ADA": "ada",
-        "SOL": "sol",
+    started = time.perf_counter()
+    result = ollama.generate(prompt, keep_alive=KEEP_ALIVE)
+    first_token_s = result.get("first_token_s")
+    decision, confidence, rationale = parse_recommendation(result["response"])
+    return {
+        "coin": coin,
+        "recommendation": decision,
+        "confidence": confidence,
+        "rationale": rationale,
+        "latency_s": round(time.perf_counter() - started, 3),
+        "first_token_s": round(first_token_s, 3) if first_token_s is not None else None,
+        "prompt_eval_count": result.get("prompt_eval_count"),
+        "eval_count": result.get("eval_count"),
+        "cached": result["cached"],
     }
 
+
+def run_predictions(prompts, concurrency: int = CONCURRENCY):
+    """
+    Run prompts concurrently, yielding (key, prediction, error) as each call completes.
+
+    `prompts` is a dict or an iterable of (key, (coin, prompt)) pairs; it is consumed lazily and at
+    most twice `concurrency` prompts are held in memory. Prompts are submitted in a fixed order and
+    share PROMPT_PREFIX, so every server slot reuses the cached prefix from its previous call.
+    """
+    items = iter(prompts.items() if isinstance(prompts, dict) else prompts)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = {}
+        while True:
+            for key, (coin, prompt) in islice(items, max(0, 2 * concurrency - len(in_flight))):
+                in_flight[executor.submit(predict, coin, prompt)] = key
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = in_flight.pop(future)
+                try:
+                    yield key, future.result(), None
+                except Exception as e:
+                    yield key, None, e
+
+
+def backfill_prompts(symbol_matching: dict, done: set, start=None, end=None, encoding: str = None):
+    """
+    Yield ((date, coin), (coin, prompt)) for every date with a full 30-day window and no saved result.
+
+    Coins are taken one universe shard at a time, so only that shard's feature frames are in
+    memory; windows are positional slices of them.
+    """
+    store = FeatureStore()
+    store.update()
+    shards = universe.shard(symbol_matching, universe.shard_count(symbol_matching))
+
+    def coin_jobs(coin: str, dates: pd.DatetimeIndex) -> list:
+        positions = pd.RangeIndex(len(dates))
+        wanted = positions >= WINDOW - 1
+        if start is not None:
+            wanted &= dates >= pd.to_datetime(start)
+        if end is not None:
+            wanted &= dates <= pd.to_datetime(end)
+        labels = dates.strftime("%Y-%m-%d")
+        return [i for i in positions[wanted] if (labels[i], coin) not in done]
+
+    # Counted up front for the progress report from each coin's complete days alone; the feature
+    # frames are built once, shard by shard, below.
+    total = sum(len(coin_jobs(coin, store.coin_dates(short)))
+                for coin, short in symbol_matching.items() if short in store.meta["watermarks"])
+
+    def pending():
+        for part in shards:
+            frames, jobs = {}, []
+            for coin, short in part.items():
+                merged = build_features(short, store)
+                if merged is not None:
+                    frames[coin] = merged.reset_index(drop=True)
+                    jobs.extend((coin, i) for i in coin_jobs(coin, pd.DatetimeIndex(frames[coin]["date"])))
+            # Date-major order: results fill in evenly across the shard's coins.
+            for coin, i in sorted(jobs, key=lambda job: (frames[job[0]]["date"].iat[job[1]], job[0])):
+                window = frames[coin].iloc[i - WINDOW + 1:i + 1]
+                date = window["date"].iat[-1].date().isoformat()
+                yield (date, coin), (coin, make_llama_prompt(window, coin, encoding))
+
+    return total, pending()
+
+
+def backfill(start=None, end=None, concurrency: int = CONCURRENCY, report_every: int = 10, encoding: str = None):
+    """
+    Produce one recommendation per coin for every past date into data/llama_backfill_{coin}.csv.
+
+    The output files double as the checkpoint: (date, coin) pairs already written are skipped, so
+    an interrupted backfill resumes where it stopped.
+    """
+    symbol_matching = universe.coins()
+
+    done = set()
     for coin, short in symbol_matching.items():
-        technical_path = f"data/{short}_technical.csv"
-        if not os.path.exists(technical_path):
-            print(f"⚠️ Skipping {coin} — no technical data file found.")
-            continue
+        path = BACKFILL_FILE.format(short=short)
+        if os.path.exists(path):
+            done.update((date, coin) for date in pd.read_csv(path, usecols=["date"])["date"].astype(str))
 
-        tech_df = pd.read_csv(technical_path)
-        if tech_df.empty:
-            print(f"⚠️ Skipping {coin} — technical file is empty.")
-            continue
+    total, prompts = backfill_prompts(symbol_matching, done, start, end, encoding)
+    print(f"Backfill: {total} prompts to run, {len(done)} already done")
 
-        tech_df["date"] = pd.to_datetime(tech_df["date"])
-
-        # Merge with external data
-        merged = tech_df.merge(fgi_df, on="date", how="inner").merge(macro_df, on="date", how="inner")
-        merged.sort_values("date", inplace=True)
-
-        # Rename columns to include coin-specific prefix
-        rename_cols = {
-            "open": f"{short}_open_price",
-            "high": f"{short}_high_price",
-            "low": f"{short}_low_price",
-            "close": f"{short}_close_price",
-            "volume": f"{short}_volume",
-            "sma_20": f"{short}_simple_moving_average_20",
-            "sma_50": f"{short}_simple_moving_average_50",
-            "sma_200": f"{short}_simple_moving_average_200",
-            "rsi": f"{short}_rsi",
-            "macd": f"{short}_macd",
-            "pct_change": f"{short}_pct_change",
-            "value": "fear_and_greed_index_value",
-            "classification": "fear_and_greed_index_classification",
-            "dxy": "dollar_index",
-            "cpi": "us_consumer_price_index",
-            "sp500": "sp500_index",
-            "interest_rate": "us_fund_rate",
-        }
-        merged.rename(columns=rename_cols, inplace=True)
-
-        # Select relevant columns
-        features = [col for col in merged.columns if short in col or "fear" in col or "dollar" in col]
-        features = ["date"] + sorted(set(features))
-        merged = merged[features]
-
-        # Prepare LLaMA prompt
-        prompt = make_llama_prompt(merged, coin)
-
-        # Call LLaMA
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={
-                "model": "llama3.1",
-                "prompt": prompt,
-                "stream": False
-            }
-        )
-
-        if response.status_code == 200:
-            output = response.json()["response"]
-            lines = output.strip().splitlines()
-            decision = next((line.split(":")[1].strip() for line in lines if "Decision" in line), "")
-            confidence = next((line.split(":")[1].strip() for line in lines if "Confidence" in line), "")
-            rationale = next((line.split(":")[1].strip() for line in lines if "Rationale" in line), "")
-
-            today = pd.to_datetime(datetime.today().date())
-            result_df = pd.DataFrame([{
-                "date": today,
-                "recommendation": decision,
-                "confidence": confidence,
-                "rationale": rationale
-            }])
-
-            output_path = f"data/llama_recommendations_{short}.csv"
-            append_unique_rows(result_df, output_path, subset_cols=["date"])
+    started = time.perf_counter()
+    completed = failed = 0
+    for (date, coin), prediction, error in run_predictions(prompts, concurrency):
+        completed += 1
+        if error is not None:
+            failed += 1
+            print(f"❌ {coin} {date}: {error}")
         else:
-            print(f"❌ LLaMA API error for {coin}: {response.status_code} - {response.text}")
+            path = BACKFILL_FILE.format(short=symbol_matching[coin])
+            pd.DataFrame([{
+                "date": date,
+                "recommendation": prediction["recommendation"],
+                "confidence": prediction["confidence"],
+                "rationale": prediction["rationale"],
+            }]).to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+
+        if completed % report_every == 0 or completed == total:
+            elapsed = time.perf_counter() - started
+            rate = completed / elapsed if elapsed else 0.0
+            eta = (total - completed) / rate if rate else float("inf")
+            print(f"Backfill {completed}/{total} ({failed} failed), {rate:.2f} prompts/s, ETA {eta / 60:.1f} min")
+
+
+def shard_prompts(symbol_matching: dict, encoding: str = None) -> dict:
+    """
+    {coin: (coin, prompt)} for one shard of coins. Run in a worker process, so the shard's
+    feature frames never reach the parent; only the prompt text does.
+    """
+    store = FeatureStore()
+    prompts = {}
+    for coin, short in symbol_matching.items():
+        merged = build_features(short, store)
+        if merged is not None:
+            prompts[coin] = (coin, make_llama_prompt(merged, coin, encoding))
+    return prompts
+
+
+def recommendation_path(short: str) -> str:
+    return f"data/llama_recommendations_{short}.csv"
+
+
+def carry_forward(short: str, today) -> bool:
+    """
+    Append the newest stored recommendation of a coin again for `today`, flagged as carried.
+
+    Returns:
+        bool: False when the coin has no recommendation to carry
+    """
+    path = recommendation_path(short)
+    if not os.path.exists(path):
+        return False
+    previous = pd.read_csv(path).dropna(subset=["recommendation"])
+    if previous.empty:
+        return False
+    row = previous.iloc[-1]
+    if pd.to_datetime(row["date"]) == today:
+        # Already settled today, by the model or an earlier run
+        return True
+    append_unique_rows(pd.DataFrame([{
+        "date": today,
+        "recommendation": row["recommendation"],
+        "confidence": row["confidence"],
+        "rationale": row["rationale"],
+        "carried": True,
+    }]), path, subset_cols=["date"])
+    return True
+
+
+def main(encoding: str = None, symbol_matching: dict = None, processes: int = None, gate: bool = True):
+    """
+    Today's recommendation for every coin.
+
+    With `gate`, coins whose regime fingerprint (llama.regime) matches the one their last
+    recommendation was made on, less than regime.MAX_CARRY_DAYS ago, carry that recommendation
+    forward instead of calling the model, so the number of calls follows market changes rather
+    than the size of the universe.
+    """
+    # Picks up anything the ETL steps appended since the store was last refreshed
+    store = FeatureStore()
+    store.update()
+
+    symbol_matching = symbol_matching or universe.coins()
+    today = pd.to_datetime(datetime.today().date())
+
+    regimes = regime.load_regimes()
+    current = regime.fingerprints(store, list(symbol_matching.values()))
+    if gate:
+        _, carry = regime.screen(current, regimes, today)
+        carried = {short for short in carry if carry_forward(short, today)}
+        if carried:
+            print(f"Regime unchanged, carried forward {len(carried)} of {len(symbol_matching)} coins: "
+                  + ", ".join(sorted(short.upper() for short in carried)))
+        symbol_matching = {coin: short for coin, short in symbol_matching.items() if short not in carried}
+        if not symbol_matching:
+            print(ollama.cache_summary())
+            return
+
+    shards = universe.shard(symbol_matching, universe.shard_count(symbol_matching))
+    processes = min(processes or universe.PROCESSES, len(shards))
+
+    # Prompts are built shard by shard in worker processes and fed to the LLM calls as they come
+    # in; the calls themselves stay on threads since they only wait on the server.
+    prompts = (item for part in universe.map_shards(shard_prompts, shards, processes, encoding)
+               for item in part.items())
+
+    started = time.perf_counter()
+    latencies = []
+    failed = []
+
+    for coin, prediction, error in run_predictions(prompts):
+        if error is not None:
+            if isinstance(error, requests.HTTPError):
+                print(f"❌ LLaMA API error for {coin}: {error.response.status_code} - {error.response.text}")
+            else:
+                print(f"❌ LLaMA call failed for {coin}: {error}")
+            failed.append(coin)
+            continue
+
+        short = symbol_matching[coin]
+        result_df = pd.DataFrame([{
+            "date": today,
+            "recommendation": prediction["recommendation"],
+            "confidence": prediction["confidence"],
+            "rationale": prediction["rationale"],
+            "carried": False,
+        }])
+
+        append_unique_rows(result_df, recommendation_path(short), subset_cols=["date"])
+        if short in current.index:
+            regimes[short] = {"fingerprint": current.at[short, "fingerprint"],
+                              "date": current.at[short, "date"].date().isoformat(),
+                              "queried": today.date().isoformat()}
+        print(f"{coin}: {prediction['latency_s']:.1f}s")
+        latencies.append({"date": today.date(), **{k: v for k, v in prediction.items()
+                                                   if k not in ("recommendation", "confidence", "rationale")}})
+
+    regime.save_regimes(regimes)
+    if latencies:
+        pd.DataFrame(latencies).to_csv(LATENCY_FILE, mode="a", header=not os.path.exists(LATENCY_FILE), index=False)
+        print(f"Predicted {len(latencies)} coins in {time.perf_counter() - started:.1f}s wall clock")
+    print(ollama.cache_summary())
+    if failed:
+        # Fails the pipeline stage, so its inputs hash is not saved and a rerun asks again; the
+        # coins answered above are carried forward by the regime gate.
+        raise RuntimeError(f"No recommendation for {len(failed)} coins: {', '.join(sorted(failed))}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Generate LLaMA recommendations per coin.")
+    parser.add_argument("--backfill", action="store_true", help="Run every past date instead of today")
+    parser.add_argument("--start", help="First backfill date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last backfill date (YYYY-MM-DD)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--encoding", choices=list(ENCODERS), help="Table encoding (default: PROMPT_ENCODING or markdown)")
+    parser.add_argument("--all", action="store_true", help="Ask the model about every coin, even if its regime is unchanged")
+    args = parser.parse_args()
+
+    if args.backfill:
+        backfill(args.start, args.end, args.concurrency, encoding=args.encoding)
+    else:
+        main(args.encoding, gate=not args.all)
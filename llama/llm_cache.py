@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_FILE = "data/llm_cache.db"
+MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", 30))
+MAX_SIZE_MB = float(os.getenv("LLM_CACHE_MAX_SIZE_MB", 200))
+
+
+def cache_key(model: str, prompt: str, options: dict = None) -> str:
+    payload = json.dumps({"model": model, "prompt": prompt, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_enabled() -> bool:
+    """
+    The cache is on unless LLM_CACHE is set to 0/false/off.
+    """
+    return os.getenv("LLM_CACHE", "1").lower() not in ("0", "false", "off", "no")
+
+
+class ResponseCache:
+    """
+    Persistent content-addressed cache of /api/generate results, keyed by hash(model, prompt, options).
+
+    Entries older than `max_age_days` are dropped, and when the stored responses exceed
+    `max_size_mb` the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str = CACHE_FILE, max_age_days: float = MAX_AGE_DAYS, max_size_mb: float = MAX_SIZE_MB):
+        self.path = path
+        self.max_age_s = max_age_days * 86400
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, result TEXT, size INTEGER, created REAL, last_used REAL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT result, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.max_age_s:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, model: str, result: dict):
+        text = json.dumps(result)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, result, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, text, len(text), now, now),
+            )
+        self.evict()
+
+    def evict(self):
+        """
+        Drop expired entries, then least recently used ones until the cache fits its size limit.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age_s,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_size_bytes:
+                return
+            freed = 0
+            stale = []
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                if total - freed <= self.max_size_bytes:
+                    break
+                stale.append((key,))
+                freed += size
+            conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+        }
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+
+from etl.http import get_session
+from etl.tracing import count, span
+from llama.llm_cache import ResponseCache, cache_enabled, cache_key
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+MODEL = "llama3.1"
+# Counters and durations reported by Ollama that are recorded on every call's span
+TIMING_FIELDS = ["prompt_eval_count", "eval_count", "prompt_eval_duration", "eval_duration"]
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+    return _cache
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for budgeting (~4 characters per token for English text).
+    """
+    return len(text) // 4 + 1
+
+
+def generate(prompt: str, model: str = MODEL, options: dict = None, stream: bool = True, on_line=None,
+             keep_alive: str = None, use_cache: bool = None, timeout: float = 600) -> dict:
+    """
+    Call /api/generate over the shared pooled session.
+
+    With `stream`, the response is read chunk by chunk and `on_line` (if given) is called with
+    every completed line of generated text as soon as it arrives, so callers can parse while the
+    model is still generating. `keep_alive` (e.g. "30m") keeps the model, and its cached
+    prompt prefix, loaded between calls.
+
+    Identical (model, prompt, options) calls are answered from the persistent response cache
+    unless `use_cache` is False or LLM_CACHE=0.
+
+    Returns:
+        dict: {"response", "eval_count", "prompt_eval_count", "eval_duration", "prompt_eval_duration",
+               "first_token_s", "elapsed_s", "cached"}; durations from Ollama are in nanoseconds
+    Raises:
+        requests.HTTPError: On a non-200 answer
+    """
+    with span("ollama", target=model, stream=stream, prompt_chars=len(prompt)) as s:
+        result = _generate(prompt, model, options, stream, on_line, keep_alive, use_cache, timeout)
+        s.set(cached=result["cached"], first_token_s=result["first_token_s"],
+              **{field: result.get(field) for field in TIMING_FIELDS})
+        if result.get("eval_count") and result.get("eval_duration"):
+            s.set(tokens_per_s=round(result["eval_count"] / (result["eval_duration"] / 1e9), 2))
+    if not result["cached"]:
+        _count_tokens(model, result)
+    return result
+
+
+def _count_tokens(model: str, result: dict):
+    count("ollama_prompt_tokens_total", result.get("prompt_eval_count"), "Prompt tokens evaluated", model=model)
+    count("ollama_eval_tokens_total", result.get("eval_count"), "Tokens generated", model=model)
+    if result.get("prompt_eval_duration") is not None:
+        count("ollama_prompt_eval_seconds_total", result["prompt_eval_duration"] / 1e9,
+              "Seconds spent evaluating prompts", model=model)
+    if result.get("eval_duration") is not None:
+        count("ollama_eval_seconds_total", result["eval_duration"] / 1e9, "Seconds spent generating", model=model)
+
+
+def _generate(prompt, model, options, stream, on_line, keep_alive, use_cache, timeout) -> dict:
+    use_cache = cache_enabled() if use_cache is None else use_cache
+    started = time.perf_counter()
+    if use_cache:
+        key = cache_key(model, prompt, options)
+        result = get_cache().get(key)
+        if result is not None:
+            if on_line is not None:
+                for line in result["response"].split("\n"):
+                    on_line(line)
+            result["first_token_s"] = 0.0
+            result["elapsed_s"] = time.perf_counter() - started
+            result["cached"] = True
+            return result
+
+    payload = {"model": model, "prompt": prompt, "stream": stream}
+    if options:
+        payload["options"] = options
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+
+    # Generations are cached by llm_cache, not by the HTTP cassettes
+    response = get_session(cassettes=False).post(f"{OLLAMA_URL}/api/generate", json=payload, stream=stream, timeout=timeout)
+    response.raise_for_status()
+
+    if not stream:
+        result = response.json()
+        result["first_token_s"] = None
+    else:
+        parts, pending, result = [], "", {}
+        first_token_s = None
+        for raw_line in response.iter_lines():
+            if not raw_line:
+                continue
+            chunk = json.loads(raw_line)
+            piece = chunk.get("response", "")
+            if piece and first_token_s is None:
+                first_token_s = time.perf_counter() - started
+            parts.append(piece)
+            if on_line is not None:
+                pending += piece
+                *complete, pending = pending.split("\n")
+                for line in complete:
+                    on_line(line)
+            if chunk.get("done"):
+                result = chunk
+        if on_line is not None and pending:
+            on_line(pending)
+        result["response"] = "".join(parts)
+        result["first_token_s"] = first_token_s
+
+    result["elapsed_s"] = time.perf_counter() - started
+    result["cached"] = False
+    if use_cache and result.get("done"):
+        get_cache().put(key, model, {k: v for k, v in result.items() if k not in ("first_token_s", "elapsed_s", "cached")})
+    return result
+
+
+def cache_summary() -> str:
+    if _cache is None:
+        return "LLM cache: off"
+    stats = _cache.stats()
+    return (f"LLM cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['entries']} entries ({stats['size_bytes'] / 1e6:.1f} MB)")
@@ -0,0 +1,139 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Table encoding used by make_llama_prompt unless a run picks another one
+PROMPT_ENCODING = os.getenv("PROMPT_ENCODING", "markdown")
+
+# Column suffix (after the coin prefix) -> (short header, legend entry)
+ABBREVIATIONS = {
+    "open_price": ("open", "open price (USD)"),
+    "high_price": ("high", "high price (USD)"),
+    "low_price": ("low", "low price (USD)"),
+    "close_price": ("close", "close price (USD)"),
+    "volume": ("vol", "traded volume (coins)"),
+    "simple_moving_average_20": ("sma20", "20-day simple moving average"),
+    "simple_moving_average_50": ("sma50", "50-day simple moving average"),
+    "simple_moving_average_200": ("sma200", "200-day simple moving average"),
+    "rsi": ("rsi", "14-day RSI"),
+    "macd": ("macd", "MACD (EMA12 - EMA26)"),
+    "pct_change": ("chg%", "daily close change (%)"),
+    "fear_and_greed_index_value": ("fgi", "Fear & Greed Index (0-100)"),
+    "fear_and_greed_index_classification": ("fgi_label", "Fear & Greed label"),
+    "dollar_index": ("dxy", "US dollar index"),
+}
+PRICE_COLUMNS = ["open", "high", "low", "close"]
+SMA_COLUMNS = ["sma20", "sma50", "sma200"]
+
+
+def _abbreviate(window: pd.DataFrame, coin: str) -> pd.DataFrame:
+    """
+    Rename the feature columns to short headers and format dates as YYYY-MM-DD.
+    """
+    prefix = f"{coin.lower()}_"
+    renamed = {}
+    for col in window.columns:
+        suffix = col[len(prefix):] if col.startswith(prefix) else col
+        if suffix in ABBREVIATIONS:
+            renamed[col] = ABBREVIATIONS[suffix][0]
+    df = window.rename(columns=renamed)
+    df["date"] = pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d")
+    return df
+
+
+def _number(value: float, digits: int) -> str:
+    """
+    `value` rounded to `digits` significant digits, in fixed-point without trailing zeros:
+    exponents and long fractions cost extra tokens.
+    """
+    if pd.isna(value):
+        return ""
+    return np.format_float_positional(value, precision=digits, unique=True, fractional=False, trim="-")
+
+
+def _to_csv(df: pd.DataFrame, digits: int) -> str:
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype.kind == "f":
+            df[col] = df[col].map(lambda v: _number(v, digits))
+    return df.to_csv(index=False).strip()
+
+
+def _legend(columns) -> str:
+    entries = {short: text for short, text in ABBREVIATIONS.values()}
+    return "Columns: " + "; ".join(f"{col} = {entries[col]}" for col in columns if col in entries)
+
+
+def encode_markdown(window: pd.DataFrame, coin: str) -> str:
+    """
+    The original encoding: a markdown table with the full column names.
+    """
+    return window.to_markdown(index=True)
+
+
+def encode_csv(window: pd.DataFrame, coin: str) -> str:
+    """
+    Same columns as markdown, as CSV without padding or the row index.
+    """
+    df = window.copy()
+    df["date"] = pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d")
+    return _to_csv(df, 6)
+
+
+def encode_abbreviated(window: pd.DataFrame, coin: str) -> str:
+    """
+    CSV with short headers, explained once in a legend line.
+    """
+    df = _abbreviate(window, coin)
+    return f"{_legend(df.columns)}\n{_to_csv(df, 6)}"
+
+
+def encode_delta(window: pd.DataFrame, coin: str) -> str:
+    """
+    Abbreviated CSV where prices after the first row are % changes from the previous close and the
+    moving averages are % distances from the close, so most cells are short, comparable numbers.
+    """
+    df = _abbreviate(window, coin)
+    close = df["close"].astype(float)
+    previous_close = close.shift(1)
+    for col in [c for c in PRICE_COLUMNS if c in df.columns]:
+        change = ((df[col] / previous_close - 1.0) * 100).round(2).map(lambda v: _number(v, 6))
+        change.iat[0] = _number(df[col].iat[0], 6)
+        df[col] = change
+    for col in [c for c in SMA_COLUMNS if c in df.columns]:
+        df[col] = ((close / df[col] - 1.0) * 100).round(2)
+    df = df.drop(columns=[c for c in ["chg%"] if c in df.columns])
+    legend = _legend(df.columns)
+    legend += (". First row prices are in USD; later open/high/low/close are % vs the previous close."
+               " sma columns are the close's % distance above (+) or below (-) that average.")
+    return f"{legend}\n{_to_csv(df, 6)}"
+
+
+def encode_pruned(window: pd.DataFrame, coin: str) -> str:
+    """
+    Abbreviated CSV without the columns the others can be derived from (open/high/low, the FGI label)
+    and with every number rounded to 4 significant digits.
+    """
+    df = _abbreviate(window, coin)
+    df = df.drop(columns=[c for c in ["open", "high", "low", "fgi_label"] if c in df.columns])
+    return f"{_legend(df.columns)}\n{_to_csv(df, 4)}"
+
+
+ENCODERS = {
+    "markdown": encode_markdown,
+    "csv": encode_csv,
+    "abbreviated": encode_abbreviated,
+    "delta": encode_delta,
+    "pruned": encode_pruned,
+}
+
+
+def encode_table(window: pd.DataFrame, coin: str, encoding: str = None) -> str:
+    """
+    Render a coin's feature window with one of ENCODERS (default: PROMPT_ENCODING).
+    """
+    encoding = encoding or PROMPT_ENCODING
+    if encoding not in ENCODERS:
+        raise ValueError(f"Unknown prompt encoding '{encoding}', expected one of {', '.join(ENCODERS)}")
+    return ENCODERS[encoding](window, coin)
@@ -0,0 +1,95 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from etl.feature_store import FeatureStore
+
+REGIME_FILE = "data/llama_regimes.json"
+# A carried recommendation is refreshed after this many days even if the regime holds
+MAX_CARRY_DAYS = int(os.getenv("PREDICTION_MAX_CARRY_DAYS", 7))
+RSI_BANDS = (30, 50, 70)
+# Days read back from the newest row to find each coin's last complete one
+LOOKBACK_DAYS = 30
+_MA_NAMES = np.array(["close", "sma20", "sma50", "sma200"])
+
+
+def fingerprints(store: FeatureStore, shorts: list) -> pd.DataFrame:
+    """
+    Regime fingerprint of every coin on its newest day with technicals, FGI and macro data (the
+    last row of its prompt window), computed for all coins at once on the feature matrix.
+
+    The fingerprint combines the FGI class, the RSI band (RSI_BANDS), the ordering of close and
+    the 20/50/200-day SMAs, and the MACD sign, e.g. "Fear|rsi 1|close>sma20>sma50>sma200|macd -".
+
+    Returns:
+        DataFrame: Indexed by coin short name, with the row's `date` and its `fingerprint`
+    """
+    shorts = [short for short in shorts if short in store.meta["watermarks"]]
+    if not shorts or not store.meta["rows"]:
+        return pd.DataFrame(columns=["date", "fingerprint"])
+
+    features = ["close", "sma_20", "sma_50", "sma_200", "rsi", "macd"]
+    columns = [f"{short}_{feature}" for feature in features for short in shorts]
+    start = store.dates()[-1] - pd.Timedelta(days=LOOKBACK_DAYS)
+    frame = store.frame(columns + ["fgi_value", "fgi_classification", "market_closed"], start=start)
+    # (days, features, coins)
+    values = frame[columns].to_numpy().reshape(len(frame), len(features), len(shorts))
+
+    valid = ~np.isnan(values[:, 0]) & frame[["fgi_value", "market_closed"]].notna().all(axis=1).to_numpy()[:, None]
+    has_row = valid.any(axis=0)
+    last = len(frame) - 1 - np.argmax(valid[::-1], axis=0)
+    latest = values[last, :, np.arange(len(shorts))]  # (coins, features)
+
+    rsi_band = np.digitize(latest[:, 4], RSI_BANDS)
+    # NaN SMAs (young coins) sort last, so the ordering stays defined
+    order = np.argsort(-np.nan_to_num(latest[:, :4], nan=-np.inf), axis=1, kind="stable")
+    macd_sign = np.sign(np.nan_to_num(latest[:, 5]))
+    fgi_class = frame["fgi_classification"].to_numpy()[last]
+
+    result = pd.DataFrame({
+        "date": frame.index[last],
+        "fingerprint": [
+            f"{fgi}|rsi {band}|{'>'.join(_MA_NAMES[row])}|macd {'+' if sign > 0 else '-' if sign < 0 else '0'}"
+            for fgi, band, row, sign in zip(fgi_class, rsi_band, order, macd_sign)
+        ],
+    }, index=pd.Index(shorts, name="short"))
+    return result[has_row]
+
+
+def load_regimes(path: str = REGIME_FILE) -> dict:
+    """
+    {short: {"fingerprint", "date", "queried"}} as of each coin's last LLM recommendation.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_regimes(regimes: dict, path: str = REGIME_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(regimes, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def screen(current: pd.DataFrame, regimes: dict, today, max_age: int = MAX_CARRY_DAYS) -> tuple:
+    """
+    Split coins into those to ask the model about and those whose last recommendation still holds:
+    same fingerprint as when it was made, and made less than `max_age` days ago.
+
+    Returns:
+        tuple: (shorts to query, shorts to carry forward)
+    """
+    today = pd.Timestamp(today)
+    query, carry = [], []
+    for short, row in current.iterrows():
+        last = regimes.get(short)
+        if (last is not None and last["fingerprint"] == row["fingerprint"]
+                and (today - pd.Timestamp(last["queried"])).days < max_age):
+            carry.append(short)
+        else:
+            query.append(short)
+    return query, carry
@@ -0,0 +1,256 @@
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from etl import universe
+from etl.tracing import export_metrics, span
+
+STATE_FILE = "data/pipeline_state.json"
+
+
+def recommendation_files() -> list:
+    return [f"data/llama_recommendations_{short}.csv" for short in universe.coins().values()]
+
+
+class Stage:
+    """
+    One pipeline step: a "module:function" to call, and the data files it reads and writes.
+
+    A stage with no inputs pulls from the outside world and always runs. Any other stage is
+    skipped when its inputs hash the same as on its last successful run.
+
+    `inputs` and `outputs` may also be callables returning the paths, for files that depend on the
+    symbol universe; they are resolved on each access, so the universe is only loaded when a run
+    needs it.
+
+    A stage with an `opt_in` environment variable only runs when that variable is "1", or when it
+    is named explicitly (--only, cli.py).
+    """
+
+    def __init__(self, name: str, target: str, inputs=(), outputs=(), opt_in: str = None):
+        self.name = name
+        self.target = target
+        self._inputs = inputs
+        self._outputs = outputs
+        self.opt_in = opt_in
+
+    @staticmethod
+    def _paths(paths) -> list:
+        return list(paths() if callable(paths) else paths)
+
+    @property
+    def inputs(self) -> list:
+        return self._paths(self._inputs)
+
+    @property
+    def outputs(self) -> list:
+        return self._paths(self._outputs)
+
+    @property
+    def enabled(self) -> bool:
+        return self.opt_in is None or os.getenv(self.opt_in) == "1"
+
+    def run(self):
+        module, function = self.target.split(":")
+        return getattr(importlib.import_module(module), function)()
+
+
+STAGES = [
+    Stage("fetch_binance", "etl.fetch_binance:main", outputs=universe.technical_files),
+    # Full hourly history of the whole universe that no daily stage reads, so only on request
+    Stage("fetch_ohlcv", "etl.ohlcv_store:main", opt_in="PIPELINE_FETCH_OHLCV"),
+    Stage("fetch_fgi", "etl.fetch_fgi:main", outputs=["data/fgi.csv"]),
+    Stage("fetch_macro", "etl.fetch_macro:main", outputs=["data/macro.csv"]),
+    Stage("news", "etl.news:main", outputs=["data/raw_news.csv"]),
+    Stage("llama_prediction", "llama.llama_prediction:main",
+          inputs=lambda: universe.technical_files() + ["data/fgi.csv", "data/macro.csv"],
+          outputs=recommendation_files),
+    # The journal is an input too: a run that left leased or failed batches behind changes it,
+    # so the leftovers are retried next time even without new articles.
+    Stage("llama_news", "llama.llama_news:process_batches",
+          inputs=["data/raw_news.csv", "data/news_queue.jsonl"], outputs=["data/news_scored.csv"]),
+    Stage("dashboard_export", "analysis.dashboard_export:main",
+          inputs=lambda: universe.technical_files() + ["data/fgi.csv", "data/macro.csv"]
+                         + recommendation_files() + ["data/news_scored.csv"],
+          outputs=["data/powerbi/_state.json"]),
+]
+
+
+def dependencies(stages: list) -> dict:
+    """
+    Map each stage name to the stages producing one of its inputs.
+    """
+    producers = {path: stage.name for stage in stages for path in stage.outputs}
+    return {stage.name: {producers[path] for path in stage.inputs if path in producers} - {stage.name}
+            for stage in stages}
+
+
+def select(stages: list, only=None, start=None) -> list:
+    """
+    Stages to run: the ones named in `only`, or `start` and everything downstream of it (default:
+    all). Opt-in stages that are not enabled only run when named in `only`.
+    """
+    names = [stage.name for stage in stages]
+    for name in (only or []) + ([start] if start else []):
+        if name not in names:
+            raise ValueError(f"Unknown stage '{name}', expected one of {', '.join(names)}")
+    if only:
+        return [stage for stage in stages if stage.name in only]
+    stages = [stage for stage in stages if stage.enabled or stage.name == start]
+    if not start:
+        return list(stages)
+
+    deps = dependencies(stages)
+    wanted = {start}
+    for stage in stages:
+        # STAGES is in topological order, so one pass reaches every descendant.
+        if deps[stage.name] & wanted:
+            wanted.add(stage.name)
+    return [stage for stage in stages if stage.name in wanted]
+
+
+class Pipeline:
+    """
+    Runs stages concurrently as soon as the stages they depend on have finished, skipping stages
+    whose inputs did not change since their last successful run.
+    """
+
+    def __init__(self, stages=STAGES, state_path: str = STATE_FILE, max_workers: int = 4):
+        self.stages = list(stages)
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict:
+        if not os.path.exists(self.state_path):
+            return {"stages": {}, "files": {}}
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def file_hash(self, path: str) -> str:
+        """
+        SHA-256 of a file, reused from the last run while its size and mtime are unchanged.
+        """
+        if not os.path.exists(path):
+            return "missing"
+        stat = os.stat(path)
+        cached = self.state["files"].get(path)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.state["files"][path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+        return digest.hexdigest()
+
+    def inputs_hash(self, stage: Stage) -> str:
+        digest = hashlib.sha256()
+        for path in stage.inputs:
+            digest.update(f"{path}={self.file_hash(path)}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def is_fresh(self, stage: Stage, inputs_hash: str) -> bool:
+        if not stage.inputs:
+            return False
+        last = self.state["stages"].get(stage.name, {})
+        return last.get("inputs_hash") == inputs_hash and all(os.path.exists(path) for path in stage.outputs)
+
+    def run(self, only=None, start=None, force: bool = False) -> dict:
+        """
+        Run the selected stages.
+
+        Parameters:
+            only (list): Run just these stages
+            start (str): Run this stage and everything downstream of it
+            force (bool): Run even the stages whose inputs are unchanged
+
+        Returns:
+            dict: Stage name -> "ran", "skipped", "failed" or "blocked" (an upstream stage failed)
+        """
+        selected = select(self.stages, only, start)
+        selected_names = {stage.name for stage in selected}
+        # Dependencies outside the selection count as already satisfied.
+        deps = {name: upstream & selected_names for name, upstream in dependencies(self.stages).items()}
+        status = {}
+        waiting = list(selected)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {}
+            while waiting or running:
+                for stage in list(waiting):
+                    upstream = deps[stage.name]
+                    if any(status.get(name) in ("failed", "blocked") for name in upstream):
+                        status[stage.name] = "blocked"
+                        print(f"⏭️ {stage.name}: blocked by a failed upstream stage")
+                        waiting.remove(stage)
+                    elif all(name in status for name in upstream):
+                        waiting.remove(stage)
+                        # Hashed only once upstream is done, so upstream writes are included.
+                        inputs_hash = self.inputs_hash(stage)
+                        if not force and self.is_fresh(stage, inputs_hash):
+                            status[stage.name] = "skipped"
+                            print(f"⏭️ {stage.name}: inputs unchanged, skipped")
+                            continue
+                        print(f"▶️ {stage.name}")
+                        running[executor.submit(self._timed, stage)] = (stage, inputs_hash)
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, inputs_hash = running.pop(future)
+                    try:
+                        elapsed = future.result()
+                    except Exception as e:
+                        status[stage.name] = "failed"
+                        print(f"❌ {stage.name} failed: {e}")
+                        continue
+                    status[stage.name] = "ran"
+                    self.state["stages"][stage.name] = {
+                        "inputs_hash": inputs_hash,
+                        "finished": datetime.now().isoformat(timespec="seconds"),
+                        "seconds": round(elapsed, 2),
+                    }
+                    self._save_state()
+                    print(f"✅ {stage.name} finished in {elapsed:.1f}s")
+        return status
+
+    @staticmethod
+    def _timed(stage: Stage) -> float:
+        started = time.perf_counter()
+        with span("stage", target=stage.name):
+            stage.run()
+        return time.perf_counter() - started
+
+
+def main(argv=None) -> int:
+    names = [stage.name for stage in STAGES]
+    parser = argparse.ArgumentParser(description="Run the DipSignal pipeline.")
+    parser.add_argument("--only", nargs="+", choices=names, help="Run only these stages")
+    parser.add_argument("--from", dest="start", choices=names, help="Run this stage and everything downstream of it")
+    parser.add_argument("--force", action="store_true", help="Run stages even when their inputs are unchanged")
+    parser.add_argument("--workers", type=int, default=4, help="Stages run at the same time")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    status = Pipeline(max_workers=args.workers).run(args.only, args.start, args.force)
+    export_metrics()
+    print(f"Pipeline finished in {time.perf_counter() - started:.1f}s: "
+          + ", ".join(f"{name} {result}" for name, result in status.items()))
+    return 1 if any(result in ("failed", "blocked") for result in status.values()) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())